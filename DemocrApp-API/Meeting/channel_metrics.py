@@ -0,0 +1,167 @@
+"""
+Visibility into the channel layers: group sizes, queue depth, ChannelFull drops and
+group_send latency.
+
+To record counters, configure a layer with InstrumentedChannelLayer as its backend and
+give it the real backend and its config:
+
+    "default": {
+        "BACKEND": "Meeting.channel_metrics.InstrumentedChannelLayer",
+        "CONFIG": {
+            "backend": "channels_redis.core.RedisChannelLayer",
+            "config": {"hosts": [("redis", 6379)]},
+        },
+    }
+
+Counters are kept per process, so the metrics endpoint (served by the web workers)
+shows the sends made by views and the consumers' sends show up only in the websocket
+process. Group sizes and queue depths are read from the layer itself and so cover
+every process sharing it.
+"""
+import logging
+import re
+from contextvars import ContextVar
+from time import perf_counter
+
+from channels.exceptions import ChannelFull
+from channels.layers import InMemoryChannelLayer
+from django.utils.module_loading import import_string
+
+# One group per voter session; these are folded into a single entry to keep the output bounded
+SESSION_GROUP = re.compile(r'^session_[0-9a-f-]+$')
+# channels_redis reports the channels a group_send skipped for being full only through this log record
+REDIS_OVER_CAPACITY = "%s of %s channels over capacity in group %s"
+
+_sending = ContextVar('_sending', default=None)
+
+
+def metric_name(group):
+    return "session_*" if SESSION_GROUP.match(group) else group
+
+
+class GroupSendStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.drops = 0
+
+    def record(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0,
+            "max_ms": round(self.max * 1000, 3),
+            "drops": self.drops,
+        }
+
+
+class _RedisOverCapacityFilter(logging.Filter):
+    """
+    Counts channels_redis over-capacity records against the group_send that raised them.
+    The logger is lowered to INFO to see them, so records below the level it had before
+    are dropped again here once counted.
+    """
+    def __init__(self, level):
+        super().__init__()
+        self.level = level
+
+    def filter(self, record):
+        stats = _sending.get()
+        if stats is not None and record.msg == REDIS_OVER_CAPACITY:
+            stats.drops += record.args[0]
+        return record.levelno >= self.level
+
+
+def _watch_redis_drops():
+    logger = logging.getLogger('channels_redis.core')
+    if not any(isinstance(f, _RedisOverCapacityFilter) for f in logger.filters):
+        logger.addFilter(_RedisOverCapacityFilter(logger.getEffectiveLevel()))
+        logger.setLevel(min(logger.getEffectiveLevel(), logging.INFO))
+
+
+class InstrumentedChannelLayer:
+    """
+    Wraps another channel layer, passing everything through while counting sends,
+    ChannelFull drops and group_send timings.
+    """
+    def __init__(self, backend, config=None):
+        self.layer = import_string(backend)(**(config or {}))
+        self.sends = 0
+        self.send_drops = 0
+        self.group_sends = {}
+        if not isinstance(self.layer, InMemoryChannelLayer):
+            _watch_redis_drops()
+
+    def __getattr__(self, name):
+        return getattr(self.layer, name)
+
+    async def send(self, channel, message):
+        self.sends += 1
+        try:
+            await self.layer.send(channel, message)
+        except ChannelFull:
+            self.send_drops += 1
+            raise
+
+    async def group_send(self, group, message):
+        stats = self.group_sends.setdefault(metric_name(group), GroupSendStats())
+        if isinstance(self.layer, InMemoryChannelLayer):
+            # The in-memory layer skips full channels silently, so look before sending
+            stats.drops += sum(1 for channel in self.layer.groups.get(group, {})
+                               if channel in self.layer.channels and self.layer.channels[channel].full())
+        token = _sending.set(stats)
+        start = perf_counter()
+        try:
+            await self.layer.group_send(group, message)
+        finally:
+            stats.record(perf_counter() - start)
+            _sending.reset(token)
+
+    def counters(self):
+        return {
+            "sends": self.sends,
+            "send_drops": self.send_drops,
+            "group_sends": {group: stats.as_dict() for group, stats in sorted(self.group_sends.items())},
+        }
+
+
+async def layer_snapshot(layer):
+    """
+    Live group sizes and queue depths of a channel layer, plus this process's counters
+    if it is instrumented. Only the in-memory and Redis layers can be inspected.
+    """
+    inner = layer.layer if isinstance(layer, InstrumentedChannelLayer) else layer
+    groups = {}
+    queues = {}
+    if isinstance(inner, InMemoryChannelLayer):
+        for group, members in inner.groups.items():
+            groups[metric_name(group)] = groups.get(metric_name(group), 0) + len(members)
+        for channel, queue in inner.channels.items():
+            queues[channel] = queue.qsize()
+    elif hasattr(inner, 'prefix') and hasattr(inner, 'ring_size'):
+        group_prefix = "{}:group:".format(inner.prefix)
+        for index in range(inner.ring_size):
+            connection = inner.connection(index)
+            async for key in connection.scan_iter(match=group_prefix + "*"):
+                group = key.decode()[len(group_prefix):]
+                groups[metric_name(group)] = groups.get(metric_name(group), 0) + await connection.zcard(key)
+            # Specific channels share one key per receiving process
+            async for key in connection.scan_iter(match=inner.prefix + "specific.*"):
+                if not key.endswith(b"$inflight"):
+                    queues[key.decode()[len(inner.prefix):]] = await connection.zcard(key)
+    else:
+        return {"inspectable": False}
+
+    snapshot = {
+        "capacity": inner.capacity,
+        "groups": dict(sorted(groups.items())),
+        "queues": dict(sorted(queues.items(), key=lambda item: -item[1])),
+    }
+    if isinstance(layer, InstrumentedChannelLayer):
+        snapshot.update(layer.counters())
+    return snapshot
@@ -0,0 +1,123 @@
+"""
+The worker pool vote counts run on.
+
+Counts are queued here rather than run in the request or on a thread of their own, so
+closing a meeting with many open votes returns straight away and at most
+VOTE_COUNT_WORKERS counts run at once. Each count reports its progress ("queued",
+"counting", STV rounds) to the meeting's manage pages as vote.progress events.
+
+A vote has at most one count queued or running: submitting it again while that count
+is pending returns the pending job rather than starting another. Counts queued here are
+lost if the process is restarted; Vote.requeue_count() and the requeue_counts command
+queue them again.
+
+results_cache keeps the results of finished STV counts in the database, keyed by the
+fingerprint of their ballots, so an identical count is never run twice.
+"""
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from openstv.resultcache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = Lock()
+_jobs = {}
+_jobs_lock = Lock()
+
+
+class DatabaseStore:
+    """An openstv result cache store keeping {"record", "results_data"} in CountCache."""
+
+    def get(self, key):
+        from Meeting.models import CountCache
+        return CountCache.objects.filter(fingerprint=key).values('record', 'results_data').first()
+
+    def set(self, key, value):
+        from Meeting.models import CountCache
+        CountCache.objects.update_or_create(fingerprint=key, defaults=value)
+
+    def delete(self, key):
+        from Meeting.models import CountCache
+        CountCache.objects.filter(fingerprint=key).delete()
+
+    def clear(self):
+        from Meeting.models import CountCache
+        CountCache.objects.all().delete()
+
+
+results_cache = ResultCache(DatabaseStore())
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.VOTE_COUNT_WORKERS, thread_name_prefix='vote-count')
+        return _executor
+
+
+def report_progress(meeting_id, vote_id, status):
+    """
+    Show a status for a vote's count on its meeting's manage pages. Best effort, as
+    Meeting.notify_managers() is, so a count never fails for want of a progress update.
+    """
+    from Meeting.models import Meeting
+    Meeting(pk=meeting_id).notify_managers({"type": "vote.progress",
+                                            "vote_id": vote_id,
+                                            "status": status})
+
+
+def submit(meeting_id, vote_id, count, *args, **kwargs):
+    """
+    Queue count(*args, **kwargs), the count of a frozen vote, and return its Future, or
+    the Future of the vote's pending count if it has one. With VOTE_COUNT_WORKERS = 0
+    the count runs before this returns.
+    """
+    if not settings.VOTE_COUNT_WORKERS:
+        report_progress(meeting_id, vote_id, "Queued for counting")
+        future = Future()
+        future.set_result(_run(meeting_id, vote_id, count, args, kwargs))
+        return future
+    with _jobs_lock:
+        future = _jobs.get(vote_id)
+        if future is not None:
+            return future
+        report_progress(meeting_id, vote_id, "Queued for counting")
+        future = _jobs[vote_id] = _pool().submit(_work, meeting_id, vote_id, count, args, kwargs)
+    future.add_done_callback(lambda done: _forget(vote_id, done))
+    return future
+
+
+def job(vote_id):
+    """The Future of the vote's queued or running count, or None."""
+    with _jobs_lock:
+        return _jobs.get(vote_id)
+
+
+def _forget(vote_id, future):
+    with _jobs_lock:
+        if _jobs.get(vote_id) is future:
+            del _jobs[vote_id]
+
+
+def _run(meeting_id, vote_id, count, args, kwargs):
+    report_progress(meeting_id, vote_id, "Counting")
+    return count(*args, **kwargs)
+
+
+def _work(*job):
+    # Pool threads outlive requests, so look after their own database connections
+    close_old_connections()
+    try:
+        return _run(*job)
+    except Exception:
+        logger.exception("Counting vote %s failed", job[1])
+        raise
+    finally:
+        close_old_connections()
@@ -0,0 +1,58 @@
+"""
+Sends the reads of report and export views to a read replica, keeping the primary free
+for ballot writes during live meetings.
+
+Views opt in with @reads_from_replica. Inside them, reads of this app's models go to
+the REPORT_DATABASE alias; everything else (auth, sessions and all writes) stays on the
+primary. Because the replica lags, a request made within REPLICA_CONSISTENCY_WINDOW
+seconds of any vote or meeting closing reads from the primary instead, so results are
+never shown half-replicated.
+"""
+from contextvars import ContextVar
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+_read_database = ContextVar('_read_database', default=None)
+
+
+def report_database():
+    """The alias report reads should use right now."""
+    alias = settings.REPORT_DATABASE
+    if alias == DEFAULT_DB_ALIAS:
+        return alias
+    from Meeting.models import Meeting, Vote
+    since = timezone.now() - timedelta(seconds=settings.REPLICA_CONSISTENCY_WINDOW)
+    if Vote.objects.using(DEFAULT_DB_ALIAS).filter(closed_at__gte=since).exists() \
+            or Meeting.objects.using(DEFAULT_DB_ALIAS).filter(close_time__gte=since).exists():
+        return DEFAULT_DB_ALIAS
+    return alias
+
+
+def reads_from_replica(view):
+    """Serve a read-only view's queries from the report database."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _read_database.set(report_database())
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_database.reset(token)
+    return wrapper
+
+
+class ReportRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'Meeting':
+            return _read_database.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
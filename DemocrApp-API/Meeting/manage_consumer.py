@@ -0,0 +1,80 @@
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import JsonWebsocketConsumer
+from django.urls import reverse
+
+from .models import Meeting, Vote
+from .templatetags.vote_helpers import vote_action_button
+
+
+class ManageConsumer(JsonWebsocketConsumer):
+    """
+    Live feed for a meeting's manage page. Only chairs (users who can manage
+    meetings, via the Django session) may connect.
+    """
+    meeting = None
+
+    def websocket_connect(self, message):
+        user = self.scope.get('user')
+        meeting_id = self.scope['url_route']['kwargs']['meeting_id']
+        self.meeting = Meeting.objects.filter(pk=meeting_id).first()
+        if user is None or not user.has_perm('Meeting.add_meeting') or self.meeting is None:
+            self.close()
+            return
+        self.accept()
+        async_to_sync(self.channel_layer.group_add)(self.meeting.manage_group_name(), self.channel_name)
+        self.voters_connected(None)
+
+    def websocket_disconnect(self, message):
+        if self.meeting is not None:
+            async_to_sync(self.channel_layer.group_discard)(self.meeting.manage_group_name(), self.channel_name)
+        super().websocket_disconnect(message)
+
+    def receive_json(self, content, **kwargs):
+        self.send_json({"type": "Bad Message"})
+
+    def vote_state(self, event):
+        vote = Vote.objects.filter(pk=event['vote_id']).first()
+        if vote is None:
+            return
+        self.send_json({
+            "type": "vote_state",
+            "vote_id": vote.pk,
+            "state": vote.state,
+            "state_display": vote.get_state_display(),
+            "action": vote_action_button(vote, self.meeting.pk),
+        })
+
+    def vote_progress(self, event):
+        self.send_json({
+            "type": "vote_progress",
+            "vote_id": event['vote_id'],
+            "status": event['status'],
+        })
+
+    def vote_provisional(self, event):
+        self.send_json({
+            "type": "provisional_results",
+            "vote_id": event['vote_id'],
+            "results": event['results'],
+        })
+
+    def vote_turnout(self, event):
+        self.send_json({
+            "type": "turnout",
+            "vote_id": event['vote_id'],
+            "delta": event['delta'],
+        })
+
+    def voters_connected(self, event):
+        self.send_json({
+            "type": "connected_voters",
+            "count": self.meeting.connected_voters(),
+        })
+
+    def tie_break(self, event):
+        self.send_json({
+            "type": "tie_break",
+            "vote_id": event['vote_id'],
+            "options": event['options'],
+            "url": reverse('meeting/break_tie', args=[self.meeting.pk, event['vote_id']]),
+        })
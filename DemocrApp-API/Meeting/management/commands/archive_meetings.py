@@ -0,0 +1,50 @@
+"""
+Management command to archive meetings that closed a while ago.
+
+Each meeting closed for longer than MEETING_ARCHIVE_AGE_DAYS (or --older-than) is
+written to a compressed MeetingArchive snapshot, then its ballots, voter tokens, auth
+tokens and sessions are deleted. Reports keep working from the snapshot.
+
+Usage:
+    python manage.py archive_meetings
+    python manage.py archive_meetings --older-than 90 --dry-run
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from Meeting.models import Meeting, MeetingArchive
+
+
+class Command(BaseCommand):
+    help = 'Snapshot long-closed meetings and delete their ballots, tokens and sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=None,
+                            help='Archive meetings closed more than this many days ago '
+                                 '(default: MEETING_ARCHIVE_AGE_DAYS)')
+        parser.add_argument('--dry-run', action='store_true', help='List the meetings without archiving them')
+
+    def handle(self, *args, **options):
+        days = options['older_than']
+        if days is None:
+            days = settings.MEETING_ARCHIVE_AGE_DAYS
+        cutoff = timezone.now() - timedelta(days=days)
+        meetings = Meeting.objects.filter(close_time__lt=cutoff, archive__isnull=True).order_by('close_time')
+
+        archived = 0
+        for meeting in meetings:
+            if options['dry_run']:
+                self.stdout.write(f"Would archive {meeting.pk}: {meeting}")
+                continue
+            try:
+                archive = MeetingArchive.archive(meeting)
+            except ValueError as e:
+                self.stderr.write(f"Skipped {meeting.pk}: {e}")
+                continue
+            archived += 1
+            self.stdout.write(f"Archived {meeting.pk}: {meeting} ({len(archive.data)} bytes)")
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Archived {archived} meeting(s)"))
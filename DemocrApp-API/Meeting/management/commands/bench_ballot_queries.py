@@ -0,0 +1,98 @@
+"""
+Management command to compare the hot ballot queries filtered through Option against
+the same queries on BallotEntry.vote.
+
+Fills a throwaway meeting with yes/no/abstain ballot entries and an STV vote's
+rankings, prints the query plan and median run time of each query in both forms and
+of the STV count's ranking extraction, then deletes the meeting.
+
+Usage:
+    python manage.py bench_ballot_queries
+    python manage.py bench_ballot_queries --entries 100000 --repeat 20 --no-explain
+"""
+from statistics import median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from Meeting.models import Meeting, AuthToken, VoterToken, Vote, Option, BallotEntry, RankedBallot
+
+
+class Command(BaseCommand):
+    help = 'Time and EXPLAIN the hot BallotEntry queries, joined through Option and using BallotEntry.vote'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=100000, help='Approximate number of ballot entries')
+        parser.add_argument('--votes', type=int, default=20,
+                            help='Number of yes/no/abstain votes to spread them over')
+        parser.add_argument('--options', type=int, default=5,
+                            help='Candidates in the STV vote, all ranked by every voter')
+        parser.add_argument('--repeat', type=int, default=10, help='Runs of each query to take the median of')
+        parser.add_argument('--no-explain', action='store_true', help='Skip printing query plans')
+
+    def handle(self, *args, **options):
+        meeting = Meeting.objects.create(name="bench_ballot_queries")
+        try:
+            vote, stv_vote, tokens = self.populate(meeting, options)
+            self.stdout.write(f"{BallotEntry.objects.filter(vote__token_set__meeting=meeting).count()} entries "
+                              f"over {options['votes']} votes, {len(tokens)} rankings in one STV vote")
+            self.compare(vote, tokens, options)
+            self.extraction(stv_vote, options)
+        finally:
+            meeting.delete()
+
+    def populate(self, meeting, options):
+        token_set = meeting.tokenset_set.latest()
+        # One entry per voter in each vote
+        voters = max(1, options['entries'] // options['votes'])
+        auth_tokens = AuthToken.objects.bulk_create(AuthToken(token_set=token_set) for _ in range(voters))
+        tokens = VoterToken.objects.bulk_create(VoterToken(auth_token=auth_token) for auth_token in auth_tokens)
+        for v in range(options['votes']):
+            vote = Vote.objects.create(token_set=token_set, name=f"vote {v}", method=Vote.YES_NO_ABS,
+                                       state=Vote.LIVE)
+            choices = list(vote.option_set.order_by('pk'))
+            BallotEntry.objects.bulk_create(
+                (BallotEntry(vote=vote, option=choices[t % len(choices)], token=token, value=1)
+                 for t, token in enumerate(tokens)),
+                batch_size=5000)
+        stv_vote = Vote.objects.create(token_set=token_set, name="stv vote", method=Vote.STV, state=Vote.LIVE)
+        candidates = [option.pk for option in Option.objects.bulk_create(
+            Option(vote=stv_vote, name=f"candidate {o}") for o in range(options['options']))]
+        RankedBallot.objects.bulk_create(
+            (RankedBallot(vote=stv_vote, token=token,
+                          preferences=candidates[t % len(candidates):] + candidates[:t % len(candidates)])
+             for t, token in enumerate(tokens)),
+            batch_size=5000)
+        return vote, stv_vote, tokens
+
+    def compare(self, vote, tokens, options):
+        some_voters = [token.pk for token in tokens[:2]]
+        queries = {
+            "responses": lambda **f: BallotEntry.objects.filter(**f).values('token').distinct(),
+            "count extraction": lambda **f: BallotEntry.objects.filter(value=1, **f).order_by('token_id', 'value')
+                                                       .values_list('option_id', flat=True),
+            "replace ballot": lambda **f: BallotEntry.objects.filter(token_id=some_voters[0], **f),
+            "existing_ballots": lambda **f: BallotEntry.objects.filter(token_id__in=some_voters, **f)
+                                                       .values_list('token_id', flat=True).distinct(),
+        }
+        for name, query in queries.items():
+            self.stdout.write(f"\n== {name}")
+            for label, filters in (("via option", {"option__vote": vote}), ("via vote", {"vote": vote})):
+                self.time(label, query(**filters), options)
+
+    def extraction(self, vote, options):
+        # As STV.extract_ballots fetches them
+        self.stdout.write("\n== STV ranking extraction")
+        self.time("via vote", RankedBallot.objects.filter(vote=vote).order_by('token_id')
+                  .values_list('preferences', flat=True), options)
+
+    def time(self, label, queryset, options):
+        timings = []
+        for _ in range(options['repeat']):
+            start = perf_counter()
+            list(queryset.all())
+            timings.append(perf_counter() - start)
+        self.stdout.write(f"{label:>11}: {median(timings) * 1000:8.2f} ms")
+        if not options['no_explain']:
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f"             {line}")
@@ -0,0 +1,101 @@
+"""
+Management command to measure the memory cost of idle voter websocket connections.
+
+Opens N authenticated UIConsumer connections in-process against a throwaway
+meeting and reports the resident set size and Python heap growth per connection.
+
+Usage:
+    python manage.py bench_connections
+    python manage.py bench_connections --connections 2000 --in-memory-layer
+"""
+import asyncio
+import gc
+import resource
+import tracemalloc
+
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from Meeting.models import Meeting, AuthToken, Session
+
+
+def resident_set_size():
+    """Current RSS of this process in bytes (Linux only)."""
+    with open('/proc/self/statm') as statm:
+        pages = int(statm.read().split()[1])
+    return pages * resource.getpagesize()
+
+
+class Command(BaseCommand):
+    help = 'Measure resident memory per idle authenticated voter connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=500, help='Number of connections to open')
+        parser.add_argument('--proxy-fraction', type=float, default=0.2, help='Fraction of voters holding a proxy')
+        parser.add_argument('--in-memory-layer', action='store_true',
+                            help='Use an in-memory channel layer instead of the configured one')
+
+    def handle(self, *args, **options):
+        # The DEBUG query log grows with every query and would swamp the measurement
+        settings.DEBUG = False
+        if options['in_memory_layer']:
+            settings.CHANNEL_LAYERS = {
+                "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+                "control": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+            }
+
+        n = options['connections']
+        meeting = Meeting.objects.create(name="bench_connections")
+        try:
+            token_set = meeting.tokenset_set.latest()
+            proxies = int(n * options['proxy_fraction'])
+            sessions = []
+            for i in range(n):
+                auth_token = AuthToken.objects.create(token_set=token_set, has_proxy=i < proxies)
+                sessions.append(str(Session.objects.create(auth_token=auth_token).pk))
+            self.stdout.write(f"Opening {n} connections ({proxies} with proxies)...")
+            asyncio.run(self.measure(sessions))
+        finally:
+            meeting.delete()
+
+    async def measure(self, sessions):
+        from Meeting.ui_consumer import UIConsumer
+
+        # Warm up imports, thread pools and the channel layer before measuring
+        warm_up = WebsocketCommunicator(UIConsumer.as_asgi(), "/cast")
+        await warm_up.connect()
+        await warm_up.disconnect()
+
+        gc.collect()
+        tracemalloc.start()
+        rss_before = resident_set_size()
+        heap_before = tracemalloc.get_traced_memory()[0]
+
+        communicators = []
+        for session in sessions:
+            communicator = WebsocketCommunicator(UIConsumer.as_asgi(), "/cast")
+            await communicator.connect()
+            await communicator.send_json_to({"type": "auth_request", "session_token": session})
+            response = await communicator.receive_json_from(timeout=10)
+            if response.get('result') != 'success':
+                raise RuntimeError(f"Authentication failed: {response}")
+            communicators.append(communicator)
+
+        gc.collect()
+        rss_after = resident_set_size()
+        heap_after = tracemalloc.get_traced_memory()[0]
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        n = len(communicators)
+        self.stdout.write(f"RSS growth:       {(rss_after - rss_before) / 1024:.0f} KiB "
+                          f"({(rss_after - rss_before) / n / 1024:.1f} KiB per connection)")
+        self.stdout.write(f"Python heap:      {(heap_after - heap_before) / 1024:.0f} KiB "
+                          f"({(heap_after - heap_before) / n / 1024:.1f} KiB per connection)")
+        self.stdout.write("Largest allocation sites:")
+        for stat in snapshot.statistics('lineno')[:10]:
+            self.stdout.write(f"  {stat}")
+
+        for communicator in communicators:
+            await communicator.disconnect()
@@ -0,0 +1,125 @@
+"""
+Management command to break down how long an STV vote takes to count once closed.
+
+Fills a throwaway meeting with one synthetic STV vote, then times the three phases of
+its count separately: extracting the ballots from the database, running the election
+and storing its record and results. Extraction is also timed the slow way, a model
+instance and an appendBallot call per ballot, for comparison, as is rendering the HTML
+report, which happens when results are first shown rather than at close. The meeting
+is deleted afterwards.
+
+Strong ties are broken at random rather than put to a manager.
+
+--profile also times the count with openstv's per-phase profiling on, and breaks
+that count down by phase (see openstv.profiling).
+
+Usage:
+    python manage.py bench_stv_count
+    python manage.py bench_stv_count --voters 20000 --candidates 10 --seats 3 --repeat 3
+    python manage.py bench_stv_count --profile
+"""
+import random
+from statistics import median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from openstv.ballots import Ballots
+
+from Meeting.models import Meeting, Vote, RankedBallot
+from Meeting.synthetic import create_tokens, create_vote, cast_ballots
+from Meeting.voting_methods.stv import STV
+
+
+class Command(BaseCommand):
+    help = 'Time the extraction, counting and reporting phases of an STV count'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voters', type=int, default=10000, help='Number of ballots')
+        parser.add_argument('--candidates', type=int, default=8, help='Candidates, besides None of the above')
+        parser.add_argument('--seats', type=int, default=2, help='Seats to fill')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of each phase to take the median of')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed, for repeatable ballots')
+        parser.add_argument('--profile', action='store_true', help='Break the count down by phase')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        meeting = Meeting.objects.create(name="bench_stv_count")
+        try:
+            token_set = meeting.tokenset_set.latest()
+            vote = create_vote(token_set, Vote.STV, state=Vote.COUNTING, candidates=options['candidates'],
+                               num_seats=options['seats'])
+            cast_ballots(vote, create_tokens(token_set, options['voters']))
+            self.stdout.write(f"{options['voters']} ballots, {options['candidates']} candidates, "
+                              f"{options['seats']} seat(s)")
+            self.time_phases(Vote.objects.select_related('token_set').get(pk=vote.pk), options)
+        finally:
+            meeting.delete()
+
+    def time_phases(self, vote, options):
+        seats = options['seats']
+        timings = {"extraction": [], "extraction, one ballot at a time": [], "counting": [], "reporting": [],
+                   "rendering, on first view": []}
+        side_phases = ("extraction, one ballot at a time", "rendering, on first view", "counting, profiled")
+        if options['profile']:
+            timings["counting, profiled"] = []
+        for _ in range(options['repeat']):
+            start = perf_counter()
+            ballots = STV.extract_ballots(vote, seats)
+            timings["extraction"].append(perf_counter() - start)
+
+            start = perf_counter()
+            self.extract_one_at_a_time(vote, seats)
+            timings["extraction, one ballot at a time"].append(perf_counter() - start)
+
+            start = perf_counter()
+            election = STV.run_election(vote, ballots, tie_break="random")
+            timings["counting"].append(perf_counter() - start)
+
+            if options['profile']:
+                start = perf_counter()
+                profile = STV.run_election(vote, ballots, tie_break="random", profile=True).profile.data()
+                timings["counting, profiled"].append(perf_counter() - start)
+
+            start = perf_counter()
+            results = STV.report(election, seats)
+            STV.store_results(vote, results)
+            timings["reporting"].append(perf_counter() - start)
+
+            start = perf_counter()
+            STV.render_report(results["record"])
+            timings["rendering, on first view"].append(perf_counter() - start)
+
+        self.stdout.write(f"{ballots.numWeightedBallots} distinct ballots, {election.numRounds} rounds")
+        width = max(len(phase) for phase in timings)
+        for phase, runs in timings.items():
+            self.stdout.write(f"{phase:<{width}}  {median(runs) * 1000:9.1f} ms")
+        total = sum(median(runs) for phase, runs in timings.items() if phase not in side_phases)
+        self.stdout.write(f"{'total':<{width}}  {total * 1000:9.1f} ms")
+        if options['profile']:
+            self.write_profile(profile)
+
+    def write_profile(self, profile):
+        phases = dict(profile["phases"])
+        for round_info in profile["rounds"]:
+            for phase, seconds in round_info["seconds"].items():
+                phases[phase] = phases.get(phase, 0) + seconds
+        self.stdout.write("Last profiled count, by phase (countBallots includes the phases after it):")
+        width = max(len(phase) for phase in phases)
+        for phase, seconds in phases.items():
+            self.stdout.write(f"  {phase:<{width}}  {seconds * 1000:9.2f} ms")
+        self.stdout.write(f"  ballots transferred: {sum(r['ballotsTouched'] for r in profile['rounds'])}, "
+                          f"most held at once: {profile['peakVotesHeld']}")
+
+    def extract_one_at_a_time(self, vote, seats):
+        ballots = Ballots()
+        option_translation = {}
+        names = []
+        for index, option in enumerate(vote.option_set.order_by('pk')):
+            option_translation[option.pk] = index
+            names.append(option.name)
+        ballots.setNames(names)
+        ballots.numSeats = seats
+        for ranked_ballot in RankedBallot.objects.filter(vote=vote).order_by('token_id'):
+            ballots.appendBallot([option_translation[option_id] for option_id in ranked_ballot.preferences])
+        return ballots
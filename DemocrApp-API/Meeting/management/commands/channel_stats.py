@@ -0,0 +1,55 @@
+"""
+Management command to watch the channel layers during a meeting.
+
+Prints group sizes and the deepest queues of every configured layer, refreshing
+until interrupted.
+
+Usage:
+    python manage.py channel_stats
+    python manage.py channel_stats --interval 1 --top 5
+    python manage.py channel_stats --once
+"""
+from time import sleep
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from Meeting.channel_metrics import layer_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Print live channel layer group sizes and queue depths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=2, help='Seconds between refreshes')
+        parser.add_argument('--top', type=int, default=10, help='Number of deepest queues to show')
+        parser.add_argument('--once', action='store_true', help='Print one snapshot and exit')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                for alias in settings.CHANNEL_LAYERS:
+                    self.print_snapshot(alias, async_to_sync(layer_snapshot)(get_channel_layer(alias)), options['top'])
+                if options['once']:
+                    return
+                sleep(options['interval'])
+                self.stdout.write("")
+        except KeyboardInterrupt:
+            pass
+
+    def print_snapshot(self, alias, snapshot, top):
+        if not snapshot.get('inspectable', True):
+            self.stdout.write(f"[{alias}] layer cannot be inspected")
+            return
+        self.stdout.write(f"[{alias}] capacity {snapshot['capacity']} per channel")
+        for group, size in snapshot['groups'].items():
+            self.stdout.write(f"  group {group}: {size} channels")
+        for channel, depth in list(snapshot['queues'].items())[:top]:
+            self.stdout.write(f"  queue {channel}: {depth} waiting")
+        if 'group_sends' in snapshot:
+            self.stdout.write(f"  sends: {snapshot['sends']} ({snapshot['send_drops']} dropped)")
+            for group, stats in snapshot['group_sends'].items():
+                self.stdout.write(f"  group_send {group}: {stats['count']} sent, mean {stats['mean_ms']}ms, "
+                                  f"max {stats['max_ms']}ms, {stats['drops']} dropped")
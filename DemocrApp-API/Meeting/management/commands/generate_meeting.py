@@ -0,0 +1,55 @@
+"""
+Management command to create a synthetic meeting for performance work.
+
+Creates a meeting with the given number of auth tokens and LIVE votes, a mix of YNA
+and STV, filled with ballots drawn from openstv.spars preference models (see
+Meeting.synthetic). The meeting is left in place for benchmarks, load tests or closing
+by hand; delete it from the admin when done.
+
+Usage:
+    python manage.py generate_meeting
+    python manage.py generate_meeting --voters 10000 --votes 50 --candidates 8 --proxies 0.1 --turnout 0.8 --seed 1
+"""
+import random
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from Meeting.models import BallotEntry, RankedBallot
+from Meeting.synthetic import generate_meeting
+
+
+class Command(BaseCommand):
+    help = 'Create a meeting full of synthetic voters, votes and ballots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', default='Synthetic meeting', help='Meeting name')
+        parser.add_argument('--voters', type=int, default=100, help='Number of auth tokens')
+        parser.add_argument('--proxies', type=float, default=0.0,
+                            help='Fraction of auth tokens that also hold a proxy vote')
+        parser.add_argument('--votes', type=int, default=10, help='Number of votes')
+        parser.add_argument('--stv', type=float, default=0.5, help='Fraction of the votes that are STV')
+        parser.add_argument('--candidates', type=int, default=5, help='Candidates in each STV vote')
+        parser.add_argument('--turnout', type=float, default=0.9,
+                            help='Fraction of voter tokens with a ballot in each vote')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed, for repeatable data')
+
+    def handle(self, *args, **options):
+        for fraction in ('proxies', 'stv', 'turnout'):
+            if not 0 <= options[fraction] <= 1:
+                raise CommandError(f"--{fraction} must be between 0 and 1")
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+
+        start = perf_counter()
+        with transaction.atomic():
+            meeting = generate_meeting(options['name'], options['voters'], options['votes'],
+                                       stv_fraction=options['stv'], candidates=options['candidates'],
+                                       proxy_fraction=options['proxies'], turnout=options['turnout'])
+        elapsed = perf_counter() - start
+
+        ballots = BallotEntry.objects.filter(vote__token_set__meeting=meeting).count() \
+            + RankedBallot.objects.filter(vote__token_set__meeting=meeting).count()
+        self.stdout.write(f"Created meeting {meeting.pk} with {options['voters']} voters, "
+                          f"{options['votes']} votes and {ballots} ballots in {elapsed:.1f}s")
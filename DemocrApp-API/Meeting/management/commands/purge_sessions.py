@@ -0,0 +1,42 @@
+"""
+Management command to delete expired voter sessions.
+
+A session expires once it has had no websocket for VOTER_SESSION_EXPIRY_HOURS. Run this
+periodically (e.g. hourly from cron) to keep the Session table small. Sessions still
+holding a channel are kept unless --stale-channels is given, which also clears sessions
+left attached to a channel by a websocket server that died without disconnecting them.
+
+Usage:
+    python manage.py purge_sessions
+    python manage.py purge_sessions --stale-channels 48 --dry-run
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from Meeting.models import Session
+
+
+class Command(BaseCommand):
+    help = 'Delete expired voter sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-channels', type=int, default=None, metavar='HOURS',
+                            help='Also delete sessions with a channel not seen for this many hours')
+        parser.add_argument('--dry-run', action='store_true', help='Count the sessions without deleting them')
+
+    def handle(self, *args, **options):
+        querysets = [Session.expired()]
+        if options['stale_channels'] is not None:
+            cutoff = timezone.now() - timedelta(hours=options['stale_channels'])
+            querysets.append(Session.objects.exclude(channel=None).filter(last_seen__lt=cutoff))
+
+        total = 0
+        for queryset in querysets:
+            if options['dry_run']:
+                total += queryset.count()
+            else:
+                total += queryset.delete()[0]
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(f"{verb} {total} session(s)")
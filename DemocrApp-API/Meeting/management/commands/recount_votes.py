@@ -0,0 +1,166 @@
+"""
+Management command to recount closed votes, or check their stored results, in bulk.
+
+Each vote is counted in a process pool, --workers at a time, and the command waits for
+every count to finish, printing each vote's outcome as it comes in.
+
+With --dry-run nothing is changed: each vote's results_data is counted afresh from its
+ballots and compared with the stored one, and any differences are listed. STV votes
+whose count needed the chairs to break a tie can't be checked this way and are
+reported as such. Votes of archived meetings are checked against the ballots in
+their snapshot.
+
+Without it, each vote is reopened and closed again, as regenerate_stv_report and
+regenerate_yna_report do, and the command waits for its count. STV votes without
+num_seats take it from their results; YNA votes without a majority threshold get a
+simple majority. An STV count that reaches a tie waits for the chairs as usual. Votes
+of archived meetings have no ballots left to count and are skipped.
+
+Usage:
+    python manage.py recount_votes --all --dry-run
+    python manage.py recount_votes --all --method STV --workers 8
+    python manage.py recount_votes --meeting 12 --recount
+    python manage.py recount_votes 31 32 33
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+
+from Meeting import counting
+from Meeting.models import Vote
+
+# Keys of results_data that differ from count to count by design
+VOLATILE_KEYS = {"profile"}
+
+
+def differences(stored, recomputed, path=""):
+    """Where two results_data values differ, as "path: stored != recomputed" lines."""
+    if isinstance(stored, dict) and isinstance(recomputed, dict):
+        found = []
+        for key in sorted(set(stored) | set(recomputed), key=str):
+            if not path and key in VOLATILE_KEYS:
+                continue
+            found += differences(stored.get(key), recomputed.get(key), f"{path}.{key}" if path else str(key))
+        return found
+    if isinstance(stored, list) and isinstance(recomputed, list) and len(stored) == len(recomputed):
+        found = []
+        for index, (old, new) in enumerate(zip(stored, recomputed)):
+            found += differences(old, new, f"{path}[{index}]")
+        return found
+    if stored != recomputed:
+        return [f"{path or 'results_data'}: {stored!r} != {recomputed!r}"]
+    return []
+
+
+def _start_worker():
+    # Started with spawn rather than fork, a worker has to set Django up itself
+    import django
+    django.setup()
+
+
+def check_vote(vote_id):
+    """Count a vote afresh and compare the result with the stored one."""
+    vote = Vote.objects.get(pk=vote_id)
+    recomputed = vote.get_method_class().recompute(vote)
+    if recomputed is None:
+        return vote_id, "needs a tie break", []
+    found = differences(vote.results_data, recomputed)
+    return vote_id, "differs" if found else "matches", found
+
+
+def recount_vote(vote_id, recount=False):
+    """Reopen a closed vote, close it again and wait for its count."""
+    vote = Vote.objects.select_related('token_set__meeting').get(pk=vote_id)
+    if vote.archived() is not None:
+        return vote_id, "skipped", ["meeting is archived"]
+    if vote.method == Vote.STV:
+        fields = {"num_seats": vote.num_seats or vote.results_data.get("seats")}
+        if not fields["num_seats"]:
+            return vote_id, "skipped", ["number of seats unknown"]
+    else:
+        fields = {"majority_threshold": vote.majority_threshold or "simple"}
+    if not vote.reopen(**fields):
+        return vote_id, "skipped", [f"vote is {vote.get_state_display()}, not closed"]
+    if not vote.close(recount=recount):
+        return vote_id, "skipped", ["vote is already being counted"]
+    job = counting.job(vote_id)
+    if job is not None:
+        job.result()
+    vote.refresh_from_db(fields=['state'])
+    if vote.state == Vote.NEEDS_TIE_BREAKER:
+        return vote_id, "needs a tie break", []
+    return vote_id, "recounted", []
+
+
+def run(vote_id, dry_run, recount):
+    try:
+        if dry_run:
+            return check_vote(vote_id)
+        return recount_vote(vote_id, recount)
+    except Exception as e:
+        return vote_id, "failed", [f"{type(e).__name__}: {e}"]
+
+
+def _work(vote_id, dry_run, recount):
+    # Worker processes outlive any one vote, so look after their own database connections
+    close_old_connections()
+    try:
+        return run(vote_id, dry_run, recount)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Recount closed votes in parallel, or check their stored results with --dry-run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('vote_ids', nargs='*', type=int, help='IDs of the votes to recount')
+        parser.add_argument('--all', action='store_true', help='Every closed vote')
+        parser.add_argument('--meeting', type=int, help="Every closed vote in this meeting")
+        parser.add_argument('--method', choices=[Vote.STV, Vote.YES_NO_ABS], help='Only votes of this method')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Compare recounted results with the stored ones, changing nothing')
+        parser.add_argument('--recount', action='store_true',
+                            help='Count STV votes again even if the same ballots have been counted before')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes to count in; 0 counts in this process')
+
+    def handle(self, *args, **options):
+        votes = Vote.objects.filter(state=Vote.CLOSED).order_by('pk')
+        if options['vote_ids']:
+            votes = votes.filter(pk__in=options['vote_ids'])
+        elif options['meeting']:
+            votes = votes.filter(token_set__meeting_id=options['meeting'])
+        elif not options['all']:
+            raise CommandError("Give vote ids, --meeting or --all")
+        if options['method']:
+            votes = votes.filter(method=options['method'])
+        vote_ids = list(votes.values_list('pk', flat=True))
+        verb = "Checking" if options['dry_run'] else "Recounting"
+        self.stdout.write(f"{verb} {len(vote_ids)} closed vote(s)")
+
+        outcomes = {}
+        for done, (vote_id, outcome, details) in enumerate(self.results(vote_ids, options), start=1):
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            style = self.style.SUCCESS if outcome in ("matches", "recounted") else self.style.WARNING
+            self.stdout.write(style(f"[{done}/{len(vote_ids)}] vote {vote_id}: {outcome}"))
+            for detail in details:
+                self.stdout.write(f"    {detail}")
+        summary = ", ".join(f"{count} {outcome}" for outcome, count in sorted(outcomes.items()))
+        self.stdout.write(f"Done: {summary or 'nothing to do'}")
+
+    def results(self, vote_ids, options):
+        """Each vote's (id, outcome, details), as its count finishes."""
+        job = (options['dry_run'], options['recount'])
+        if not options['workers']:
+            for vote_id in vote_ids:
+                yield run(vote_id, *job)
+            return
+        # Workers open their own connections rather than sharing this process's
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_start_worker) as pool:
+            futures = [pool.submit(_work, vote_id, *job) for vote_id in vote_ids]
+            for future in as_completed(futures):
+                yield future.result()
@@ -4,10 +4,15 @@ Management command to regenerate STV vote reports by re-closing the vote.
 Usage:
     python manage.py regenerate_stv_report <vote_id>
     python manage.py regenerate_stv_report --all
+
+Votes whose ballots have been counted before get that count's results from the count
+cache; --recount counts them again anyway. Each vote is counted in turn and waited
+for; recount_votes counts many votes in parallel.
 """
 import re
 from django.core.management.base import BaseCommand
 
+from Meeting import counting
 from Meeting.models import Vote
 
 
@@ -18,25 +23,29 @@ class Command(BaseCommand):
         parser.add_argument('vote_id', nargs='?', type=int, help='ID of the vote to regenerate')
         parser.add_argument('--all', action='store_true', help='Regenerate all closed STV votes')
         parser.add_argument('--seats', type=int, help='Override number of seats (default: infer from existing results)')
+        parser.add_argument('--recount', action='store_true',
+                            help='Count again even if the same ballots have been counted before')
 
     def handle(self, *args, **options):
         if options['all']:
             votes = Vote.objects.filter(method=Vote.STV, state=Vote.CLOSED)
             self.stdout.write(f"Found {votes.count()} closed STV votes")
             for vote in votes:
-                self.regenerate_vote(vote, options.get('seats'))
+                self.regenerate_vote(vote, options.get('seats'), options['recount'])
         elif options['vote_id']:
             try:
                 vote = Vote.objects.get(pk=options['vote_id'])
             except Vote.DoesNotExist:
                 self.stderr.write(f"Vote with ID {options['vote_id']} not found")
                 return
-            self.regenerate_vote(vote, options.get('seats'))
+            self.regenerate_vote(vote, options.get('seats'), options['recount'])
         else:
             self.stderr.write("Please provide a vote_id or use --all")
 
     def infer_num_seats(self, vote):
-        """Infer number of seats from the old results format."""
+        """Infer number of seats from the vote's results."""
+        if vote.results_data.get("seats"):
+            return vote.results_data["seats"]
         # Old format: "Winners: ['Apple', 'Banana'] \nLosers:..."
         # Try to parse the winners list
         results = vote.results or ""
@@ -52,11 +61,15 @@ class Command(BaseCommand):
 
         return None
 
-    def regenerate_vote(self, vote, seats_override=None):
+    def regenerate_vote(self, vote, seats_override=None, recount=False):
         if vote.method != Vote.STV:
             self.stderr.write(f"Vote {vote.pk} is not an STV vote (method: {vote.method})")
             return
 
+        if vote.archived() is not None:
+            self.stderr.write(f"Vote {vote.pk} is archived, its ballots are gone, skipping")
+            return
+
         # Determine number of seats
         if seats_override:
             num_seats = seats_override
@@ -69,11 +82,21 @@ class Command(BaseCommand):
         self.stdout.write(f"Regenerating vote {vote.pk}: {vote.name} ({num_seats} seat(s))")
 
         # Set num_seats on vote and set back to LIVE
-        vote.num_seats = num_seats
-        vote.state = Vote.LIVE
-        vote.save()
+        if not vote.reopen(num_seats=num_seats):
+            self.stderr.write(f"  Vote {vote.pk} is {vote.get_state_display()}, not closed, skipping")
+            return
 
         # Re-close
-        vote.close()
+        if not vote.close(recount=recount):
+            self.stderr.write(f"  Vote {vote.pk} is already being counted, skipping")
+            return
+
+        job = counting.job(vote.pk)
+        try:
+            if job is not None:
+                job.result()
+        except Exception as e:
+            self.stderr.write(f"  Counting vote {vote.pk} failed: {e}")
+            return
 
-        self.stdout.write(self.style.SUCCESS(f"  Vote {vote.pk} re-closing..."))
+        self.stdout.write(self.style.SUCCESS(f"  Vote {vote.pk} regenerated successfully"))
@@ -4,9 +4,12 @@ Management command to regenerate Yes/No/Abstain vote reports by re-closing the v
 Usage:
     python manage.py regenerate_yna_report <vote_id>
     python manage.py regenerate_yna_report --all
+
+Each vote is counted in turn and waited for; recount_votes counts many votes in parallel.
 """
 from django.core.management.base import BaseCommand
 
+from Meeting import counting
 from Meeting.models import Vote
 
 
@@ -38,18 +41,34 @@ class Command(BaseCommand):
             self.stderr.write(f"Vote {vote.pk} is not a YNA vote (method: {vote.method})")
             return
 
+        if vote.archived() is not None:
+            self.stderr.write(f"Vote {vote.pk} is archived, its ballots are gone, skipping")
+            return
+
         self.stdout.write(f"Regenerating vote {vote.pk}: {vote.name}")
 
         # Ensure majority_threshold is set (default to simple for legacy votes)
-        if not vote.majority_threshold:
-            vote.majority_threshold = 'simple'
+        majority_threshold = vote.majority_threshold
+        if not majority_threshold:
+            majority_threshold = 'simple'
             self.stdout.write(f"  Set majority_threshold to 'simple' (legacy vote)")
 
         # Set back to LIVE
-        vote.state = Vote.LIVE
-        vote.save()
+        if not vote.reopen(majority_threshold=majority_threshold):
+            self.stderr.write(f"  Vote {vote.pk} is {vote.get_state_display()}, not closed, skipping")
+            return
 
         # Re-close
-        vote.close()
+        if not vote.close():
+            self.stderr.write(f"  Vote {vote.pk} is already being counted, skipping")
+            return
+
+        job = counting.job(vote.pk)
+        try:
+            if job is not None:
+                job.result()
+        except Exception as e:
+            self.stderr.write(f"  Counting vote {vote.pk} failed: {e}")
+            return
 
         self.stdout.write(self.style.SUCCESS(f"  Vote {vote.pk} regenerated successfully"))
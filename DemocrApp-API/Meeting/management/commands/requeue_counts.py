@@ -0,0 +1,44 @@
+"""
+Management command to queue again the counts of votes left COUNTING by a restart.
+
+Counts wait on an in-process pool, so restarting the server loses those queued or
+running, and their votes stay COUNTING. Votes that have been counting for longer than
+VOTE_COUNT_TIMEOUT (or --older-than seconds) are counted again here, and the command
+waits for their counts. Votes whose count is already being queued again elsewhere are
+left alone.
+
+Run it before the server starts with --older-than 0 to requeue every count, or at any
+time to pick up counts that have been lost for a while.
+
+Usage:
+    python manage.py requeue_counts
+    python manage.py requeue_counts --older-than 0
+"""
+from django.core.management.base import BaseCommand
+
+from Meeting import counting
+from Meeting.models import Vote
+
+
+class Command(BaseCommand):
+    help = 'Count again votes whose count was lost with a restarted worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=None,
+                            help='Requeue votes counting for more than this many seconds '
+                                 '(default: VOTE_COUNT_TIMEOUT)')
+
+    def handle(self, *args, **options):
+        votes = Vote.objects.filter(state=Vote.COUNTING).select_related('token_set').order_by('pk')
+        requeued = [vote for vote in votes if vote.requeue_count(options['older_than'])]
+        self.stdout.write(f"Requeued {len(requeued)} count(s)")
+        for vote in requeued:
+            job = counting.job(vote.pk)
+            try:
+                if job is not None:
+                    job.result()
+            except Exception as e:
+                self.stderr.write(f"  Counting vote {vote.pk} failed: {e}")
+                continue
+            vote.refresh_from_db(fields=['state'])
+            self.stdout.write(f"  Vote {vote.pk}: {vote.get_state_display()}")
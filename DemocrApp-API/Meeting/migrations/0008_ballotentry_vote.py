@@ -0,0 +1,47 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_vote(apps, schema_editor):
+    """Copy each entry's vote from its option in a single UPDATE."""
+    BallotEntry = apps.get_model('Meeting', 'BallotEntry')
+    Option = apps.get_model('Meeting', 'Option')
+    BallotEntry.objects.update(vote=Subquery(Option.objects.filter(pk=OuterRef('option')).values('vote')[:1]))
+
+
+def reverse_backfill_vote(apps, schema_editor):
+    """No-op reverse migration."""
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meeting', '0007_tokenset_public_id'),
+    ]
+
+    operations = [
+        # Step 1: Add field as nullable
+        migrations.AddField(
+            model_name='ballotentry',
+            name='vote',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='Meeting.vote'),
+        ),
+        # Step 2: Populate from each entry's option
+        migrations.RunPython(backfill_vote, reverse_backfill_vote),
+        # Step 3: Make field non-nullable
+        migrations.AlterField(
+            model_name='ballotentry',
+            name='vote',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Meeting.vote'),
+        ),
+        migrations.AddIndex(
+            model_name='ballotentry',
+            index=models.Index(fields=['vote', 'token', 'value'], name='ballotentry_vote_token_value'),
+        ),
+        migrations.AddIndex(
+            model_name='ballotentry',
+            index=models.Index(fields=['vote', 'option', 'value'], name='ballotentry_vote_option_value'),
+        ),
+    ]
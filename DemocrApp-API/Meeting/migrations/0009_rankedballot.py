@@ -0,0 +1,52 @@
+import django.db.models.deletion
+from itertools import groupby
+
+from django.db import migrations, models
+
+
+def rank_stv_ballots(apps, schema_editor):
+    """Fold each STV voter's BallotEntry rows into one RankedBallot."""
+    BallotEntry = apps.get_model('Meeting', 'BallotEntry')
+    RankedBallot = apps.get_model('Meeting', 'RankedBallot')
+    entries = BallotEntry.objects.filter(vote__method='STV').order_by('vote_id', 'token_id', 'value')
+    ballots = []
+    for (vote_id, token_id), ranking in groupby(entries.values_list('vote_id', 'token_id', 'option_id').iterator(),
+                                                key=lambda entry: entry[:2]):
+        ballots.append(RankedBallot(vote_id=vote_id, token_id=token_id,
+                                    preferences=[option_id for _, _, option_id in ranking]))
+    RankedBallot.objects.bulk_create(ballots, batch_size=1000)
+    entries.delete()
+
+
+def unrank_stv_ballots(apps, schema_editor):
+    """Expand each RankedBallot back into one BallotEntry per preference."""
+    BallotEntry = apps.get_model('Meeting', 'BallotEntry')
+    RankedBallot = apps.get_model('Meeting', 'RankedBallot')
+    entries = [BallotEntry(vote_id=ballot.vote_id, token_id=ballot.token_id, option_id=option_id, value=value)
+               for ballot in RankedBallot.objects.iterator()
+               for value, option_id in enumerate(ballot.preferences, start=1)]
+    BallotEntry.objects.bulk_create(entries, batch_size=1000)
+    RankedBallot.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meeting', '0008_ballotentry_vote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankedBallot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('preferences', models.JSONField(default=list)),
+                ('token', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='Meeting.votertoken')),
+                ('vote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Meeting.vote')),
+            ],
+            options={
+                'unique_together': {('vote', 'token')},
+            },
+        ),
+        migrations.RunPython(rank_stv_ballots, unrank_stv_ballots),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meeting', '0009_rankedballot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeetingArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.BinaryField()),
+                ('meeting', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='archive', to='Meeting.meeting')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meeting', '0010_meetingarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meeting', '0011_vote_closed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='last_seen',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='session',
+            name='channel',
+            field=models.CharField(max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['auth_token', 'channel'], name='session_auth_token_channel'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meeting', '0012_session_lifecycle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meeting',
+            name='modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='meeting',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meeting', '0013_meeting_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rankedballot',
+            name='modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
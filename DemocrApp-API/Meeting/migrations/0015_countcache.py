@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meeting', '0014_rankedballot_modified_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CountCache',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('results', models.TextField()),
+                ('results_data', models.JSONField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meeting', '0015_countcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='count_checkpoint',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
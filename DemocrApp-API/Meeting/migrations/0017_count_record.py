@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:05
+
+from django.db import migrations, models
+
+
+def clear_count_cache(apps, schema_editor):
+    # Cached counts hold HTML reports rather than election records; they're counted again
+    apps.get_model('Meeting', 'CountCache').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meeting', '0016_vote_count_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='count_record',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.RunPython(clear_count_cache, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='countcache',
+            name='results',
+        ),
+        migrations.AddField(
+            model_name='countcache',
+            name='record',
+            field=models.JSONField(default=dict),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meeting', '0017_count_record'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='count_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-19 18:40
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce, Now
+
+
+def backfill_closed_at(apps, schema_editor):
+    """Give votes closed before closed_at existed their meeting's close time, or now."""
+    Vote = apps.get_model('Meeting', 'Vote')
+    Meeting = apps.get_model('Meeting', 'Meeting')
+    close_time = Meeting.objects.filter(tokenset=OuterRef('token_set')).values('close_time')[:1]
+    Vote.objects.filter(state='CL', closed_at=None).update(closed_at=Coalesce(Subquery(close_time), Now()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meeting', '0018_vote_count_started_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_closed_at, migrations.RunPython.noop),
+    ]
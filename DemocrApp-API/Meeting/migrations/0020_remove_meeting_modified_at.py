@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-19 18:55
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meeting', '0019_backfill_vote_closed_at'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='meeting',
+            name='modified_at',
+        ),
+    ]
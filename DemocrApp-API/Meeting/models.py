@@ -1,26 +1,67 @@
 import _thread
+import logging
+from datetime import timedelta
+from time import monotonic, sleep
 
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
-from django.db import models
-from django.db.models.signals import post_save
+from django.utils.functional import cached_property
+from django.db import models, connection, transaction, DatabaseError
+from django.db.models import Case, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.urls import reverse
+from functools import lru_cache
+import json
 import uuid
 import random
+import zlib
 
 from Meeting.voting_methods import YNA, STV as STVMethod, VoteMethod
 
+logger = logging.getLogger(__name__)
+
+CONTROL_CHANNEL_LAYER = "control"
+
+
+def get_control_layer():
+    """
+    The channel layer carrying control events (vote closing, announcements, boots and
+    token revocation). Voter sockets read it ahead of the default layer, so these events
+    are neither queued behind nor dropped with ballot traffic. Falls back to the default
+    layer when no control layer is configured.
+    """
+    return get_channel_layer(CONTROL_CHANNEL_LAYER) or get_channel_layer()
+
 
 class Meeting(models.Model):
     time = models.DateTimeField(default=timezone.now)
     name = models.TextField(default='')
     close_time = models.DateTimeField(default=None, null=True, blank=True)
+    # Bumped whenever the meeting, its token sets, auth tokens or votes change; the
+    # detail endpoint's ETag comes from it
+    version = models.PositiveIntegerField(default=0)
 
     def open(self):
         return self.close_time is None
 
+    def archived(self):
+        """
+        The meeting's MeetingArchive, or None if it hasn't been archived. Open meetings
+        can't have one, so aren't looked up; otherwise it's read once per instance, so
+        votes loaded with prefetch_related('token_set__meeting') share one read.
+        """
+        if self.open():
+            return None
+        try:
+            return self.archive
+        except MeetingArchive.DoesNotExist:
+            return None
+
     def save(self, *args, **kwargs):
         if self._state.adding:
             super(Meeting, self).save(*args, **kwargs)
@@ -40,6 +81,45 @@ class Meeting(models.Model):
     def channel_group_name(self):
         return "meeting_{}".format(self.pk)
 
+    def manage_group_name(self):
+        return "manage_{}".format(self.pk)
+
+    def send_control(self, event):
+        """Push a control event to every voter connected to this meeting."""
+        async_to_sync(get_control_layer().group_send)(self.channel_group_name(), event)
+
+    def notify_managers(self, event):
+        """
+        Push an event to every chair watching this meeting's manage page. Best effort: a
+        push the channel layer can't take is logged, and the page is right again on reload.
+        """
+        try:
+            async_to_sync(get_channel_layer().group_send)(self.manage_group_name(), event)
+        except Exception:
+            logger.exception("Couldn't push %s to the managers of meeting %s", event["type"], self.pk)
+
+    def connected_voters(self):
+        return Session.objects.filter(auth_token__token_set__meeting=self).exclude(channel=None).count()
+
+    def close(self):
+        """
+        Close the meeting without waiting for its counts: every LIVE vote is frozen in one
+        transaction and queued on the count pool, READY votes are deleted and voters are
+        told. Raises TimeoutError, leaving the meeting open, if ballots for the live votes
+        are still being submitted after VOTE_CLOSE_DRAIN_TIMEOUT.
+        """
+        for vote in Vote.freeze_all(self):
+            vote.get_method_class().count_later(self.pk, vote.pk, num_seats=vote.num_seats)
+            self.send_control({"type": "vote.closing",
+                               "vote_id": vote.pk})
+        # The save below bumps the version for these too
+        Vote.objects.filter(token_set__meeting=self, state=Vote.READY).delete()
+
+        self.send_control({"type": "announcement",
+                           "message": "This meeting has now closed"})
+        self.close_time = timezone.now()
+        self.save()
+
 
 class TokenSet(models.Model):
     meeting = models.ForeignKey(Meeting, on_delete=models.CASCADE)
@@ -87,9 +167,51 @@ class AuthToken(models.Model):
 
 
 class Session(models.Model):
+    class Meta:
+        indexes = [
+            # check_token's counts and boot_others look up a token's (connected) sessions
+            models.Index(fields=['auth_token', 'channel'], name='session_auth_token_channel'),
+        ]
+
     id = models.UUIDField(primary_key=True,default=uuid.uuid4)
     auth_token = models.ForeignKey(AuthToken, on_delete=models.CASCADE)
-    channel = models.TextField(null=True)
+    # Bounded so MySQL can index it; channel names are well under this
+    channel = models.CharField(max_length=100, null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    # Set when a websocket attaches or detaches
+    last_seen = models.DateTimeField(default=timezone.now, db_index=True)
+
+    @staticmethod
+    def expiry_cutoff():
+        return timezone.now() - timedelta(hours=settings.VOTER_SESSION_EXPIRY_HOURS)
+
+    @classmethod
+    def expired(cls):
+        """Sessions with no open websocket that haven't been seen for VOTER_SESSION_EXPIRY_HOURS."""
+        return cls.objects.filter(channel=None, last_seen__lt=cls.expiry_cutoff())
+
+    def is_expired(self):
+        return self.channel is None and self.last_seen < self.expiry_cutoff()
+
+    def control_group_name(self):
+        return "session_{}".format(self.pk)
+
+    @classmethod
+    def notify(cls, auth_token_ids, event):
+        """
+        Send a control event to every open websocket of the given auth tokens, once the
+        current transaction commits. Best effort: a push the channel layer can't take is
+        logged.
+        """
+        def push():
+            try:
+                control_layer = get_control_layer()
+                for session in cls.objects.filter(auth_token__in=auth_token_ids).exclude(channel=None).only('id'):
+                    async_to_sync(control_layer.group_send)(session.control_group_name(), event)
+            except Exception:
+                logger.exception("Couldn't push %s to auth tokens %s", event["type"], auth_token_ids)
+
+        transaction.on_commit(push)
 
 
 class VoterToken(models.Model):
@@ -101,8 +223,15 @@ class Vote(models.Model):
     token_set = models.ForeignKey(TokenSet, on_delete=models.CASCADE)
     name = models.TextField(default='')
     description = models.TextField(default='')
+    # The HTML report; for STV votes, rendered from count_record when first shown
     results = models.TextField(default='')
     results_data = models.JSONField(default=dict, blank=True)
+    # An STV count's openstv election record, which its reports are rendered from
+    count_record = models.JSONField(null=True, blank=True)
+    # Where an STV count stopped for a tie break, so it can carry on once one is chosen
+    count_checkpoint = models.JSONField(null=True, blank=True)
+    # When the vote's count was queued; see requeue_count()
+    count_started_at = models.DateTimeField(null=True, blank=True)
     YES_NO_ABS = "YNA"
     STV = "STV"
     methods = (
@@ -127,6 +256,8 @@ class Vote(models.Model):
         (CLOSED, "Closed"),
     )
     state = models.CharField(max_length=2, default=READY, choices=states)
+    # Lets report reads avoid a lagging replica right after a close; see Meeting/db_router.py
+    closed_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     majority_threshold = models.CharField(
         max_length=20,
@@ -158,12 +289,101 @@ class Vote(models.Model):
     )
 
     def responses(self, exclude_proxies=False):
-        if exclude_proxies:
-            return BallotEntry.objects.filter(option__vote=self, token__proxy=False).values('token').distinct().count()
-        else:
-            return BallotEntry.objects.filter(option__vote=self).values('token').distinct().count()
+        archived = self.archived()
+        if archived is not None:
+            return sum(1 for ballot in archived['ballots'] if not (exclude_proxies and ballot['proxy']))
+        if not exclude_proxies and hasattr(self, 'response_count'):
+            return self.response_count
+        return self.get_method_class().responses(self, exclude_proxies)
+
+    @classmethod
+    def with_responses(cls, queryset):
+        """Annotate each vote in the queryset with its response_count, computed in the same query."""
+        return queryset.annotate(response_count=Coalesce(
+            Case(*(When(method=method, then=method_class.responses_subquery())
+                   for method, method_class in cls.method_classes.items())),
+            0))
+
+    @classmethod
+    def for_reports(cls, queryset):
+        """
+        The votes in the queryset with their responses and options loaded and their meeting's
+        archive (if any) attached, so a report over many votes costs a fixed number of queries.
+        """
+        votes = list(cls.with_responses(queryset).annotate(meeting_pk=models.F('token_set__meeting'))
+                     .prefetch_related('option_set'))
+        archives = {archive.meeting_id: archive
+                    for archive in MeetingArchive.objects.filter(meeting__in={vote.meeting_pk for vote in votes})}
+        for vote in votes:
+            archive = archives.get(vote.meeting_pk)
+            vote._archived = archive.vote(vote.pk) if archive else None
+        return votes
+
+    @classmethod
+    def voted_tokens(cls, votes, voter_token_ids):
+        """
+        Which of the given voter tokens have a ballot in each of the votes, as {vote id: [token ids]},
+        with one query per voting method rather than one per vote.
+        """
+        by_method = {}
+        for vote in votes:
+            by_method.setdefault(vote.method, []).append(vote)
+        voted = {}
+        for method, method_votes in by_method.items():
+            voted.update(cls.method_classes[method].voted_tokens_by_vote(method_votes, voter_token_ids))
+        return voted
+
+    def ballots(self):
+        """
+        Every ballot as (voter token, entries in preference order), for reports. Archived
+        votes give unsaved tokens and entries rebuilt from the snapshot.
+        """
+        archived = self.archived()
+        if archived is None:
+            return self.get_method_class().ballots(self)
+        options = {option['id']: Option(vote_id=self.pk, **option) for option in archived['options']}
+        return [(VoterToken(proxy=ballot['proxy']),
+                 [BallotEntry(vote_id=self.pk, option=options[option_id], value=value)
+                  for option_id, value in ballot['entries']])
+                for ballot in archived['ballots']]
+
+    @property
+    def report_html(self):
+        return self.report("html")
+
+    def report(self, format="html"):
+        """
+        The vote's results report in the given format ("html", or for STV votes "text",
+        "csv" or "yaml"). STV counts store only their election record, and a report is
+        rendered from it the first time it's wanted: HTML is kept in results, other
+        formats in the cache.
+        """
+        if format == "html":
+            if not self.results and self.count_record:
+                self.results = self.get_method_class().render_report(self.count_record, format)
+                # Unless the vote has been counted again since it was loaded
+                Vote.objects.filter(pk=self.pk, closed_at=self.closed_at, results='').update(results=self.results)
+            return self.results
+        if not self.count_record:
+            return None
+        key = "vote-report:{}:{}:{}".format(self.pk, format, self.closed_at.timestamp())
+        return cache.get_or_set(key, lambda: self.get_method_class().render_report(self.count_record, format))
+
+    def archived(self):
+        """This vote's part of its meeting's archive snapshot, or None if it hasn't been archived."""
+        if self.state != self.CLOSED:
+            return None
+        if not hasattr(self, '_archived'):
+            if not Vote.token_set.is_cached(self):
+                # In the one query the archive lookup used to take
+                self.token_set = TokenSet.objects.select_related('meeting__archive').get(pk=self.token_set_id)
+            archive = self.token_set.meeting.archived()
+            self._archived = archive.vote(self.pk) if archive else None
+        return self._archived
 
     def save(self, *args, **kwargs):
+        if self.state == self.CLOSED and self.closed_at is None:
+            self.closed_at = timezone.now()
         if self._state.adding and self.method == self.YES_NO_ABS:
             super(Vote, self).save(*args, **kwargs)
             Option(vote=self, name="yes").save()
@@ -175,19 +395,167 @@ class Vote(models.Model):
     def __str__(self):
         return self.name
 
-    def close(self):
+    @classmethod
+    def lock_for_ballots(cls, vote_ids):
+        """
+        Fetch votes inside the current transaction, holding a shared lock on their rows.
+
+        Any number of ballot submissions can hold the shared lock at once, but
+        freezing a vote for counting needs an exclusive lock, so a close waits
+        for in-flight ballots to commit and every later ballot sees the new state.
+        Returns a dict of the votes that exist, keyed by id.
+        """
+        queryset = cls.objects.filter(pk__in=vote_ids).order_by('pk')
+        if connection.vendor == 'mysql':
+            sql, params = queryset.query.sql_with_params()
+            votes = cls.objects.raw(sql + ' LOCK IN SHARE MODE', params)
+        elif connection.vendor == 'postgresql':
+            sql, params = queryset.query.sql_with_params()
+            votes = cls.objects.raw(sql + ' FOR SHARE', params)
+        else:
+            # SQLite only allows one writer at a time, so a plain read is enough there.
+            votes = queryset
+        return {vote.pk: vote for vote in votes}
+
+    @classmethod
+    def freeze_all(cls, meeting, timeout=None):
+        """
+        freeze() every LIVE vote in the meeting at once, in one transaction, and return them.
+        """
+        if timeout is None:
+            timeout = settings.VOTE_CLOSE_DRAIN_TIMEOUT
+        deadline = monotonic() + timeout
+        live = list(cls.objects.filter(token_set__meeting=meeting, state=cls.LIVE).values_list('pk', flat=True))
+        while True:
+            try:
+                with transaction.atomic():
+                    votes = list(cls.objects.select_for_update(nowait=True).filter(pk__in=live, state=cls.LIVE)
+                                 .order_by('pk'))
+                    cls.objects.filter(pk__in=[vote.pk for vote in votes]) \
+                        .update(state=cls.COUNTING, count_started_at=timezone.now())
+                break
+            except DatabaseError:
+                if monotonic() >= deadline:
+                    raise TimeoutError("Ballots for meeting {} are still being submitted".format(meeting.pk))
+                sleep(0.01)
+        # update() skips the post_save receivers, so do their work once for the lot
+        bump_meeting_version(pk=meeting.pk)
+        for vote in votes:
+            vote.state = cls.COUNTING
+            meeting.notify_managers({"type": "vote.state",
+                                     "vote_id": vote.pk})
+        return votes
+
+    def freeze(self, timeout=None):
+        """
+        Move the vote from LIVE to COUNTING once every in-flight ballot for it has committed.
+
+        The move is a conditional update, so of any number of concurrent closes exactly
+        one freezes the vote; the rest get False and change nothing. Raises TimeoutError
+        if ballot submissions are still holding the vote after ``timeout`` seconds
+        (VOTE_CLOSE_DRAIN_TIMEOUT by default).
+        """
+        if timeout is None:
+            timeout = settings.VOTE_CLOSE_DRAIN_TIMEOUT
+        deadline = monotonic() + timeout
+        while True:
+            try:
+                with transaction.atomic():
+                    list(Vote.objects.select_for_update(nowait=True).filter(pk=self.pk).values_list('pk'))
+                    frozen = Vote.objects.filter(pk=self.pk, state=self.LIVE) \
+                        .update(state=self.COUNTING, count_started_at=timezone.now())
+                break
+            except DatabaseError:
+                if monotonic() >= deadline:
+                    raise TimeoutError("Ballots for vote {} are still being submitted".format(self.pk))
+                sleep(0.01)
+        if not frozen:
+            self.refresh_from_db(fields=['state'])
+            return False
+        self.state = self.COUNTING
+        # update() skips the post_save receivers
+        bump_meeting_version(tokenset=self.token_set_id)
+        self.token_set.meeting.notify_managers({"type": "vote.state",
+                                                "vote_id": self.pk})
+        return True
+
+    def close(self, recount=False):
+        """
+        Freeze the vote and count it. Returns False without counting if the vote wasn't
+        LIVE by the time it froze: a repeated or concurrent close, whose count is already
+        under way (see counting.job()). With recount, an STV vote is counted afresh even
+        if identical ballots have been counted before.
+        """
         # Validation
         if self.method == self.STV and not self.num_seats:
             raise ValueError("STV votes require num_seats to be set before closing")
         if self.method == self.YES_NO_ABS and not self.majority_threshold:
             raise ValueError("YNA votes require majority_threshold to be set before closing")
 
+        if not self.freeze():
+            return False
+        self.method_classes.get(self.method).count(self.id, num_seats=self.num_seats, recount=recount)
+        self.token_set.meeting.send_control({"type": "vote.closing",
+                                             "vote_id": self.pk})
+        return True
+
+    def reopen(self, **fields):
+        """
+        Move a CLOSED vote back to LIVE, with the given fields changed, so it can be
+        counted again; its results are cleared until it is. Returns False, changing
+        nothing, if the vote isn't CLOSED, for instance because a count of it is in
+        progress. Raises ValueError for a vote whose meeting has been archived, as its
+        ballots are gone.
+        """
+        if self.archived() is not None:
+            raise ValueError("Vote {} is archived and can't be counted again".format(self.pk))
+        reopened = Vote.objects.filter(pk=self.pk, state=self.CLOSED, token_set__meeting__archive=None) \
+            .update(state=self.LIVE, closed_at=None, count_record=None, results='', results_data={}, **fields)
+        self.refresh_from_db()
+        if reopened:
+            bump_meeting_version(tokenset=self.token_set_id)
+        return bool(reopened)
+
+    def break_tie(self, option_id):
+        """
+        Settle the tie a suspended STV count stopped at in favour of option_id and queue
+        the count to carry on from its checkpoint. Returns False, changing nothing, if
+        the vote isn't waiting on a tie break, for instance because a concurrent choice
+        got there first.
+        """
+        resumed = Vote.objects.filter(pk=self.pk, state=self.NEEDS_TIE_BREAKER) \
+            .update(state=self.COUNTING, count_started_at=timezone.now())
+        if not resumed:
+            self.refresh_from_db(fields=['state'])
+            return False
         self.state = self.COUNTING
-        self.save()
-        self.method_classes.get(self.method).count(self.id, num_seats=self.num_seats)
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(self.token_set.meeting.channel_group_name(), {"type": "vote.closing",
-                                                                                              "vote_id": self.pk})
+        Tie.objects.filter(vote=self).exclude(option_id=option_id).delete()
+        # update() skips the post_save receivers
+        bump_meeting_version(tokenset=self.token_set_id)
+        self.token_set.meeting.notify_managers({"type": "vote.state",
+                                                "vote_id": self.pk})
+        self.get_method_class().count_later(self.token_set.meeting_id, self.pk, num_seats=self.num_seats)
+        return True
+
+    def requeue_count(self, timeout=None):
+        """
+        Queue the count of a vote that has been COUNTING for longer than ``timeout`` seconds
+        (VOTE_COUNT_TIMEOUT by default), whose count was lost with the worker it was queued
+        on. Returns False, queuing nothing, if the vote isn't such a vote or a concurrent
+        requeue got there first.
+        """
+        if timeout is None:
+            timeout = settings.VOTE_COUNT_TIMEOUT
+        stale = timezone.now() - timedelta(seconds=timeout)
+        # Votes frozen before count_started_at was kept have none
+        requeued = Vote.objects.filter(models.Q(count_started_at__lt=stale) | models.Q(count_started_at=None),
+                                       pk=self.pk, state=self.COUNTING) \
+            .update(count_started_at=timezone.now())
+        if not requeued:
+            return False
+        self.refresh_from_db()
+        self.get_method_class().count_later(self.token_set.meeting_id, self.pk, num_seats=self.num_seats)
+        return True
 
     def get_method_class(self) -> VoteMethod:
         return self.method_classes[self.method]
@@ -209,17 +577,208 @@ class BallotEntry(models.Model):
         unique_together = (('token', 'option'),
                            #('option__vote', 'value')
                            )
+        indexes = [
+            # A voter's ballot for a vote (replacing it, existing_ballots on connect), and
+            # reading every ballot in preference order when counting
+            models.Index(fields=['vote', 'token', 'value'], name='ballotentry_vote_token_value'),
+            # Counting and reports read a vote's entries by option and preference
+            models.Index(fields=['vote', 'option', 'value'], name='ballotentry_vote_option_value'),
+        ]
 
     token = models.ForeignKey(VoterToken, on_delete=models.DO_NOTHING)
     option = models.ForeignKey(Option, on_delete=models.CASCADE)
+    # Denormalised from option.vote so ballot reads don't join through Option
+    vote = models.ForeignKey(Vote, on_delete=models.CASCADE)
     value = models.SmallIntegerField(default=1)
 
+    def save(self, *args, **kwargs):
+        if self.vote_id is None:
+            self.vote_id = self.option.vote_id
+        super().save(*args, **kwargs)
+
+
+class RankedBallot(models.Model):
+    """
+    A voter's whole ranking in an STV vote as one row: the option ids in preference
+    order. Per-option BallotEntry-style rows for reports come from entries().
+    """
+    class Meta:
+        unique_together = (('vote', 'token'),)
+
+    vote = models.ForeignKey(Vote, on_delete=models.CASCADE)
+    token = models.ForeignKey(VoterToken, on_delete=models.DO_NOTHING)
+    preferences = models.JSONField(default=list)
+    # Lets provisional recounts (Meeting.provisional) fetch only rankings changed since the last one
+    modified_at = models.DateTimeField(default=timezone.now)
+
+    def entries(self, options):
+        """Unsaved BallotEntry rows for this ranking, given the vote's options keyed by pk."""
+        return [BallotEntry(vote_id=self.vote_id, token=self.token, option=options[option_id], value=value)
+                for value, option_id in enumerate(self.preferences, start=1)]
+
+
+@lru_cache(maxsize=16)
+def _load_snapshot(data):
+    return json.loads(zlib.decompress(data))
+
+
+class MeetingArchive(models.Model):
+    """
+    A closed meeting's votes, options, anonymised ballots and results as one compressed
+    JSON snapshot, written once. Archiving deletes the meeting's ballots, tokens and
+    sessions; the Meeting, TokenSet, Vote and Option rows stay so report URLs keep working,
+    and reports read ballot data from the snapshot.
+    """
+    meeting = models.OneToOneField(Meeting, on_delete=models.CASCADE, related_name='archive')
+    created_at = models.DateTimeField(auto_now_add=True)
+    data = models.BinaryField()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Meeting archives can't be changed once written")
+        super().save(*args, **kwargs)
+
+    @cached_property
+    def snapshot(self):
+        return _load_snapshot(bytes(self.data))
+
+    def vote(self, vote_id):
+        return next((vote for vote in self.snapshot['votes'] if vote['id'] == vote_id), None)
+
+    @classmethod
+    def build_snapshot(cls, meeting):
+        """
+        The snapshot of a meeting as a dict. Ballots keep only their proxy flag and
+        (option id, value) entries, in random order, so they can't be traced to a voter.
+        """
+        votes = []
+        for vote in Vote.objects.filter(token_set__meeting=meeting).order_by('pk'):
+            ballots = [{"proxy": token.proxy,
+                        "entries": [[entry.option_id, entry.value] for entry in entries]}
+                       for token, entries in vote.get_method_class().ballots(vote)]
+            random.shuffle(ballots)
+            votes.append({
+                "id": vote.pk,
+                "public_id": str(vote.public_id),
+                "token_set": vote.token_set_id,
+                "name": vote.name,
+                "description": vote.description,
+                "method": vote.method,
+                "majority_threshold": vote.majority_threshold,
+                "num_seats": vote.num_seats,
+                "hide_from_public_report": vote.hide_from_public_report,
+                "results": vote.report_html,
+                "results_data": vote.results_data,
+                "options": list(vote.option_set.order_by('pk').values('id', 'name', 'link')),
+                "ballots": ballots,
+            })
+        return {
+            "meeting": {
+                "id": meeting.pk,
+                "name": meeting.name,
+                "time": meeting.time.isoformat(),
+                "close_time": meeting.close_time.isoformat(),
+            },
+            "token_sets": [{"id": token_set.pk, "public_id": str(token_set.public_id),
+                            "created_at": token_set.created_at.isoformat()}
+                           for token_set in meeting.tokenset_set.order_by('pk')],
+            "votes": votes,
+        }
+
+    @classmethod
+    def archive(cls, meeting):
+        """
+        Snapshot a closed meeting and delete its ballots, voter tokens, auth tokens and
+        sessions, all in one transaction. Returns the new archive.
+        """
+        if meeting.open():
+            raise ValueError("Only closed meetings can be archived")
+        if Vote.objects.filter(token_set__meeting=meeting).exclude(state=Vote.CLOSED).exists():
+            raise ValueError("Meeting {} still has votes being counted".format(meeting.pk))
+        with transaction.atomic():
+            snapshot = cls.build_snapshot(meeting)
+            archive = cls.objects.create(
+                meeting=meeting,
+                data=zlib.compress(json.dumps(snapshot, separators=(',', ':')).encode(), 9))
+            BallotEntry.objects.filter(vote__token_set__meeting=meeting).delete()
+            RankedBallot.objects.filter(vote__token_set__meeting=meeting).delete()
+            Session.objects.filter(auth_token__token_set__meeting=meeting).delete()
+            VoterToken.objects.filter(auth_token__token_set__meeting=meeting).delete()
+            AuthToken.objects.filter(token_set__meeting=meeting).delete()
+            bump_meeting_version(pk=meeting.pk)
+        return archive
+
 
 class Tie(models.Model):
     vote = models.ForeignKey(Vote, on_delete=models.CASCADE)
     option = models.ForeignKey(Option, on_delete=models.CASCADE)
 
 
+class CountCache(models.Model):
+    """
+    A finished STV count's election record and results, keyed by the openstv fingerprint of its
+    input, so counting identical ballots again (regenerating a report, a re-close)
+    reuses them. Shared by every process through Meeting.counting.results_cache.
+    """
+    fingerprint = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    record = models.JSONField()
+    results_data = models.JSONField()
+
+
+def bump_meeting_version(**filters):
+    """Mark the matching meeting as changed, without loading it or sending signals."""
+    Meeting.objects.filter(**filters).update(version=models.F('version') + 1)
+
+
+@receiver(post_save, sender=Meeting)
+def bump_version_on_meeting_save(sender, instance, **kwargs):
+    bump_meeting_version(pk=instance.pk)
+
+
+@receiver([post_save, post_delete], sender=TokenSet)
+def bump_version_on_token_set_change(sender, instance, **kwargs):
+    bump_meeting_version(pk=instance.meeting_id)
+
+
+# Not on post_delete: that would cost every row of a bulk delete a query of its own, so
+# code deleting votes or auth tokens bumps the version once itself
+@receiver(post_save, sender=AuthToken)
+@receiver(post_save, sender=Vote)
+def bump_version_on_token_set_member_change(sender, instance, **kwargs):
+    bump_meeting_version(tokenset=instance.token_set_id)
+
+
+@receiver(post_save, sender=TokenSet)
+def push_token_set_rotation(sender, instance, created, **kwargs):
+    """
+    Tell connected voters a new token set is in use, so holders of older tokens are dropped.
+    Sent once the token set is committed, and best effort, so saving it never needs the
+    channel layer.
+    """
+    if not created:
+        return
+    meeting = Meeting(pk=instance.meeting_id)
+    event = {"type": "token_set.rotated", "token_set_id": instance.pk}
+
+    def push():
+        try:
+            meeting.send_control(event)
+        except Exception:
+            logger.exception("Couldn't push the new token set of meeting %s", meeting.pk)
+
+    transaction.on_commit(push)
+
+
+@receiver(post_save, sender=Vote)
+def push_vote_state(sender, instance, created, **kwargs):
+    """Keep open manage pages in step with vote state changes, once they're committed."""
+    if not created:
+        meeting = Meeting(pk=instance.token_set.meeting_id)
+        event = {"type": "vote.state", "vote_id": instance.pk}
+        transaction.on_commit(lambda: meeting.notify_managers(event))
+
+
 @receiver(post_save, sender=Vote)
 def auto_create_none_of_the_above(sender, instance, created, **kwargs):
     """Auto-create 'None of the above' option for STV ballots when created."""
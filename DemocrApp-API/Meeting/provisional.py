@@ -0,0 +1,135 @@
+"""
+Provisional results for LIVE STV votes, so chairs can see how an election is trending
+before they close it.
+
+With PROVISIONAL_STV_INTERVAL set, ballots arriving for a LIVE STV vote schedule a
+recount of it that many seconds later; ballots arriving while one is scheduled join it
+rather than scheduling another, and a vote no one is voting in is never recounted.
+Recounts run one at a time on their own thread, not the counting pool, so they never
+hold up a real count. Strong ties are broken by candidate order instead of being put
+to the chairs.
+
+The result goes to the meeting's manage pages as a vote.provisional event and nowhere
+else: nothing is stored on the vote, so voters and reports never see it.
+
+Each vote's extracted ballots are kept between recounts, so a recount only fetches the
+rankings written since the last one (by RankedBallot.modified_at) and drops voters
+whose ballots have gone. The cache is per process and only the worker thread touches it.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from threading import Lock, Timer
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from openstv.ballots import Ballots
+
+from .models import Meeting, Vote, RankedBallot
+from .voting_methods.stv import STV
+
+logger = logging.getLogger(__name__)
+
+# Rankings modified this long before the last sync are fetched again, so ones written by
+# a transaction that was still open at the time aren't missed
+SYNC_OVERLAP = timedelta(seconds=5)
+
+_executor = None
+_scheduled = set()
+_lock = Lock()
+_extracts = {}
+
+
+class Extract:
+    """A vote's rankings as of its last sync, by voter token, in openstv candidate numbers."""
+
+    def __init__(self, vote):
+        options = list(vote.option_set.order_by('pk').values_list('pk', 'name'))
+        self.translation = {option_id: index for index, (option_id, _) in enumerate(options)}
+        self.names = [name for _, name in options]
+        self.rankings = {}
+        self.synced_at = None
+
+    def sync(self, vote):
+        started = timezone.now()
+        rows = RankedBallot.objects.filter(vote=vote)
+        changed = rows if self.synced_at is None else rows.filter(modified_at__gte=self.synced_at - SYNC_OVERLAP)
+        for token_id, preferences in (changed.values_list('token_id', 'preferences')
+                                      .iterator(chunk_size=STV.EXTRACT_CHUNK_SIZE)):
+            self.rankings[token_id] = [self.translation[option_id] for option_id in preferences]
+        if rows.count() != len(self.rankings):
+            present = set(rows.values_list('token_id', flat=True))
+            for token_id in self.rankings.keys() - present:
+                del self.rankings[token_id]
+        self.synced_at = started
+
+    def ballots(self, seats):
+        ballots = Ballots()
+        ballots.setNames(self.names)
+        ballots.numSeats = seats
+        ballots.appendBallots(self.rankings[token_id] for token_id in sorted(self.rankings))
+        return ballots
+
+
+def _worker():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='provisional-count')
+        return _executor
+
+
+def ballots_changed(meeting_id, vote_id):
+    """Schedule a provisional recount of a LIVE STV vote that has new or changed ballots."""
+    interval = settings.PROVISIONAL_STV_INTERVAL
+    if not interval:
+        return
+    with _lock:
+        if vote_id in _scheduled:
+            return
+        _scheduled.add(vote_id)
+    timer = Timer(interval, lambda: _worker().submit(_work, meeting_id, vote_id))
+    timer.daemon = True
+    timer.start()
+
+
+def _work(meeting_id, vote_id):
+    # Ballots from here on need another recount
+    with _lock:
+        _scheduled.discard(vote_id)
+    close_old_connections()
+    try:
+        recount(meeting_id, vote_id)
+    except Exception:
+        logger.exception("Provisional count of vote %s failed", vote_id)
+    finally:
+        close_old_connections()
+
+
+def recount(meeting_id, vote_id):
+    """
+    Count a LIVE STV vote as it stands and push the result to its meeting's manage pages.
+    Returns the results, or None if the vote isn't a LIVE STV vote with ballots.
+    """
+    # Forget votes that have closed since their last recount
+    for stale in set(_extracts) - set(Vote.objects.filter(pk__in=list(_extracts), state=Vote.LIVE)
+                                      .values_list('pk', flat=True)):
+        del _extracts[stale]
+    vote = Vote.objects.filter(pk=vote_id, method=Vote.STV, state=Vote.LIVE).first()
+    if vote is None:
+        return None
+    extract = _extracts.get(vote_id)
+    if extract is None:
+        extract = _extracts[vote_id] = Extract(vote)
+    extract.sync(vote)
+    if not extract.rankings:
+        return None
+    seats = vote.num_seats or 1
+    election = STV.run_election(vote, extract.ballots(seats), tie_break="index")
+    results = STV.results_data(election, seats)
+    Meeting(pk=meeting_id).notify_managers({"type": "vote.provisional",
+                                            "vote_id": vote_id,
+                                            "results": results})
+    return results
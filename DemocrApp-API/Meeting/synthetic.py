@@ -0,0 +1,110 @@
+"""
+Synthetic meetings for benchmarks and query-budget tests: auth tokens, votes and
+realistic ballots, written with bulk inserts so tens of thousands of voters over
+dozens of votes take seconds.
+
+STV rankings follow openstv.spars' spatial model: candidates and voters are points in
+a Gaussian "ideology" space and each voter ranks every candidate, nearest first. Each
+yes/no/abstain vote gets its own random split of the electorate from spars.probDist.
+
+Randomness comes from the `random` module, so seed it for repeatable data.
+
+Rows go in through executemany with plain tuples: building and compiling a model
+instance per row is what makes bulk_create slow at this size, and these rows don't
+need model instances or signals.
+"""
+import json
+import math
+import random
+
+from django.db import connection
+from django.utils import timezone
+
+from openstv import spars
+
+from .models import Meeting, AuthToken, VoterToken, Vote, Option, BallotEntry, RankedBallot
+
+BATCH_SIZE = 5000
+
+
+def insert_rows(model, fields, rows):
+    """Insert tuples of values for the given fields of the model, BATCH_SIZE rows per statement."""
+    columns = ", ".join(connection.ops.quote_name(model._meta.get_field(field).column) for field in fields)
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(connection.ops.quote_name(model._meta.db_table), columns,
+                                                   ", ".join(["%s"] * len(fields)))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), BATCH_SIZE):
+            cursor.executemany(sql, rows[start:start + BATCH_SIZE])
+
+
+def create_tokens(token_set, count, proxy_fraction=0.0):
+    """
+    Bulk create `count` auth tokens in the token set, spreading proxies evenly so that
+    `proxy_fraction` of them have one, and return the token set's voter tokens.
+    """
+    taken = set(AuthToken.objects.values_list('pk', flat=True))
+    ids = []
+    while len(ids) < count:
+        pk = random.randrange(10000000, 99999999)
+        if pk not in taken:
+            taken.add(pk)
+            ids.append(pk)
+    proxies = [math.floor((i + 1) * proxy_fraction) > math.floor(i * proxy_fraction) for i in range(count)]
+    insert_rows(AuthToken, ('id', 'token_set', 'has_proxy', 'active'),
+                [(pk, token_set.pk, proxy, True) for pk, proxy in zip(ids, proxies)])
+    insert_rows(VoterToken, ('auth_token', 'proxy'),
+                [(pk, False) for pk in ids] + [(pk, True) for pk, proxy in zip(ids, proxies) if proxy])
+    return list(VoterToken.objects.filter(auth_token__token_set=token_set).order_by('pk'))
+
+
+def create_vote(token_set, method, state=Vote.LIVE, candidates=0, **fields):
+    """
+    A vote with `candidates` candidates, besides None of the above, if it is STV; YNA
+    votes get their usual three options.
+    """
+    vote = Vote.objects.create(token_set=token_set, method=method, state=state, **fields)
+    if method == Vote.STV:
+        Option.objects.bulk_create(Option(vote=vote, name="candidate {}".format(i)) for i in range(candidates))
+    return vote
+
+
+def cast_ballots(vote, voter_tokens, turnout=1.0):
+    """Bulk insert a ballot in the vote for each of the voter tokens that turns out."""
+    options = list(vote.option_set.order_by('pk'))
+    voters = [token for token in voter_tokens if random.random() < turnout]
+    if vote.method == Vote.STV:
+        model = spars.Spars()
+        model.random(len(options))
+        # The same order as model.orderByDistance(), at a fraction of the cost
+        positions = [(option.pk, model.p[name]) for option, name in zip(options, model.c)]
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        rows = []
+        for token in voters:
+            voter = model.genCoord()
+            ranking = sorted(positions, key=lambda position: math.dist(voter, position[1]))
+            rows.append((vote.pk, token.pk, json.dumps([pk for pk, _ in ranking]), now))
+        insert_rows(RankedBallot, ('vote', 'token', 'preferences', 'modified_at'), rows)
+    else:
+        choices = random.choices(options, weights=spars.probDist(len(options)), k=len(voters))
+        insert_rows(BallotEntry, ('vote', 'option', 'token', 'value'),
+                    [(vote.pk, option.pk, token.pk, 1) for token, option in zip(voters, choices)])
+    return len(voters)
+
+
+def generate_meeting(name, voters, votes, stv_fraction=0.5, candidates=5, proxy_fraction=0.0, turnout=1.0):
+    """
+    A meeting of `voters` auth tokens and `votes` LIVE votes in random order, about
+    `stv_fraction` of them STV with `candidates` candidates and the rest YNA, each with
+    ballots from `turnout` of the voter tokens.
+    """
+    meeting = Meeting.objects.create(name=name)
+    token_set = meeting.tokenset_set.latest()
+    voter_tokens = create_tokens(token_set, voters, proxy_fraction)
+    stv_votes = round(votes * stv_fraction)
+    methods = [Vote.STV] * stv_votes + [Vote.YES_NO_ABS] * (votes - stv_votes)
+    random.shuffle(methods)
+    for n, method in enumerate(methods, 1):
+        vote = create_vote(token_set, method, candidates=candidates, name="{} vote {}".format(method, n),
+                           majority_threshold='simple', num_seats=1)
+        cast_ballots(vote, voter_tokens, turnout)
+    return meeting
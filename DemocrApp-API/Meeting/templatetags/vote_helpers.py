@@ -8,8 +8,8 @@ register = template.Library()
 
 
 @register.simple_tag(name="vote_action_button")
-def vote_action_button(vote):
-    args = [vote.token_set.meeting_id, vote.id]
+def vote_action_button(vote, meeting_id):
+    args = [meeting_id, vote.id]
 
     if vote.state == Vote.READY:
         return format_html("<a class='btn btn-sm btn-success' href='{}'>{}</a>",
@@ -43,17 +43,17 @@ def vote_action_button(vote):
 
 
 @register.simple_tag(name="vote_responses_or_remove")
-def vote_responses_or_remove(vote, token):
+def vote_responses_or_remove(vote, token, meeting_id, responses):
     if vote.state == Vote.READY:
         return format_html("""<form action='{}' method='POST'>
         <input type='hidden' name='csrfmiddlewaretoken' value='{}' />
         <input type='hidden' name='_method' value='DELETE'>
         <input class='btn btn-sm btn-danger' type='submit' value='Delete'>
         </form>""",
-            reverse('meeting/manage_vote', args=[vote.token_set.meeting_id, vote.id]),
+            reverse('meeting/manage_vote', args=[meeting_id, vote.id]),
             token)
     else:
-        return vote.responses()
+        return responses
 
 
 @register.simple_tag(name="option_remove_button")
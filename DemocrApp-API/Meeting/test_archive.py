@@ -0,0 +1,132 @@
+import re
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.utils import timezone
+
+from Meeting.models import Meeting, Vote, Option, VoterToken, BallotEntry, AuthToken, Session, RankedBallot, \
+    MeetingArchive
+
+
+class MeetingArchiveTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        self.client.force_login(User.objects.create(username="chair", is_superuser=True))
+        self.meeting = Meeting.objects.create(name="AGM 2019")
+        self.token_set = self.meeting.tokenset_set.latest()
+        self.auth_token = AuthToken.objects.create(token_set=self.token_set, has_proxy=True)
+        Session.objects.create(auth_token=self.auth_token)
+        self.voter, self.proxy = VoterToken.objects.filter(auth_token=self.auth_token).order_by('proxy')
+
+        self.yna = Vote.objects.create(token_set=self.token_set, name="Motion", method=Vote.YES_NO_ABS,
+                                       state=Vote.CLOSED, majority_threshold='simple',
+                                       results_data={"passed": True, "percentages": {"yes": 50}})
+        BallotEntry.objects.create(token=self.voter, option=self.yna.option_set.get(name='yes'), value=1)
+        BallotEntry.objects.create(token=self.proxy, option=self.yna.option_set.get(name='no'), value=1)
+
+        self.stv = Vote.objects.create(token_set=self.token_set, name="President", method=Vote.STV,
+                                       state=Vote.CLOSED, num_seats=1)
+        self.alice = Option.objects.create(vote=self.stv, name="Alice")
+        self.bob = Option.objects.create(vote=self.stv, name="Bob")
+        RankedBallot.objects.create(vote=self.stv, token=self.voter, preferences=[self.bob.pk, self.alice.pk])
+
+        self.meeting.close_time = timezone.now() - timedelta(days=400)
+        self.meeting.save()
+
+    def ballots(self, vote):
+        vote = Vote.objects.get(pk=vote.pk)
+        return sorted((token.proxy, [(entry.option.pk, entry.option.name, entry.value) for entry in entries])
+                      for token, entries in vote.ballots())
+
+    def test_archive_keeps_ballots_and_deletes_row_data(self):
+        before = {vote.pk: (self.ballots(vote), vote.responses(), vote.responses(exclude_proxies=True))
+                  for vote in (self.yna, self.stv)}
+
+        MeetingArchive.archive(self.meeting)
+
+        for model in (BallotEntry, RankedBallot, Session, VoterToken, AuthToken):
+            self.assertFalse(model.objects.exists(), model.__name__)
+        for vote in (self.yna, self.stv):
+            vote = Vote.objects.get(pk=vote.pk)
+            self.assertEqual((self.ballots(vote), vote.responses(), vote.responses(exclude_proxies=True)),
+                             before[vote.pk])
+
+    def get(self, url):
+        # Pages differ in their CSRF token from one request to the next
+        return re.sub(rb'name="csrfmiddlewaretoken" value="\w+"', b'', self.client.get(url).content)
+
+    def test_reports_serve_from_the_archive(self):
+        urls = [reverse('meeting/report/vote', args=[self.meeting.pk, self.stv.pk]),
+                reverse('meeting/report/meeting', args=[self.meeting.pk]),
+                reverse('meeting/report/meeting/json', args=[self.meeting.pk]),
+                reverse('meeting/report/vote', args=[self.meeting.pk, self.yna.pk]),
+                reverse('meeting/public_meeting_report', args=[self.token_set.public_id])]
+        before = [self.get(url) for url in urls]
+
+        MeetingArchive.archive(self.meeting)
+
+        self.assertEqual([self.get(url) for url in urls], before)
+        response = self.client.get(reverse('meeting/public_vote_report', args=[self.stv.public_id]))
+        self.assertContains(response, "Ballot 1", count=1)
+        self.assertContains(response, "1. Bob")
+        self.assertContains(response, "2. Alice")
+
+    def test_archive_queries_do_not_grow_with_tokens(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        def queries(tokens):
+            meeting = Meeting.objects.create(close_time=timezone.now())
+            for _ in range(tokens):
+                AuthToken.objects.create(token_set=meeting.tokenset_set.latest(), has_proxy=True)
+            with CaptureQueriesContext(connection) as captured:
+                MeetingArchive.archive(meeting)
+            return len(captured)
+
+        self.assertEqual(queries(2), queries(20))
+
+    def test_votes_read_their_meetings_archive_once(self):
+        MeetingArchive.archive(self.meeting)
+
+        # Prefetching, unlike select_related, gives the votes one meeting instance to share
+        votes = list(Vote.objects.filter(token_set__meeting=self.meeting).prefetch_related('token_set__meeting')
+                     .order_by('pk'))
+        self.assertTrue(all(vote.token_set.meeting is votes[0].token_set.meeting for vote in votes[1:]))
+        with self.assertNumQueries(1):
+            self.assertEqual([vote.archived()['id'] for vote in votes], [self.yna.pk, self.stv.pk])
+
+        # A vote loaded on its own finds the archive in one query, as before
+        with self.assertNumQueries(2):
+            vote = Vote.objects.get(pk=self.stv.pk)
+            self.assertEqual(vote.archived()['name'], "President")
+
+    def test_open_meetings_are_not_looked_up(self):
+        meeting = Meeting.objects.create()
+        vote = Vote.objects.create(token_set=meeting.tokenset_set.latest(), method=Vote.YES_NO_ABS,
+                                   state=Vote.CLOSED, majority_threshold='simple')
+        vote = Vote.objects.select_related('token_set__meeting').get(pk=vote.pk)
+        with self.assertNumQueries(0):
+            self.assertIsNone(vote.archived())
+
+    def test_archive_is_immutable(self):
+        archive = MeetingArchive.archive(self.meeting)
+        with self.assertRaises(ValueError):
+            archive.save()
+
+    def test_command_only_archives_meetings_closed_long_enough(self):
+        recent = Meeting.objects.create(name="Recent", close_time=timezone.now() - timedelta(days=10))
+        Meeting.objects.create(name="Open")
+
+        call_command('archive_meetings', stdout=StringIO())
+        self.assertEqual(list(MeetingArchive.objects.values_list('meeting', flat=True)), [self.meeting.pk])
+
+        call_command('archive_meetings', '--older-than', '7', '--dry-run', stdout=StringIO())
+        self.assertFalse(MeetingArchive.objects.filter(meeting=recent).exists())
+        call_command('archive_meetings', '--older-than', '7', stdout=StringIO())
+        self.assertTrue(MeetingArchive.objects.filter(meeting=recent).exists())
+        self.assertEqual(MeetingArchive.objects.count(), 2)
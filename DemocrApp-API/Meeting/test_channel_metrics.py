@@ -0,0 +1,62 @@
+import pytest
+from channels.exceptions import ChannelFull
+from django.contrib.auth.models import User
+from django.test import Client
+from django.urls import reverse
+
+from .channel_metrics import InstrumentedChannelLayer, layer_snapshot
+
+
+def instrumented_layer(capacity=2):
+    return InstrumentedChannelLayer("channels.layers.InMemoryChannelLayer", {"capacity": capacity})
+
+
+async def test_group_send_timing_and_drops():
+    layer = instrumented_layer()
+    quiet, flooded = await layer.new_channel(), await layer.new_channel()
+    await layer.group_add("meeting_1", quiet)
+    await layer.group_add("meeting_1", flooded)
+    for _ in range(2):
+        await layer.send(flooded, {"type": "vote.opening"})
+    with pytest.raises(ChannelFull):
+        await layer.send(flooded, {"type": "vote.opening"})
+
+    await layer.group_send("meeting_1", {"type": "vote.closing"})
+
+    counters = layer.counters()
+    assert counters["sends"] == 3
+    assert counters["send_drops"] == 1
+    assert counters["group_sends"]["meeting_1"]["count"] == 1
+    assert counters["group_sends"]["meeting_1"]["drops"] == 1
+    assert await layer.receive(quiet) == {"type": "vote.closing"}
+
+
+async def test_snapshot_reports_groups_and_queue_depth():
+    layer = instrumented_layer(capacity=10)
+    voters = [await layer.new_channel() for _ in range(3)]
+    for channel in voters:
+        await layer.group_add("meeting_7", channel)
+    await layer.group_add("session_6f1c2a4e-0000-4000-8000-000000000001", voters[0])
+    await layer.group_add("session_6f1c2a4e-0000-4000-8000-000000000002", voters[1])
+    await layer.group_send("meeting_7", {"type": "announcement", "message": "hi"})
+    await layer.send(voters[0], {"type": "boot"})
+
+    snapshot = await layer_snapshot(layer)
+
+    assert snapshot["capacity"] == 10
+    assert snapshot["groups"] == {"meeting_7": 3, "session_*": 2}
+    assert list(snapshot["queues"].values()) == [2, 1, 1]
+    assert snapshot["group_sends"]["meeting_7"]["count"] == 1
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint_requires_a_chair():
+    client = Client()
+    url = reverse('meeting/metrics/channels')
+    assert client.get(url).status_code == 302
+
+    client.force_login(User.objects.create(username="chair", is_superuser=True))
+    response = client.get(url)
+    assert response.status_code == 200
+    assert set(response.json()) == {"default", "control"}
+    assert "groups" in response.json()["default"]
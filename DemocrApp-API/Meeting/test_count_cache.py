@@ -0,0 +1,109 @@
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from openstv.ballots import Ballots
+from openstv.MethodPlugins.CambridgeSTV import CambridgeSTV
+from openstv.MethodPlugins.ScottishSTV import ScottishSTV
+from openstv.resultcache import ResultCache, DirectoryStore, fingerprint
+
+from Meeting.models import Meeting, Vote, Option, AuthToken, RankedBallot, CountCache
+from Meeting.voting_methods.stv import STV
+
+
+def make_ballots(rankings, names=("a", "b", "c"), seats=1):
+    ballots = Ballots()
+    ballots.setNames(list(names))
+    ballots.numSeats = seats
+    ballots.appendBallots(rankings)
+    return ballots
+
+
+class FingerprintTests(TestCase):
+    RANKINGS = [[0, 1], [2], [0, 1], [1, [0, 2]]]
+
+    def test_identical_elections_match_whatever_the_ballot_order(self):
+        key = fingerprint(make_ballots(self.RANKINGS), ScottishSTV, strongTieBreakMethod="manual")
+        self.assertEqual(key, fingerprint(make_ballots(self.RANKINGS[::-1]), ScottishSTV,
+                                          strongTieBreakMethod="manual"))
+        # Order matters to order dependent methods
+        self.assertNotEqual(fingerprint(make_ballots(self.RANKINGS), CambridgeSTV),
+                            fingerprint(make_ballots(self.RANKINGS[::-1]), CambridgeSTV))
+
+    def test_any_change_to_the_input_changes_the_fingerprint(self):
+        key = fingerprint(make_ballots(self.RANKINGS), ScottishSTV, strongTieBreakMethod="manual")
+        others = [
+            fingerprint(make_ballots(self.RANKINGS[:-1]), ScottishSTV, strongTieBreakMethod="manual"),
+            fingerprint(make_ballots(self.RANKINGS, names=("a", "b", "d")), ScottishSTV,
+                        strongTieBreakMethod="manual"),
+            fingerprint(make_ballots(self.RANKINGS, seats=2), ScottishSTV, strongTieBreakMethod="manual"),
+            fingerprint(make_ballots(self.RANKINGS), CambridgeSTV, strongTieBreakMethod="manual"),
+            fingerprint(make_ballots(self.RANKINGS), ScottishSTV, strongTieBreakMethod="index"),
+        ]
+        self.assertNotIn(key, others)
+        self.assertEqual(len(set(others)), len(others))
+
+    def test_directory_store(self):
+        with tempfile.TemporaryDirectory() as path:
+            cache = ResultCache(DirectoryStore(path))
+            count = mock.Mock(return_value={"report": "Winner is a."})
+            self.assertEqual(cache.fetch("key", count), {"report": "Winner is a."})
+            self.assertEqual(ResultCache(DirectoryStore(path)).fetch("key", count), {"report": "Winner is a."})
+            self.assertEqual(count.call_count, 1)
+            cache.invalidate("key")
+            self.assertIsNone(cache.get("key"))
+            cache.put("other", {})
+            cache.invalidate()
+            self.assertIsNone(cache.get("other"))
+
+
+@override_settings(VOTE_COUNT_WORKERS=0)
+class CountCacheTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        token_set = Meeting.objects.create().tokenset_set.latest()
+        self.votes = []
+        for _ in range(2):
+            vote = Vote.objects.create(token_set=token_set, method=Vote.STV, state=Vote.LIVE, num_seats=1)
+            alice = Option.objects.create(vote=vote, name="Alice").pk
+            bob = Option.objects.create(vote=vote, name="Bob").pk
+            for preferences in ([alice, bob], [alice], [bob]):
+                token = AuthToken.objects.create(token_set=token_set).votertoken_set.get()
+                RankedBallot.objects.create(vote=vote, token=token, preferences=preferences)
+            self.votes.append(vote)
+
+    def test_identical_ballots_are_counted_once(self):
+        with mock.patch.object(STV, 'run_election', wraps=STV.run_election) as run_election:
+            for vote in self.votes:
+                vote.close()
+            self.assertEqual(run_election.call_count, 1)
+
+            call_command('regenerate_stv_report', self.votes[0].pk, '--seats', '1', stdout=StringIO())
+            self.assertEqual(run_election.call_count, 1)
+            call_command('regenerate_stv_report', self.votes[0].pk, '--seats', '1', '--recount', stdout=StringIO())
+            self.assertEqual(run_election.call_count, 2)
+
+        first, second = [Vote.objects.get(pk=vote.pk) for vote in self.votes]
+        self.assertEqual(first.state, Vote.CLOSED)
+        self.assertEqual(second.state, Vote.CLOSED)
+        self.assertEqual(first.results_data, second.results_data)
+        self.assertEqual(first.results_data['winners'][0]['name'], "Alice")
+        self.assertEqual(first.count_record, second.count_record)
+        self.assertEqual(CountCache.objects.count(), 1)
+
+    def test_counts_with_chair_tie_breaks_are_not_reused(self):
+        def run_election(vote, ballots, **kwargs):
+            election = ScottishSTV(ballots)
+            election.strongTieBreakMethod = "index"
+            election.runElection()
+            election.tieDecisions = [[[1, 2], 1]]
+            return election
+
+        with mock.patch.object(STV, 'run_election', side_effect=run_election) as counted:
+            for vote in self.votes:
+                vote.close()
+        self.assertEqual(counted.call_count, 2)
+        self.assertFalse(CountCache.objects.exists())
@@ -0,0 +1,74 @@
+import json
+
+from django.test import TestCase, override_settings
+
+from openstv.ballots import Ballots
+from openstv.MethodPlugins.ScottishSTV import ScottishSTV
+
+from Meeting.models import Meeting, Vote, Option, AuthToken, RankedBallot, CountCache
+
+RANKINGS = [[0, 1, 2], [0, 2], [1, 0], [1], [2, 3], [3, 2, 1], [0, 3], [2, 1, 0], [3], [0, 1]]
+
+
+def count(profile):
+    ballots = Ballots()
+    ballots.setNames(["a", "b", "c", "d"])
+    ballots.numSeats = 2
+    ballots.appendBallots(RANKINGS)
+    election = ScottishSTV(ballots)
+    election.strongTieBreakMethod = "index"
+    if profile:
+        election.enableProfile()
+    election.runElection()
+    return election
+
+
+class CountProfileTests(TestCase):
+    def test_profile_times_each_phase_and_round(self):
+        plain, profiled = count(profile=False), count(profile=True)
+
+        self.assertEqual(profiled.winners, plain.winners)
+        self.assertEqual(profiled.count, plain.count)
+        self.assertEqual(profiled.msg, plain.msg)
+        data = json.loads(json.dumps(profiled.profile.data()))
+        self.assertEqual(set(data["phases"]), {"preCount", "countBallots", "postCount"})
+        self.assertEqual(len(data["rounds"]), profiled.numRounds)
+        first = data["rounds"][0]
+        self.assertEqual(first["action"], "first")
+        self.assertIn("initialVoteTally", first["seconds"])
+        self.assertEqual(first["votesHeld"], len(profiled.b.uniqueBallots))
+        transfers = data["rounds"][1:]
+        self.assertTrue(all(r["action"] in ("eliminate", "surplus") for r in transfers))
+        self.assertTrue(any(r["ballotsTouched"] for r in transfers))
+        self.assertEqual(data["peakVotesHeld"], max(r["votesHeld"] for r in data["rounds"]))
+
+    def test_unprofiled_counts_run_the_methods_untouched(self):
+        election = count(profile=False)
+        self.assertIsNone(election.profile)
+        self.assertNotIn("updateCount", vars(election))
+
+
+class ProfiledVoteTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        token_set = Meeting.objects.create().tokenset_set.latest()
+        self.vote = Vote.objects.create(token_set=token_set, method=Vote.STV, state=Vote.LIVE, num_seats=1)
+        alice = Option.objects.create(vote=self.vote, name="Alice").pk
+        bob = Option.objects.create(vote=self.vote, name="Bob").pk
+        for preferences in ([alice, bob], [alice], [bob]):
+            token = AuthToken.objects.create(token_set=token_set).votertoken_set.get()
+            RankedBallot.objects.create(vote=self.vote, token=token, preferences=preferences)
+
+    @override_settings(VOTE_COUNT_WORKERS=0, PROFILE_STV_COUNTS=True)
+    def test_profile_is_kept_with_the_results_but_not_cached(self):
+        self.vote.close()
+        self.vote.refresh_from_db()
+        self.assertEqual(self.vote.results_data["winners"][0]["name"], "Alice")
+        self.assertIn("countBallots", self.vote.results_data["profile"]["phases"])
+        self.assertNotIn("profile", CountCache.objects.get().results_data)
+
+    @override_settings(VOTE_COUNT_WORKERS=0)
+    def test_off_by_default(self):
+        self.vote.close()
+        self.vote.refresh_from_db()
+        self.assertNotIn("profile", self.vote.results_data)
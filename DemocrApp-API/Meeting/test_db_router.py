@@ -0,0 +1,72 @@
+from copy import copy
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from Meeting.models import Meeting, Vote
+
+
+@override_settings(REPORT_DATABASE='replica', REPLICA_CONSISTENCY_WINDOW=30)
+class ReplicaRoutingTests(TestCase):
+    """The 'replica' database stands in for a read replica, filled by hand to simulate lag."""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        self.client.force_login(User.objects.create(username="chair", is_superuser=True))
+        self.meeting = Meeting.objects.create(name="AGM", close_time=timezone.now() - timedelta(days=1))
+        self.token_set = self.meeting.tokenset_set.latest()
+        self.vote = Vote.objects.create(token_set=self.token_set, name="Motion", method=Vote.YES_NO_ABS,
+                                        state=Vote.CLOSED, majority_threshold='simple')
+        self.vote.closed_at = timezone.now() - timedelta(hours=1)
+        self.vote.save()
+
+    def replicate(self, **changes):
+        """Copy the meeting to the replica, with the given vote fields changed there."""
+        for obj in (self.meeting, self.token_set, self.vote, *self.vote.option_set.all()):
+            obj = copy(obj)
+            if isinstance(obj, Vote):
+                for field, value in changes.items():
+                    setattr(obj, field, value)
+            type(obj).objects.using('replica').bulk_create([obj])
+
+    def test_reports_read_from_the_replica(self):
+        self.replicate(name="Motion as replicated")
+        for url in (reverse('meeting/public_vote_report', args=[self.vote.public_id]),
+                    reverse('meeting/report/vote', args=[self.meeting.pk, self.vote.pk]),
+                    reverse('meeting/report/meeting', args=[self.meeting.pk])):
+            self.assertContains(self.client.get(url), "Motion as replicated")
+
+    def test_recently_closed_vote_is_read_from_the_primary(self):
+        # The replica hasn't seen the vote close yet
+        self.replicate(state=Vote.LIVE, closed_at=None)
+        self.vote.closed_at = timezone.now()
+        self.vote.save()
+
+        response = self.client.get(reverse('meeting/public_vote_report', args=[self.vote.public_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Motion")
+
+    def test_closing_a_vote_records_when(self):
+        vote = Vote.objects.create(token_set=self.token_set, name="Another", method=Vote.YES_NO_ABS)
+        self.assertIsNone(vote.closed_at)
+        vote.state = Vote.CLOSED
+        vote.save()
+        self.assertIsNotNone(vote.closed_at)
+
+    @override_settings(REPORT_DATABASE='default')
+    def test_reports_read_from_the_primary_without_a_replica(self):
+        response = self.client.get(reverse('meeting/public_vote_report', args=[self.vote.public_id]))
+        self.assertContains(response, "Motion")
+
+    def test_writes_go_to_the_primary(self):
+        self.replicate()
+        vote = Vote.objects.using('replica').get(pk=self.vote.pk)
+        vote.name = "Renamed"
+        vote.save()
+        self.assertEqual(Vote.objects.get(pk=self.vote.pk).name, "Renamed")
+        self.assertEqual(Vote.objects.using('replica').get(pk=self.vote.pk).name, "Motion")
@@ -0,0 +1,63 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from Meeting.models import Meeting, Vote, AuthToken, BallotEntry
+
+
+@override_settings(VOTE_COUNT_WORKERS=0, VOTE_COUNT_TIMEOUT=60)
+class LostCountTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create(username="chair", is_superuser=True))
+        self.meeting = Meeting.objects.create()
+        token_set = self.meeting.tokenset_set.latest()
+        self.vote = Vote.objects.create(token_set=token_set, method=Vote.YES_NO_ABS, state=Vote.LIVE,
+                                        majority_threshold='simple')
+        token = AuthToken.objects.create(token_set=token_set).votertoken_set.get()
+        BallotEntry.objects.create(vote=self.vote, token=token, option=self.vote.option_set.get(name="yes"), value=1)
+
+    def lose_count(self, minutes_ago):
+        # Frozen, but the count was never run
+        Vote.objects.filter(pk=self.vote.pk).update(
+            state=Vote.COUNTING, count_started_at=timezone.now() - timedelta(minutes=minutes_ago))
+
+    def test_progress_pushes_that_fail_do_not_stop_the_count(self):
+        # Only the manage pages' layer is down
+        with mock.patch('Meeting.models.get_channel_layer', side_effect=ConnectionError), \
+                mock.patch.object(Meeting, 'send_control'):
+            self.assertTrue(self.vote.close())
+        vote = Vote.objects.get(pk=self.vote.pk)
+        self.assertEqual(vote.state, Vote.CLOSED)
+        self.assertEqual(vote.results_data["yes"], 1)
+
+    def test_closing_again_requeues_a_lost_count(self):
+        url = reverse('meeting/close_vote', args=[self.meeting.pk, self.vote.pk])
+        self.lose_count(minutes_ago=0)
+        self.assertEqual(self.client.post(url).status_code, 302)
+        self.assertEqual(Vote.objects.get(pk=self.vote.pk).state, Vote.COUNTING)
+
+        self.lose_count(minutes_ago=2)
+        self.assertEqual(self.client.post(url).status_code, 302)
+        self.assertEqual(Vote.objects.get(pk=self.vote.pk).state, Vote.CLOSED)
+
+    def test_requeue_counts_command(self):
+        self.lose_count(minutes_ago=0)
+        out = StringIO()
+        call_command('requeue_counts', stdout=out)
+        self.assertIn("Requeued 0 count(s)", out.getvalue())
+
+        call_command('requeue_counts', '--older-than', '0', stdout=out)
+        self.assertIn("Requeued 1 count(s)", out.getvalue())
+        self.assertIn(f"Vote {self.vote.pk}: Closed", out.getvalue())
+
+    def test_votes_frozen_before_count_start_times_were_kept_are_requeued(self):
+        Vote.objects.filter(pk=self.vote.pk).update(state=Vote.COUNTING, count_started_at=None)
+        self.assertTrue(Vote.objects.get(pk=self.vote.pk).requeue_count())
+        self.assertEqual(Vote.objects.get(pk=self.vote.pk).state, Vote.CLOSED)
@@ -0,0 +1,157 @@
+import pytest
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import override_settings
+from django.urls import path
+
+from Meeting.models import *
+from .manage_consumer import ManageConsumer
+from .ui_consumer import UIConsumer
+
+application = URLRouter([
+    path("cast/manage/<int:meeting_id>", ManageConsumer.as_asgi()),
+])
+
+
+@pytest.mark.django_db(transaction=True)
+class TestManageDashboard:
+
+    def setup_method(self):
+        self.meeting = Meeting.objects.create(name="AGM")
+        self.token_set = self.meeting.tokenset_set.latest()
+        self.admin = User.objects.create(username="chair", is_superuser=True)
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(application, "/cast/manage/{}".format(self.meeting.pk))
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def connect_chair(self):
+        communicator, connected = await self.connect(self.admin)
+        assert connected
+        assert await communicator.receive_json_from() == {"type": "connected_voters", "count": 0}
+        return communicator
+
+    async def test_anonymous_users_are_refused(self):
+        communicator, connected = await self.connect(AnonymousUser())
+        assert not connected
+
+    async def test_vote_state_changes_are_pushed(self):
+        vote = await sync_to_async(Vote.objects.create)(token_set=self.token_set, name="motion",
+                                                        method=Vote.YES_NO_ABS, majority_threshold='simple')
+        communicator = await self.connect_chair()
+
+        vote.state = Vote.LIVE
+        await sync_to_async(vote.save)()
+        response = await communicator.receive_json_from()
+        assert response['type'] == 'vote_state'
+        assert response['vote_id'] == vote.pk
+        assert response['state'] == Vote.LIVE
+        assert 'Close Vote' in response['action']
+        await communicator.disconnect()
+
+    async def test_closing_the_meeting_pushes_count_progress(self):
+        vote = await sync_to_async(Vote.objects.create)(token_set=self.token_set, name="motion", state=Vote.LIVE,
+                                                        method=Vote.YES_NO_ABS, majority_threshold='simple')
+        communicator = await self.connect_chair()
+
+        with override_settings(VOTE_COUNT_WORKERS=0):
+            await sync_to_async(self.meeting.close)()
+        messages = [await communicator.receive_json_from() for _ in range(4)]
+        assert [message['type'] for message in messages] == ['vote_state', 'vote_progress', 'vote_progress',
+                                                             'vote_state']
+        assert all(message['vote_id'] == vote.pk for message in messages)
+        assert [message['status'] for message in messages[1:3]] == ["Queued for counting", "Counting"]
+        assert messages[-1]['state'] == Vote.CLOSED
+        await communicator.disconnect()
+
+    async def test_provisional_results_reach_chairs_not_voters(self):
+        from Meeting import provisional
+
+        @sync_to_async
+        def create_election():
+            vote = Vote.objects.create(token_set=self.token_set, method=Vote.STV, state=Vote.LIVE, num_seats=1)
+            alice = Option.objects.create(vote=vote, name="Alice")
+            session = Session.objects.create(auth_token=AuthToken.objects.create(token_set=self.token_set))
+            RankedBallot.objects.create(vote=vote, token=session.auth_token.votertoken_set.get(),
+                                        preferences=[alice.pk])
+            return vote, session
+
+        vote, session = await create_election()
+        chair = await self.connect_chair()
+        voter = WebsocketCommunicator(UIConsumer.as_asgi(), "")
+        await voter.connect()
+        await voter.send_json_to({'type': 'auth_request', 'session_token': str(session.id)})
+        # The auth response, then the open vote
+        while (await voter.receive_json_from())['type'] != 'ballot':
+            pass
+        assert (await chair.receive_json_from())['type'] == 'connected_voters'
+
+        await sync_to_async(provisional.recount)(self.meeting.pk, vote.pk)
+        pushed = await chair.receive_json_from()
+        assert pushed['type'] == 'provisional_results'
+        assert pushed['vote_id'] == vote.pk
+        assert pushed['results']['winners'][0]['name'] == "Alice"
+        assert await voter.receive_nothing()
+
+        await voter.disconnect()
+        await chair.disconnect()
+
+    async def test_voters_and_turnout_are_pushed(self):
+        @sync_to_async
+        def create_voter():
+            vote = Vote.objects.create(token_set=self.token_set, method=Vote.YES_NO_ABS, state=Vote.LIVE)
+            session = Session.objects.create(auth_token=AuthToken.objects.create(token_set=self.token_set))
+            return vote, session, str(vote.option_set.get(name='yes').pk)
+
+        vote, session, yes = await create_voter()
+        chair = await self.connect_chair()
+
+        voter = WebsocketCommunicator(UIConsumer.as_asgi(), "")
+        await voter.connect()
+        await voter.send_json_to({'type': 'auth_request', 'session_token': str(session.id)})
+        voter_token = (await voter.receive_json_from())['voters'][0]['token']
+        assert await chair.receive_json_from() == {"type": "connected_voters", "count": 1}
+
+        for _ in range(2):
+            await voter.send_json_to({'type': 'ballot_form', 'ballot_id': vote.pk,
+                                      'votes': {str(voter_token): {yes: 1}}})
+        assert await chair.receive_json_from() == {"type": "turnout", "vote_id": vote.pk, "delta": 1}
+
+        await voter.disconnect()
+        assert await chair.receive_json_from() == {"type": "connected_voters", "count": 0}
+        assert await chair.receive_nothing()
+        await chair.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestPushesAfterCommit:
+    def test_rolled_back_token_set_is_not_pushed(self):
+        from unittest import mock
+        from django.db import transaction
+
+        meeting = Meeting.objects.create()
+        with mock.patch.object(Meeting, 'send_control') as send_control:
+            with pytest.raises(RuntimeError):
+                with transaction.atomic():
+                    TokenSet.objects.create(meeting=meeting)
+                    raise RuntimeError
+            send_control.assert_not_called()
+            token_set = TokenSet.objects.create(meeting=meeting)
+        send_control.assert_called_once_with({"type": "token_set.rotated", "token_set_id": token_set.pk})
+
+    def test_saves_do_not_need_the_channel_layer(self, caplog):
+        from unittest import mock
+
+        with mock.patch('Meeting.models.get_channel_layer', side_effect=ConnectionError), \
+                mock.patch('Meeting.models.get_control_layer', side_effect=ConnectionError):
+            meeting = Meeting.objects.create()
+            vote = Vote.objects.create(token_set=meeting.tokenset_set.latest(), method=Vote.YES_NO_ABS)
+            vote.state = Vote.LIVE
+            vote.save()
+        assert Vote.objects.get(pk=vote.pk).state == Vote.LIVE
+        assert "Couldn't push the new token set of meeting {}".format(meeting.pk) in caplog.text
+        assert "Couldn't push vote.state to the managers of meeting {}".format(meeting.pk) in caplog.text
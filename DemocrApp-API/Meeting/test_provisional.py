@@ -0,0 +1,111 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from Meeting import provisional
+from Meeting.models import Meeting, Vote, Option, AuthToken, Session, RankedBallot
+from Meeting.ui_consumer import UIConsumer
+from Meeting.voting_methods.stv import STV
+
+
+class ProvisionalResultsTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        provisional._extracts.clear()
+        self.meeting = Meeting.objects.create()
+        self.token_set = self.meeting.tokenset_set.latest()
+        self.vote = Vote.objects.create(token_set=self.token_set, method=Vote.STV, state=Vote.LIVE, num_seats=1)
+        self.alice = Option.objects.create(vote=self.vote, name="Alice").pk
+        self.bob = Option.objects.create(vote=self.vote, name="Bob").pk
+        self.voters = [AuthToken.objects.create(token_set=self.token_set).votertoken_set.get().pk for _ in range(4)]
+        for voter, preferences in zip(self.voters, ([self.alice], [self.alice, self.bob], [self.bob])):
+            STV._save_ranking(self.vote, voter, preferences)
+
+    def recount(self):
+        with mock.patch.object(Meeting, 'notify_managers') as notify:
+            results = provisional.recount(self.meeting.pk, self.vote.pk)
+        return results, notify
+
+    def test_recount_pushes_results_to_managers_only(self):
+        results, notify = self.recount()
+
+        self.assertEqual(results['winners'][0]['name'], "Alice")
+        self.assertEqual(results['num_ballots'], 3)
+        notify.assert_called_once_with({"type": "vote.provisional", "vote_id": self.vote.pk, "results": results})
+        # Nothing is stored where voters or reports could see it
+        self.vote.refresh_from_db()
+        self.assertEqual(self.vote.state, Vote.LIVE)
+        self.assertFalse(self.vote.results_data)
+
+    def test_recount_fetches_only_changed_rankings(self):
+        self.recount()
+        # Rankings from well before the last recount aren't fetched again...
+        RankedBallot.objects.filter(vote=self.vote).update(modified_at=timezone.now() - timedelta(minutes=5))
+        RankedBallot.objects.filter(token_id=self.voters[0]).update(preferences=[self.bob])
+        # ...but new, changed and withdrawn ones are
+        STV._save_ranking(self.vote, self.voters[1], [self.bob, self.alice])
+        STV._save_ranking(self.vote, self.voters[2], [])
+        STV._save_ranking(self.vote, self.voters[3], [self.bob])
+
+        results, _ = self.recount()
+
+        names = provisional._extracts[self.vote.pk].names
+        rankings = {token_id: [names[c] for c in ranking]
+                    for token_id, ranking in provisional._extracts[self.vote.pk].rankings.items()}
+        self.assertEqual(rankings, {self.voters[0]: ["Alice"],
+                                    self.voters[1]: ["Bob", "Alice"],
+                                    self.voters[3]: ["Bob"]})
+        self.assertEqual(results['num_ballots'], 3)
+
+    def test_closed_votes_are_not_recounted_and_are_forgotten(self):
+        self.recount()
+        Vote.objects.filter(pk=self.vote.pk).update(state=Vote.COUNTING)
+
+        results, notify = self.recount()
+
+        self.assertIsNone(results)
+        notify.assert_not_called()
+        self.assertEqual(provisional._extracts, {})
+
+    @override_settings(PROVISIONAL_STV_INTERVAL=30)
+    def test_ballots_schedule_one_recount_until_it_runs(self):
+        with mock.patch.object(provisional, 'Timer') as timer:
+            provisional.ballots_changed(self.meeting.pk, self.vote.pk)
+            provisional.ballots_changed(self.meeting.pk, self.vote.pk)
+            self.assertEqual(timer.call_count, 1)
+            self.assertEqual(timer.call_args[0][0], 30)
+
+            with mock.patch.object(provisional, 'recount') as recount, \
+                    mock.patch.object(provisional, 'close_old_connections'):
+                provisional._work(self.meeting.pk, self.vote.pk)
+            recount.assert_called_once_with(self.meeting.pk, self.vote.pk)
+            provisional.ballots_changed(self.meeting.pk, self.vote.pk)
+            self.assertEqual(timer.call_count, 2)
+        provisional._scheduled.clear()
+
+    def test_ranked_ballots_trigger_a_recount(self):
+        auth_token = AuthToken.objects.get(votertoken__pk=self.voters[3])
+        consumer = UIConsumer()
+        consumer.session_id = Session.objects.create(auth_token=auth_token).pk
+        consumer.auth_token_id = auth_token.pk
+        consumer.meeting_id = self.meeting.pk
+        consumer.voter_tokens = (self.voters[3],)
+        consumer.token_set_id = self.token_set.pk
+        consumer.token_valid = True
+        consumer.send_json = lambda message: None
+        motion = Vote.objects.create(token_set=self.token_set, method=Vote.YES_NO_ABS, state=Vote.LIVE)
+
+        with mock.patch.object(provisional, 'ballots_changed') as ballots_changed:
+            consumer.cast_ballots([
+                {'ballot_id': self.vote.pk, 'votes': {str(self.voters[3]): {str(self.bob): 1}}},
+                {'ballot_id': motion.pk, 'votes': {str(self.voters[3]): {str(motion.option_set.first().pk): 1}}},
+            ])
+
+        ballots_changed.assert_called_once_with(self.meeting.pk, self.vote.pk)
+
+    def test_off_by_default(self):
+        with mock.patch.object(provisional, 'Timer') as timer:
+            provisional.ballots_changed(self.meeting.pk, self.vote.pk)
+        timer.assert_not_called()
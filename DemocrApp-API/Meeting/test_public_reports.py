@@ -1,7 +1,7 @@
 from django.test import TestCase, Client
 from django.urls import reverse
 
-from Meeting.models import Meeting, TokenSet, Vote, Option, VoterToken, BallotEntry, AuthToken
+from Meeting.models import Meeting, TokenSet, Vote, Option, VoterToken, BallotEntry, AuthToken, RankedBallot
 
 
 class PublicReportTestCase(TestCase):
@@ -63,6 +63,26 @@ class PublicVoteReportTests(PublicReportTestCase):
         # Verify ballots are anonymized (no voter token IDs in ballot display)
         self.assertNotContains(response, f"Token {self.voter_token.pk}")
 
+    def test_public_vote_report_groups_each_ranking_into_one_ballot(self):
+        """Test that an STV ranking stored as one row is shown as a single ballot"""
+        vote = Vote.objects.create(
+            token_set=self.token_set,
+            name="STV Vote",
+            method=Vote.STV,
+            state=Vote.CLOSED,
+            num_seats=1
+        )
+        alice = Option.objects.create(vote=vote, name="Alice")
+        bob = Option.objects.create(vote=vote, name="Bob")
+        RankedBallot.objects.create(vote=vote, token=self.voter_token, preferences=[bob.pk, alice.pk])
+
+        response = self.client.get(reverse('meeting/public_vote_report', args=[vote.public_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Ballot 1", count=1)
+        self.assertNotContains(response, "Ballot 2")
+        self.assertContains(response, "1. Bob")
+        self.assertContains(response, "2. Alice")
+
 
 class PublicMeetingReportTests(PublicReportTestCase):
     def test_public_meeting_report_accessible(self):
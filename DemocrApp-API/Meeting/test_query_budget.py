@@ -0,0 +1,306 @@
+"""
+Query budgets for every URL in Meeting/urls.py and every UIConsumer message.
+
+Each case runs against meetings of several sizes and must issue the same number of
+queries at every size, within its budget, so an N+1 fails here like a functional bug
+would, with the query log of each size attached.
+
+Endpoints whose work is inherently per item hold the item count fixed across sizes and
+vary everything else (creating tokens saves each one).
+"""
+from dataclasses import dataclass
+from unittest import mock
+
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from openstv.ballots import Ballots
+
+from Meeting.models import Meeting, Vote, AuthToken, Session, Tie, get_control_layer
+from Meeting.synthetic import create_tokens, create_vote, cast_ballots
+from Meeting.ui_consumer import UIConsumer
+from Meeting.voting_methods.stv import STV
+
+
+@dataclass(frozen=True)
+class Size:
+    voters: int
+    votes: int
+    options: int
+
+
+SIZES = [Size(voters=2, votes=1, options=2), Size(voters=12, votes=4, options=7)]
+
+
+class Seed:
+    """
+    A meeting of the given size from Meeting.synthetic: auth tokens (every other one
+    with a proxy), each with a connected and a disconnected session, and `votes` votes
+    of each method in each of the READY, LIVE and CLOSED states, plus one STV vote
+    waiting on a tie break. Every voter has a ballot in every LIVE and CLOSED vote.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.meeting = Meeting.objects.create(name="Budget {}".format(size.voters))
+        self.token_set = self.meeting.tokenset_set.latest()
+        self.voter_tokens = create_tokens(self.token_set, size.voters, proxy_fraction=0.5)
+        self.auth_tokens = list(AuthToken.objects.filter(token_set=self.token_set).order_by('-has_proxy', 'pk'))
+        self.sessions = []
+        for n, auth_token in enumerate(self.auth_tokens):
+            Session.objects.create(auth_token=auth_token, channel="specific.other{}".format(n))
+            self.sessions.append(Session.objects.create(auth_token=auth_token))
+
+        self.votes = {}
+        for state in (Vote.READY, Vote.LIVE, Vote.CLOSED):
+            for method in (Vote.YES_NO_ABS, Vote.STV):
+                self.votes[method, state] = [self.add_vote(method, state) for _ in range(size.votes)]
+        self.tied = self.add_vote(Vote.STV, Vote.NEEDS_TIE_BREAKER)
+        Tie.objects.bulk_create(Tie(vote=self.tied, option=option) for option in self.tied.option_set.all())
+
+    def add_vote(self, method, state):
+        vote = create_vote(self.token_set, method, state, candidates=self.size.options,
+                           name="{} {}".format(method, state), majority_threshold='simple', num_seats=1)
+        if method == Vote.STV:
+            vote.results_data = {"winners": [{"name": "candidate 0", "order": 1, "round": 1}]}
+        else:
+            vote.results_data = {"passed": True, "percentages": {"yes": 100}}
+        vote.save()
+        if state in (Vote.LIVE, Vote.CLOSED, Vote.NEEDS_TIE_BREAKER):
+            cast_ballots(vote, self.voter_tokens)
+        return vote
+
+    def vote(self, method, state):
+        return self.votes[method, state][0]
+
+
+class QueryBudgetTestCase(TestCase):
+    def assertBudget(self, budget, run, prepare=None):
+        """
+        Run `run(seed)` once per size and require the same query count at every size,
+        at most `budget`. `budget` may be a function of the seed for per-item endpoints.
+        `prepare(seed)`, if given, runs uncounted first and its result is passed to
+        `run` in place of the seed.
+        """
+        logs = []
+        for size in SIZES:
+            seed = Seed(size)
+            limit = budget(seed) if callable(budget) else budget
+            argument = prepare(seed) if prepare else seed
+            with CaptureQueriesContext(connection) as queries:
+                run(argument)
+            logs.append((size, limit, [query['sql'] for query in queries.captured_queries]))
+        # Per-item budgets grow with the items, so compare what is left over
+        overheads = {len(sql) - (limit if callable(budget) else 0) for _, limit, sql in logs}
+        if len(overheads) > 1 or any(len(sql) > limit for _, limit, sql in logs):
+            report = ["Query budget exceeded or depends on meeting size:"]
+            for size, limit, sql in logs:
+                report.append("\n{} -> {} queries (budget {}):".format(size, len(sql), limit))
+                report += ["  {}. {}".format(n, query) for n, query in enumerate(sql, 1)]
+            self.fail("\n".join(report))
+
+
+class ViewQueryBudgets(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        self.client.force_login(User.objects.create(username="chair", is_superuser=True))
+        # The first page rendering a CSRF token saves the session; keep that out of the counts
+        self.client.get(reverse('meeting/manage', args=[Meeting.objects.create().pk]))
+
+    def get(self, name, *args, **kwargs):
+        response = self.client.get(reverse(name, args=args), **kwargs)
+        self.assertLess(response.status_code, 400, response.content[:500])
+        return response
+
+    def post(self, name, args, data):
+        response = self.client.post(reverse(name, args=args), data)
+        self.assertLess(response.status_code, 400, response.content[:500])
+        return response
+
+    def test_check_token(self):
+        self.assertBudget(7, lambda seed: self.post('meeting/token_check', [seed.meeting.pk],
+                                                     {'token': seed.auth_tokens[0].pk}))
+
+    def test_detail(self):
+        self.assertBudget(5, lambda seed: self.get('meeting/detail', seed.meeting.pk))
+
+    def test_new_vote(self):
+        self.assertBudget(10, lambda seed: self.post('meeting/new_vote', [seed.meeting.pk],
+                                                      {'name': 'n', 'description': 'd', 'method': Vote.STV}))
+
+    def test_close_meeting(self):
+        # Counts go to the count pool, so only the request's own queries are counted here
+        def with_ready_votes(seed):
+            # More READY votes, which are deleted in bulk; few enough that their options fit
+            # in one of Django's delete batches of 100
+            for _ in range(3 * seed.size.votes):
+                seed.add_vote(Vote.YES_NO_ABS, Vote.READY)
+            return seed
+
+        with mock.patch('Meeting.counting.submit'):
+            self.assertBudget(21, lambda seed: self.post('meeting/close', [seed.meeting.pk], {}))
+            self.assertBudget(21, lambda seed: self.post('meeting/close', [seed.meeting.pk], {}),
+                              prepare=with_ready_votes)
+
+    def test_open_vote(self):
+        self.assertBudget(10, lambda seed: self.get('meeting/open_vote', seed.meeting.pk,
+                                                    seed.vote(Vote.STV, Vote.READY).pk))
+
+    def test_close_vote(self):
+        self.assertBudget(20, lambda seed: self.get('meeting/close_vote', seed.meeting.pk,
+                                                    seed.vote(Vote.YES_NO_ABS, Vote.LIVE).pk))
+
+    def test_close_vote_forms(self):
+        self.assertBudget(4, lambda seed: self.get('meeting/close_vote/stv', seed.meeting.pk,
+                                                   seed.vote(Vote.STV, Vote.LIVE).pk))
+        self.assertBudget(4, lambda seed: self.get('meeting/close_vote/yna', seed.meeting.pk,
+                                                   seed.vote(Vote.YES_NO_ABS, Vote.LIVE).pk))
+
+    def test_break_tie(self):
+        self.assertBudget(6, lambda seed: self.get('meeting/break_tie', seed.meeting.pk, seed.tied.pk))
+        self.assertBudget(10, lambda args: self.post('meeting/break_tie', args[:2], {'winner_id': args[2]}),
+                          prepare=lambda seed: (seed.meeting.pk, seed.tied.pk, seed.tied.option_set.first().pk))
+
+    def test_manage_meeting(self):
+        self.assertBudget(5, lambda seed: self.get('meeting/manage', seed.meeting.pk))
+
+    def test_manage_vote(self):
+        self.assertBudget(7, lambda seed: self.get('meeting/manage_vote', seed.meeting.pk,
+                                                   seed.vote(Vote.STV, Vote.READY).pk))
+        self.assertBudget(15, lambda seed: self.post('meeting/manage_vote', [seed.meeting.pk,
+                                                                             seed.vote(Vote.STV, Vote.READY).pk],
+                                                     {'_method': 'DELETE'}))
+
+    def test_announcement(self):
+        self.assertBudget(3, lambda seed: self.post('meeting/announcement', [seed.meeting.pk], {'message': 'hi'}))
+
+    def test_options(self):
+        self.assertBudget(7, lambda seed: self.post('meeting/add_vote_option',
+                                                    [seed.meeting.pk, seed.vote(Vote.STV, Vote.READY).pk],
+                                                    {'name': 'new candidate'}))
+        self.assertBudget(10, lambda args: self.post('meeting/remove_vote_option', args[:2], {'id': args[2]}),
+                          prepare=lambda seed: (seed.meeting.pk, seed.vote(Vote.STV, Vote.READY).pk,
+                                                seed.vote(Vote.STV, Vote.READY).option_set.last().pk))
+
+    def test_update_vote_field(self):
+        self.assertBudget(8, lambda seed: self.post('meeting/update_vote_field',
+                                                    [seed.meeting.pk, seed.vote(Vote.STV, Vote.READY).pk],
+                                                    {'num_seats': 2}))
+
+    def test_get_ballot_candidates(self):
+        self.assertBudget(7, lambda seed: self.get('meeting/get_ballot_candidates', seed.meeting.pk,
+                                                   seed.vote(Vote.STV, Vote.LIVE).pk))
+
+    def test_tokens(self):
+        # One insert per token requested, so the amount stays fixed
+        self.assertBudget(15, lambda seed: self.post('meeting/create_token', [seed.meeting.pk],
+                                                     {'proxy': 'true', 'amount': 2}))
+        self.assertBudget(7, lambda seed: self.post('meeting/deactivate_token', [seed.meeting.pk],
+                                                    {'key': seed.auth_tokens[0].pk}))
+
+    def test_reports(self):
+        self.assertBudget(3, lambda seed: self.get('meeting/report'))
+        self.assertBudget(7, lambda seed: self.get('meeting/report/meeting', seed.meeting.pk))
+        self.assertBudget(6, lambda seed: self.get('meeting/report/meeting/json', seed.meeting.pk))
+        self.assertBudget(6, lambda seed: self.get('meeting/report/meeting/yaml', seed.meeting.pk))
+        self.assertBudget(10, lambda seed: self.get('meeting/report/vote', seed.meeting.pk,
+                                                   seed.vote(Vote.STV, Vote.CLOSED).pk))
+
+    def test_report_files(self):
+        ballots = Ballots()
+        ballots.setNames(["a", "b"])
+        ballots.numSeats = 1
+        ballots.appendBallots([[0], [0], [1]])
+        record = STV.report(STV.run_election(None, ballots, progress=False), 1)["record"]
+
+        def counted(seed):
+            # Downloads are rendered from a count's election record, which the seed's made-up
+            # results don't have; renders aren't cached yet
+            vote = seed.vote(Vote.STV, Vote.CLOSED)
+            Vote.objects.filter(pk=vote.pk).update(count_record=record)
+            cache.clear()
+            return seed.meeting.pk, vote.pk
+
+        for extension in ('txt', 'csv', 'yaml'):
+            self.assertBudget(3, lambda primed: self.get('meeting/report/vote/file', *primed, extension),
+                              prepare=counted)
+
+    def test_public_reports(self):
+        self.assertBudget(6, lambda seed: self.get('meeting/public_vote_report',
+                                                   seed.vote(Vote.STV, Vote.CLOSED).public_id))
+        self.assertBudget(6, lambda seed: self.get('meeting/public_meeting_report', seed.token_set.public_id))
+
+    def test_lists(self):
+        self.assertBudget(2, lambda seed: self.get('meeting/list'))
+        self.assertBudget(3, lambda seed: self.get('meeting/kiosk_redirect'))
+        self.assertBudget(2, lambda seed: self.get('meeting/metrics/channels'))
+
+
+class ConsumerQueryBudgets(QueryBudgetTestCase):
+    """UIConsumer handlers driven directly, as the channel layer would dispatch them."""
+
+    def consumer(self, seed, authenticated=True):
+        consumer = UIConsumer()
+        consumer.channel_layer = get_channel_layer()
+        consumer.control_layer = get_control_layer()
+        consumer.channel_name = consumer.control_channel_name = "specific.budget"
+        consumer.base_send = lambda message: None
+        consumer.replies = []
+        consumer.send_json = consumer.replies.append
+        if authenticated:
+            consumer.receive_json({'type': 'auth_request', 'session_token': str(seed.sessions[0].pk)})
+        return consumer
+
+    def primed(self, seed):
+        """An authenticated consumer for the seed, set up before counting starts."""
+        consumer = self.consumer(seed)
+        self.assertEqual(consumer.replies[0]['result'], 'success')
+        return consumer, seed
+
+    def assertHandlerBudget(self, budget, handler):
+        self.assertBudget(budget, lambda primed: handler(*primed), prepare=self.primed)
+
+    def test_auth_request(self):
+        # One of them re-reads the token once the socket has joined its control groups
+        self.assertBudget(11, lambda seed: self.consumer(seed))
+
+    def test_ballot_form(self):
+        def cast(consumer, seed):
+            vote = seed.vote(Vote.STV, Vote.LIVE)
+            options = list(vote.option_set.values_list('pk', flat=True))
+            consumer.receive_json({'type': 'ballot_form', 'ballot_id': vote.pk,
+                                   'votes': {str(consumer.voter_tokens[0]): {str(o): str(n) for n, o in
+                                                                             enumerate(options, 1)}}})
+            self.assertIn('voter_token', consumer.replies[-1])
+        # One of them checks the token is still active
+        self.assertHandlerBudget(7, cast)
+
+    def test_ballot_batch(self):
+        def cast(consumer, seed):
+            yna = seed.vote(Vote.YES_NO_ABS, Vote.LIVE)
+            stv = seed.vote(Vote.STV, Vote.LIVE)
+            yes = yna.option_set.get(name='yes').pk
+            first = stv.option_set.first().pk
+            consumer.receive_json({'type': 'ballot_batch', 'ballots': [
+                {'ballot_id': yna.pk, 'votes': {str(token): {str(yes): 1} for token in consumer.voter_tokens}},
+                {'ballot_id': stv.pk, 'votes': {str(token): {str(first): 1} for token in consumer.voter_tokens}},
+            ]})
+            self.assertEqual(consumer.replies[-1]['type'], 'batch_receipt')
+        self.assertHandlerBudget(16, cast)
+
+    def test_bad_message(self):
+        self.assertHandlerBudget(0, lambda consumer, seed: consumer.receive_json({'type': 'nonsense'}))
+
+    def test_events(self):
+        self.assertHandlerBudget(3, lambda consumer, seed: consumer.vote_opening(
+            {'vote_id': seed.vote(Vote.STV, Vote.LIVE).pk}))
+        self.assertHandlerBudget(0, lambda consumer, seed: consumer.vote_closing({'vote_id': 1}))
+        self.assertHandlerBudget(0, lambda consumer, seed: consumer.announcement({'message': 'hi'}))
+        self.assertHandlerBudget(2, lambda consumer, seed: consumer.boot({}))
+        self.assertHandlerBudget(1, lambda consumer, seed: consumer.token_revoked({}))
+        self.assertHandlerBudget(1, lambda consumer, seed: consumer.token_set_rotated({'token_set_id': 0}))
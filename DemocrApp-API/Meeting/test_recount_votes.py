@@ -0,0 +1,127 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from Meeting.management.commands.recount_votes import differences
+from Meeting.models import Meeting, Vote, Option, AuthToken, RankedBallot, BallotEntry, MeetingArchive
+from Meeting.voting_methods.vote_method import VoteMethod
+
+
+def recount_votes(*args):
+    out = StringIO()
+    call_command('recount_votes', *args, '--workers', '0', stdout=out)
+    return out.getvalue()
+
+
+class DifferencesTests(TestCase):
+    def test_lists_each_difference_by_path(self):
+        stored = {"yes": 3, "winners": [{"name": "Alice"}], "profile": {"seconds": 1}}
+        recomputed = {"yes": 4, "winners": [{"name": "Bob"}], "seats": 1, "profile": {"seconds": 2}}
+        self.assertEqual(differences(stored, recomputed), [
+            "seats: None != 1",
+            "winners[0].name: 'Alice' != 'Bob'",
+            "yes: 3 != 4",
+        ])
+        self.assertEqual(differences(stored, stored), [])
+
+    def test_method_classes_must_implement_recompute(self):
+        with self.assertRaisesMessage(TypeError, "doesn't implement recompute"):
+            class Unfinished(VoteMethod):
+                pass
+
+
+@override_settings(VOTE_COUNT_WORKERS=0)
+class RecountVotesTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.meeting = Meeting.objects.create()
+        token_set = self.meeting.tokenset_set.latest()
+        self.stv = Vote.objects.create(token_set=token_set, method=Vote.STV, state=Vote.LIVE, num_seats=1)
+        alice = Option.objects.create(vote=self.stv, name="Alice").pk
+        bob = Option.objects.create(vote=self.stv, name="Bob").pk
+        self.yna = Vote.objects.create(token_set=token_set, method=Vote.YES_NO_ABS, state=Vote.LIVE,
+                                       majority_threshold='simple')
+        yes = self.yna.option_set.get(name="yes")
+        no = self.yna.option_set.get(name="no")
+        for preferences, choice in (([alice, bob], yes), ([alice], yes), ([bob], no)):
+            token = AuthToken.objects.create(token_set=token_set).votertoken_set.get()
+            RankedBallot.objects.create(vote=self.stv, token=token, preferences=preferences)
+            BallotEntry.objects.create(vote=self.yna, token=token, option=choice, value=1)
+        self.stv.close()
+        self.yna.close()
+
+    def test_dry_run_matches_stored_results(self):
+        output = recount_votes('--all', '--dry-run')
+        self.assertIn("Checking 2 closed vote(s)", output)
+        self.assertIn(f"vote {self.stv.pk}: matches", output)
+        self.assertIn(f"vote {self.yna.pk}: matches", output)
+        self.assertIn("Done: 2 matches", output)
+
+    def test_dry_run_reports_differences_and_changes_nothing(self):
+        Vote.objects.filter(pk=self.yna.pk).update(results_data=dict(Vote.objects.get(pk=self.yna.pk).results_data,
+                                                                     yes=5))
+        output = recount_votes(str(self.yna.pk), '--dry-run')
+        self.assertIn(f"vote {self.yna.pk}: differs", output)
+        self.assertIn("    yes: 5 != 2", output)
+        self.assertEqual(Vote.objects.get(pk=self.yna.pk).results_data["yes"], 5)
+
+    def test_recount_stores_fresh_results(self):
+        Vote.objects.filter(pk=self.yna.pk).update(majority_threshold='two_thirds')
+        BallotEntry.objects.filter(vote=self.yna, option__name="no").delete()
+        Vote.objects.filter(pk=self.stv.pk).update(num_seats=None)
+
+        output = recount_votes('--meeting', str(self.meeting.pk), '--recount')
+        self.assertIn("Done: 2 recounted", output)
+        yna = Vote.objects.get(pk=self.yna.pk)
+        self.assertEqual(yna.state, Vote.CLOSED)
+        self.assertEqual((yna.results_data["yes"], yna.results_data["no"]), (2, 0))
+        self.assertEqual(yna.results_data["majority_threshold"], 'two_thirds')
+        stv = Vote.objects.get(pk=self.stv.pk)
+        self.assertEqual(stv.state, Vote.CLOSED)
+        self.assertEqual(stv.num_seats, 1)
+        self.assertEqual(stv.results_data["winners"][0]["name"], "Alice")
+
+    def test_only_closed_votes_of_the_method(self):
+        output = recount_votes('--all', '--method', Vote.STV, '--dry-run')
+        self.assertIn("Checking 1 closed vote(s)", output)
+        self.assertNotIn(f"vote {self.yna.pk}:", output)
+        Vote.objects.filter(pk=self.stv.pk).update(state=Vote.LIVE)
+        self.assertIn("Done: nothing to do", recount_votes(str(self.stv.pk)))
+
+    def test_archived_votes_are_checked_against_their_snapshot_and_never_recounted(self):
+        stored = {vote.pk: Vote.objects.get(pk=vote.pk).results_data for vote in (self.stv, self.yna)}
+        self.meeting.close_time = timezone.now() - timedelta(days=1)
+        self.meeting.save()
+        MeetingArchive.archive(self.meeting)
+
+        output = recount_votes('--all', '--dry-run')
+        self.assertIn("Done: 2 matches", output)
+
+        output = recount_votes('--all')
+        self.assertIn("Done: 2 skipped", output)
+        self.assertIn("meeting is archived", output)
+        for vote in Vote.objects.filter(pk__in=stored):
+            self.assertEqual(vote.state, Vote.CLOSED)
+            self.assertEqual(vote.results_data, stored[vote.pk])
+        with self.assertRaises(ValueError):
+            Vote.objects.get(pk=self.yna.pk).reopen(majority_threshold='simple')
+
+    def test_reopening_clears_the_results_until_the_vote_is_counted_again(self):
+        self.assertIsNotNone(Vote.objects.get(pk=self.stv.pk).report("text"))
+        stv = Vote.objects.get(pk=self.stv.pk)
+        self.assertTrue(stv.reopen(num_seats=1))
+        self.assertEqual((stv.state, stv.closed_at, stv.count_record), (Vote.LIVE, None, None))
+        self.assertEqual((stv.results, stv.results_data), ('', {}))
+        self.assertIsNone(stv.report("text"))
+
+        stv.close()
+        stv = Vote.objects.get(pk=self.stv.pk)
+        self.assertIn("Alice", stv.report("text"))
+
+    def test_needs_a_selection(self):
+        with self.assertRaises(CommandError):
+            recount_votes()
@@ -0,0 +1,96 @@
+import json
+from contextlib import redirect_stdout
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from openstv.ballots import Ballots
+from openstv.MethodPlugins.ERS97STV import ERS97STV
+from openstv.MethodPlugins.ScottishSTV import ScottishSTV
+from openstv.record import recordElection, ElectionRecord
+
+from Meeting.models import Meeting, Vote, Option, AuthToken, RankedBallot
+from Meeting.voting_methods.stv import STV
+
+RANKINGS = [[0, 1, 2], [0, 2], [1, 0], [1], [2, 3], [3, 2, 1], [0, 3], [2, 1, 0], [3], [0, 1]]
+
+
+class ElectionRecordTests(TestCase):
+    def test_reports_render_the_same_from_the_record(self):
+        for method in (ScottishSTV, ERS97STV):
+            ballots = Ballots()
+            ballots.setNames(["a", "b", "c", "d"])
+            ballots.numSeats = 2
+            ballots.appendBallots(RANKINGS)
+            election = method(ballots)
+            election.strongTieBreakMethod = "index"
+            election.runElection()
+            record = ElectionRecord(json.loads(json.dumps(recordElection(election))))
+
+            for report in STV.REPORTS.values():
+                direct, recorded = report(election), report(record)
+                direct.generateReport()
+                recorded.generateReport()
+                self.assertEqual(recorded.outputText, direct.outputText, (method, report))
+
+    def test_reports_only_print_to_a_given_file(self):
+        ballots = Ballots()
+        ballots.setNames(["a", "b"])
+        ballots.appendBallots([[0], [1], [0]])
+        election = ScottishSTV(ballots)
+        election.runElection()
+        stdout, output = StringIO(), StringIO()
+        with redirect_stdout(stdout):
+            quiet = STV.REPORTS["text"](election)
+            quiet.generateReport()
+            loud = STV.REPORTS["text"](election, outputFile=output)
+            loud.generateReport()
+        self.assertEqual(stdout.getvalue(), "")
+        self.assertEqual(output.getvalue(), quiet.outputText)
+
+
+@override_settings(VOTE_COUNT_WORKERS=0)
+class LazyReportTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.meeting = Meeting.objects.create()
+        token_set = self.meeting.tokenset_set.latest()
+        self.vote = Vote.objects.create(token_set=token_set, method=Vote.STV, state=Vote.LIVE, num_seats=1)
+        alice = Option.objects.create(vote=self.vote, name="Alice").pk
+        bob = Option.objects.create(vote=self.vote, name="Bob").pk
+        for preferences in ([alice, bob], [alice], [bob]):
+            token = AuthToken.objects.create(token_set=token_set).votertoken_set.get()
+            RankedBallot.objects.create(vote=self.vote, token=token, preferences=preferences)
+        self.vote.close()
+
+    def test_close_stores_the_record_and_html_is_rendered_once(self):
+        vote = Vote.objects.get(pk=self.vote.pk)
+        self.assertEqual(vote.state, Vote.CLOSED)
+        self.assertEqual(vote.results, "")
+        self.assertEqual(vote.count_record["election"]["winners"], [1])
+
+        html = vote.report_html
+        self.assertIn("Alice", html)
+        self.assertIn('<h3>Winners</h3>', html)
+        self.assertEqual(Vote.objects.get(pk=vote.pk).results, html)
+        with self.assertNumQueries(0):
+            self.assertEqual(vote.report_html, html)
+
+    def test_report_files(self):
+        url = reverse('meeting/report/vote/file', args=[self.meeting.pk, self.vote.pk, 'txt'])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertIn("Winner is Alice.", response.content.decode())
+
+        response = self.client.get(reverse('meeting/report/vote/file', args=[self.meeting.pk, self.vote.pk, 'csv']))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('meeting/report/vote/file', args=[self.meeting.pk, self.vote.pk, 'pdf']))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('meeting/report/vote/file', args=[self.meeting.pk + 1, self.vote.pk, 'txt']))
+        self.assertEqual(response.status_code, 404)
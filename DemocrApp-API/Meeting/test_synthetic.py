@@ -0,0 +1,53 @@
+import random
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from Meeting.models import Meeting, AuthToken, VoterToken, Vote, BallotEntry, RankedBallot
+from Meeting.synthetic import generate_meeting
+
+
+class SyntheticMeetingTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        random.seed(0)
+
+    def test_generates_tokens_votes_and_valid_ballots(self):
+        meeting = generate_meeting("Synthetic", voters=40, votes=6, stv_fraction=0.5, candidates=4,
+                                   proxy_fraction=0.25, turnout=1.0)
+
+        self.assertEqual(AuthToken.objects.filter(token_set__meeting=meeting).count(), 40)
+        self.assertEqual(AuthToken.objects.filter(token_set__meeting=meeting, has_proxy=True).count(), 10)
+        tokens = set(VoterToken.objects.filter(auth_token__token_set__meeting=meeting).values_list('pk', flat=True))
+        self.assertEqual(len(tokens), 50)
+
+        votes = Vote.objects.filter(token_set__meeting=meeting)
+        self.assertEqual(sorted(vote.method for vote in votes), [Vote.STV] * 3 + [Vote.YES_NO_ABS] * 3)
+        for vote in votes:
+            self.assertEqual(vote.state, Vote.LIVE)
+            self.assertEqual(vote.responses(), 50)
+            options = set(vote.option_set.values_list('pk', flat=True))
+            if vote.method == Vote.STV:
+                # The candidates and None of the above
+                self.assertEqual(len(options), 5)
+                for ballot in RankedBallot.objects.filter(vote=vote):
+                    self.assertEqual(sorted(ballot.preferences), sorted(options))
+                    self.assertIn(ballot.token_id, tokens)
+            else:
+                self.assertTrue(set(BallotEntry.objects.filter(vote=vote).values_list('option', flat=True))
+                                <= options)
+
+    def test_turnout(self):
+        meeting = generate_meeting("Nobody came", voters=10, votes=2, turnout=0.0)
+        self.assertEqual([vote.responses() for vote in Vote.objects.filter(token_set__meeting=meeting)], [0, 0])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('generate_meeting', '--voters', '20', '--votes', '3', '--seed', '1', stdout=out)
+        self.assertEqual(Vote.objects.filter(token_set__meeting=Meeting.objects.get()).count(), 3)
+        self.assertIn("20 voters, 3 votes", out.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('generate_meeting', '--turnout', '2', stdout=StringIO())
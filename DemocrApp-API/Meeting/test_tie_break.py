@@ -0,0 +1,143 @@
+from queue import Empty, Queue
+from threading import Thread
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from openstv.ballots import Ballots
+from openstv.MethodPlugins.ScottishSTV import ScottishSTV
+from openstv.STV import TieBreakNeeded
+
+from Meeting.models import Meeting, Vote, Option, AuthToken, RankedBallot, Tie, CountCache
+
+# Four candidates level on first preferences, so who is excluded first is a strong tie,
+# and then who is excluded next
+RANKINGS = [[0, 1], [1, 0], [2, 3], [3, 2], [0], [1], [2], [3]]
+
+
+def make_ballots():
+    ballots = Ballots()
+    ballots.setNames(["a", "b", "c", "d"])
+    ballots.numSeats = 1
+    ballots.appendBallots(RANKINGS)
+    return ballots
+
+
+def choose(tied):
+    return max(tied)
+
+
+class SuspendedCountTests(TestCase):
+    def uninterrupted(self):
+        """A count with the chair choosing as it goes."""
+        election = ScottishSTV(make_ballots())
+        election.strongTieBreakMethod = "manual"
+        election.breakTieRequestQueue = Queue(1)
+        election.breakTieResponseQueue = Queue(1)
+        count = Thread(target=election.runElection)
+        count.start()
+        ties = 0
+        while count.is_alive() or not election.breakTieRequestQueue.empty():
+            try:
+                tied, names, what = election.breakTieRequestQueue.get(timeout=0.1)
+            except Empty:
+                continue
+            election.breakTieResponseQueue.put(choose(tied))
+            ties += 1
+        count.join()
+        return election, ties
+
+    def test_resumed_count_matches_an_uninterrupted_one(self):
+        expected, ties = self.uninterrupted()
+        self.assertGreater(ties, 1)
+
+        election = ScottishSTV(make_ballots())
+        election.strongTieBreakMethod = "suspend"
+        checkpoints = []
+        try:
+            election.runElection()
+            self.fail("The count wasn't suspended")
+        except TieBreakNeeded as suspended:
+            checkpoints.append(suspended.checkpoint)
+        while True:
+            # Each resumption is a fresh process as far as the count can tell
+            checkpoint = checkpoints[-1]
+            election = ScottishSTV(make_ballots())
+            try:
+                election.resume(checkpoint, choose(checkpoint["tied"]))
+                break
+            except TieBreakNeeded as suspended:
+                checkpoints.append(suspended.checkpoint)
+
+        self.assertEqual(len(checkpoints), ties)
+        self.assertEqual(len(checkpoints[-1]["decisions"]), ties - 1)
+        self.assertEqual(election.winners, expected.winners)
+        self.assertEqual(election.numRounds, expected.numRounds)
+        self.assertEqual(election.count, expected.count)
+        self.assertEqual(election.msg, expected.msg)
+
+    def test_decisions_must_match_the_count(self):
+        election = ScottishSTV(make_ballots())
+        with self.assertRaises(RuntimeError):
+            election.resume({"decisions": [], "tied": [0, 1], "what": "", "round": 0}, 0)
+
+
+@override_settings(VOTE_COUNT_WORKERS=0)
+class TieBreakFlowTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+        self.meeting = Meeting.objects.create()
+        token_set = self.meeting.tokenset_set.latest()
+        self.vote = Vote.objects.create(token_set=token_set, method=Vote.STV, state=Vote.LIVE, num_seats=1)
+        # None of the above takes candidate number 0, and never gets a vote
+        self.options = [Option.objects.create(vote=self.vote, name=name).pk for name in ("a", "b", "c", "d")]
+        for ranking in RANKINGS:
+            token = AuthToken.objects.create(token_set=token_set).votertoken_set.get()
+            RankedBallot.objects.create(vote=self.vote, token=token,
+                                        preferences=[self.options[c] for c in ranking])
+
+    def break_tie(self, option_id):
+        return self.client.post(reverse('meeting/break_tie', args=[self.meeting.pk, self.vote.pk]),
+                                {'winner_id': option_id})
+
+    def test_count_waits_for_the_tie_break_without_a_worker(self):
+        with mock.patch.object(Meeting, 'notify_managers') as notify:
+            self.assertTrue(self.vote.close())
+
+        self.vote.refresh_from_db()
+        self.assertEqual(self.vote.state, Vote.NEEDS_TIE_BREAKER)
+        self.assertEqual(self.vote.count_checkpoint["decisions"], [])
+        self.assertEqual(set(Tie.objects.filter(vote=self.vote).values_list('option_id', flat=True)),
+                         set(self.options))
+        notify.assert_any_call({"type": "tie.break", "vote_id": self.vote.pk, "options": ["a", "b", "c", "d"]})
+
+        chosen = []
+        while self.vote.state == Vote.NEEDS_TIE_BREAKER:
+            tied = sorted(Tie.objects.filter(vote=self.vote).values_list('option_id', flat=True))
+            response = self.break_tie(tied[-1])
+            self.assertEqual(response.status_code, 302)
+            self.vote.refresh_from_db()
+            chosen.append(tied[-1])
+
+        self.assertEqual(self.vote.state, Vote.CLOSED)
+        self.assertIsNone(self.vote.count_checkpoint)
+        self.assertFalse(Tie.objects.filter(vote=self.vote).exists())
+        self.assertEqual(len(chosen), 2)
+        # The chair excluded the last tied candidate each time, as choose() does: d, then b,
+        # leaving a and c level, and a weak tie break then excludes a
+        self.assertEqual(self.vote.results_data['winners'][0]['name'], "c")
+        # A count the chair decided isn't reused for anyone else
+        self.assertFalse(CountCache.objects.exists())
+
+    def test_a_second_choice_for_the_same_tie_changes_nothing(self):
+        self.vote.close()
+        tied = list(Tie.objects.filter(vote=self.vote).values_list('option_id', flat=True))
+        with mock.patch('Meeting.voting_methods.stv.STV.count_later') as count_later:
+            self.break_tie(tied[0])
+            self.break_tie(tied[1])
+        count_later.assert_called_once_with(self.meeting.pk, self.vote.pk, num_seats=1)
+        self.assertEqual(list(Tie.objects.filter(vote=self.vote).values_list('option_id', flat=True)), [tied[0]])
@@ -1,5 +1,10 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase, Client, TransactionTestCase
+from django.core.management import call_command
+from django.test import TestCase, Client, TransactionTestCase, override_settings
 from django.urls import reverse
 import json
 from django.utils import timezone
@@ -186,6 +191,7 @@ class ManagementInterfaceCases(BaseTestCase):
         self.assertEqual(3, v.option_set.count())
         non_live_states = [x[0] for x in Vote.states]
         non_live_states.remove(Vote.LIVE)
+        non_live_states.remove(Vote.COUNTING)
         request_args = [reverse('meeting/close_vote', args=[self.m.id, v.id]), {}]
         for s in non_live_states:
             v.state = s
@@ -194,6 +200,13 @@ class ManagementInterfaceCases(BaseTestCase):
             self.assertJSONEqual(result.content, json.dumps({'result': 'failure'}))
             v.refresh_from_db()
             self.assertEqual(s, v.state)
+        # Closing a vote that is being counted again just shows the count in progress
+        v.state = v.COUNTING
+        v.save()
+        result = self.client.post(*request_args)
+        self.assertRedirects(result, reverse('meeting/manage', args=[self.m.id]), fetch_redirect_response=False)
+        v.refresh_from_db()
+        self.assertEqual(v.state, v.COUNTING)
         v.state = v.LIVE
         v.save()
         result = self.client.post(*request_args)
@@ -344,16 +357,240 @@ class ManagementInterfaceCases(BaseTestCase):
                 self.assertEqual(proxy, token.has_proxy)
                 assert token.active
 
+    @override_settings(VOTE_COUNT_WORKERS=0)
     def test_close_meeting(self):
         v1 = self.ts.vote_set.create(method=Vote.YES_NO_ABS, state=Vote.LIVE, majority_threshold='simple')
         v2 = self.ts.vote_set.create(method=Vote.YES_NO_ABS, state=Vote.READY)
         before = timezone.now()
         out = self.client.post(reverse('meeting/close', args=[self.m.pk]))
         after = timezone.now()
-        self.assertRedirects(out, reverse('meeting/report/meeting', args=[self.m.pk]))
+        self.assertRedirects(out, reverse('meeting/manage', args=[self.m.pk]))
         v1.refresh_from_db()
         self.assertFalse(Vote.objects.filter(pk=v2.pk).exists())
         self.assertEqual(v1.state, Vote.CLOSED)
         self.m.refresh_from_db()
         self.assertGreater(self.m.close_time, before)
         self.assertLess(self.m.close_time, after)
+
+    @override_settings(VOTE_COUNT_WORKERS=0)
+    def test_close_meeting_counts_every_live_vote(self):
+        at = AuthToken.objects.create(token_set=self.ts)
+        voter = at.votertoken_set.get()
+        yna = [self.ts.vote_set.create(method=Vote.YES_NO_ABS, state=Vote.LIVE, majority_threshold='simple')
+               for _ in range(3)]
+        for vote in yna:
+            BallotEntry.objects.create(token=voter, option=vote.option_set.get(name='yes'))
+        stv = self.ts.vote_set.create(method=Vote.STV, state=Vote.LIVE, num_seats=1)
+        alice = Option.objects.create(vote=stv, name="Alice")
+        RankedBallot.objects.create(vote=stv, token=voter, preferences=[alice.pk])
+        ready = [self.ts.vote_set.create(method=Vote.STV, state=Vote.READY) for _ in range(3)]
+
+        self.client.post(reverse('meeting/close', args=[self.m.pk]))
+
+        for vote in yna + [stv]:
+            vote.refresh_from_db()
+            self.assertEqual(vote.state, Vote.CLOSED)
+            self.assertIsNotNone(vote.closed_at)
+        self.assertTrue(all(vote.results_data['passed'] for vote in yna))
+        self.assertEqual(stv.results_data['winners'][0]['name'], "Alice")
+        self.assertFalse(Vote.objects.filter(pk__in=[vote.pk for vote in ready]).exists())
+
+    def test_count_pool_runs_counts_off_the_request(self):
+        from Meeting import counting
+        from threading import current_thread
+        future = counting.submit(self.m.pk, 0, lambda: current_thread().name)
+        self.assertTrue(future.result(timeout=5).startswith('vote-count'))
+
+
+class CloseVoteRaceCases(TransactionTestCase):
+    CLOSERS = 6
+
+    def test_concurrent_closes_count_the_vote_once(self):
+        import threading
+        from time import sleep
+        from unittest import mock
+        from django.db import connection
+        from Meeting.voting_methods import YNA
+
+        meeting = Meeting.objects.create()
+        vote = Vote.objects.create(token_set=meeting.tokenset_set.latest(), method=Vote.YES_NO_ABS,
+                                   state=Vote.LIVE, majority_threshold='simple')
+        admin = User.objects.create(is_superuser=True)
+        clients = []
+        for _ in range(self.CLOSERS):
+            client = Client()
+            client.force_login(admin)
+            clients.append(client)
+        url = reverse('meeting/close_vote', args=[meeting.pk, vote.pk])
+        start = threading.Barrier(self.CLOSERS)
+        responses = []
+
+        def close(client):
+            start.wait()
+            try:
+                # As the close form does
+                responses.append(client.post(url, {'majority_threshold': 'two_thirds'}))
+            finally:
+                connection.close()
+
+        # A slow count, so the later closes arrive while it is still in progress
+        with mock.patch.object(YNA, 'count', side_effect=lambda *args, **kwargs: sleep(0.2)) as count:
+            threads = [threading.Thread(target=close, args=(client,)) for client in clients]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(count.call_count, 1)
+        self.assertEqual([response.status_code for response in responses], [302] * self.CLOSERS)
+        vote.refresh_from_db()
+        self.assertEqual(vote.state, Vote.COUNTING)
+        self.assertEqual(vote.majority_threshold, 'two_thirds')
+
+    def test_pending_count_is_not_queued_twice(self):
+        from threading import Event
+        from Meeting import counting
+
+        release = Event()
+        first = counting.submit(0, -1, release.wait, 5)
+        self.assertIs(counting.submit(0, -1, lambda: self.fail("counted twice")), first)
+        self.assertIs(counting.job(-1), first)
+        release.set()
+        first.result(timeout=5)
+        self.assertIsNone(counting.job(-1))
+
+    @override_settings(VOTE_COUNT_WORKERS=0)
+    def test_regenerate_skips_votes_being_counted(self):
+        meeting = Meeting.objects.create()
+        vote = Vote.objects.create(token_set=meeting.tokenset_set.latest(), method=Vote.YES_NO_ABS,
+                                   state=Vote.COUNTING, majority_threshold='simple')
+        err = StringIO()
+        call_command('regenerate_yna_report', vote.pk, stdout=StringIO(), stderr=err)
+        self.assertIn("not closed, skipping", err.getvalue())
+        vote.refresh_from_db()
+        self.assertEqual(vote.state, Vote.COUNTING)
+
+        Vote.objects.filter(pk=vote.pk).update(state=Vote.CLOSED)
+        call_command('regenerate_yna_report', vote.pk, stdout=StringIO(), stderr=StringIO())
+        vote.refresh_from_db()
+        self.assertEqual(vote.state, Vote.CLOSED)
+        self.assertIsNotNone(vote.closed_at)
+
+
+class SessionLifecycleCases(BaseTestCase):
+    def setUp(self):
+        super(SessionLifecycleCases, self).setUp()
+        self.at = AuthToken(token_set=self.ts)
+        self.at.save()
+        self.long_ago = timezone.now() - timedelta(hours=settings.VOTER_SESSION_EXPIRY_HOURS + 1)
+
+    def test_check_token_counts_sessions_and_drops_expired(self):
+        Session.objects.create(auth_token=self.at, channel="specific.connected")
+        Session.objects.create(auth_token=self.at)
+        expired = Session.objects.create(auth_token=self.at, last_seen=self.long_ago)
+        # Connected sessions never expire
+        Session.objects.create(auth_token=self.at, channel="specific.idle", last_seen=self.long_ago)
+
+        result = self.client.post(reverse('meeting/token_check', args=[self.m.id]), {'token': self.at.pk})
+        response = json.loads(result.content.decode('utf-8'))
+        self.assertTrue(response['success'])
+        self.assertEqual(response['num_sessions'], 4)
+        self.assertEqual(response['active_sessions'], 2)
+        self.assertFalse(Session.objects.filter(pk=expired.pk).exists())
+
+    def test_purge_sessions_deletes_only_expired(self):
+        fresh = Session.objects.create(auth_token=self.at)
+        Session.objects.create(auth_token=self.at, last_seen=self.long_ago)
+        stale = Session.objects.create(auth_token=self.at, channel="specific.dead", last_seen=self.long_ago)
+
+        call_command('purge_sessions', stdout=StringIO())
+        self.assertEqual(set(Session.objects.values_list('pk', flat=True)), {fresh.pk, stale.pk})
+        call_command('purge_sessions', '--stale-channels', '1', stdout=StringIO())
+        self.assertEqual(list(Session.objects.values_list('pk', flat=True)), [fresh.pk])
+
+
+class MeetingDetailCases(BaseTestCase):
+    def setUp(self):
+        super(MeetingDetailCases, self).setUp()
+        self.client.force_login(self.admin)
+        self.m.name = "AGM"
+        self.m.save()
+        AuthToken(token_set=self.ts).save()
+        self.v = Vote(token_set=self.ts, name="Motion", description="d", method=Vote.YES_NO_ABS)
+        self.v.save()
+
+    def test_detail(self):
+        with self.assertNumQueries(5):  # session, user, version, token sets, votes
+            result = self.client.get(reverse('meeting/detail', args=[self.m.id]))
+        self.assertEqual(json.loads(result.content.decode('utf-8')), {
+            'name': "AGM",
+            'token_sets': {str(self.m.tokenset_set.earliest().pk): 0, str(self.old_ts.pk): 0, str(self.ts.pk): 1},
+            'votes': {str(self.v.pk): {"name": "Motion", "description": "d",
+                                       "method": Vote.YES_NO_ABS, "state": Vote.READY}},
+        })
+
+    def test_unchanged_meeting_is_not_modified(self):
+        etag = self.client.get(reverse('meeting/detail', args=[self.m.id]))['ETag']
+        with self.assertNumQueries(3):  # session, user, version
+            result = self.client.get(reverse('meeting/detail', args=[self.m.id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(result.status_code, 304)
+
+        self.v.state = Vote.LIVE
+        self.v.save()
+        result = self.client.get(reverse('meeting/detail', args=[self.m.id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(result.status_code, 200)
+        self.assertNotEqual(result['ETag'], etag)
+        self.assertNotIn('Last-Modified', result)
+
+    def test_deleting_a_vote_changes_the_meeting(self):
+        etag = self.client.get(reverse('meeting/detail', args=[self.m.id]))['ETag']
+        self.client.post(reverse('meeting/manage_vote', args=[self.m.id, self.v.id]), {'_method': 'DELETE'})
+        self.assertFalse(Vote.objects.filter(pk=self.v.pk).exists())
+        result = self.client.get(reverse('meeting/detail', args=[self.m.id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(result.status_code, 200)
+
+    def test_missing_meeting(self):
+        result = self.client.get(reverse('meeting/detail', args=[self.m.id + 100]))
+        self.assertEqual(result.status_code, 404)
+
+
+class ManageMeetingQueryCases(BaseTestCase):
+    def setUp(self):
+        super(ManageMeetingQueryCases, self).setUp()
+        self.client.force_login(self.admin)
+        self.voters = []
+        for _ in range(3):
+            at = AuthToken(token_set=self.ts, has_proxy=True)
+            at.save()
+            self.voters += list(at.votertoken_set.all())
+
+    def add_votes(self, n):
+        for i in range(n):
+            yna = Vote(token_set=self.ts, name="motion {}".format(i), method=Vote.YES_NO_ABS, state=Vote.LIVE)
+            yna.save()
+            yes = yna.option_set.get(name="yes")
+            for voter in self.voters:
+                BallotEntry(token=voter, option=yes).save()
+            stv = Vote(token_set=self.ts, name="election {}".format(i), method=Vote.STV, state=Vote.CLOSED)
+            stv.save()
+            candidate = stv.option_set.first()
+            for voter in self.voters[:2]:
+                RankedBallot(vote=stv, token=voter, preferences=[candidate.pk]).save()
+            Vote(token_set=self.ts, name="later {}".format(i), method=Vote.STV).save()
+
+    def render(self):
+        # session, user, meeting, connected voters, votes with their responses
+        with self.assertNumQueries(5):
+            result = self.client.get(reverse('meeting/manage', args=[self.m.id]))
+        self.assertEqual(result.status_code, 200)
+        return result.content.decode('utf-8')
+
+    def test_query_count_does_not_grow_with_votes(self):
+        # The first request after logging in also saves the session
+        self.client.get(reverse('meeting/manage', args=[self.m.id]))
+        self.add_votes(1)
+        content = self.render()
+        self.assertIn('<td class="vote-responses">6</td>', content)
+        self.assertIn('<td class="vote-responses">2</td>', content)
+        self.add_votes(20)
+        self.render()
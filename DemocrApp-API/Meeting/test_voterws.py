@@ -2,6 +2,7 @@ import pytest
 from channels.layers import get_channel_layer
 from django.contrib.auth.models import User
 from django.test import Client
+from django.urls import reverse
 
 from Meeting.models import *
 from channels.testing import WebsocketCommunicator
@@ -293,8 +294,9 @@ class TestSTVValidation:
         }
         # Should not raise
         STV._handle_ballot(self.vote, self.voter_token.pk, ballot)
-        # Verify entries were created
-        assert BallotEntry.objects.filter(token_id=self.voter_token.pk).count() == 3
+        # Verify the ranking was stored
+        assert RankedBallot.objects.get(token_id=self.voter_token.pk).preferences == [self.opt1.pk, self.opt2.pk,
+                                                                                      self.opt3.pk]
 
     def test_partial_ranking_valid(self):
         """Valid: 1, 2 (third option not ranked)"""
@@ -305,8 +307,8 @@ class TestSTVValidation:
         }
         # Should not raise
         STV._handle_ballot(self.vote, self.voter_token.pk, ballot)
-        # Verify entries were created
-        assert BallotEntry.objects.filter(token_id=self.voter_token.pk).count() == 2
+        # Verify the ranking was stored
+        assert RankedBallot.objects.get(token_id=self.voter_token.pk).preferences == [self.opt1.pk, self.opt2.pk]
 
     def test_skipped_number_invalid(self):
         """Invalid: 1, 3 (skipped 2)"""
@@ -334,7 +336,17 @@ class TestSTVValidation:
         ballot = {
             str(self.opt1.pk): "1.5"
         }
-        with pytest.raises(ValueError):
+        with pytest.raises(ValueError, match="Invalid preference value: 1.5"):
+            STV._handle_ballot(self.vote, self.auth_token.pk, ballot)
+
+    def test_non_integer_option_invalid(self):
+        """Invalid: an option id that isn't a number, however valid its preference"""
+        from Meeting.voting_methods.stv import STV
+        ballot = {
+            str(self.opt1.pk): "1",
+            "Option 2": "2"
+        }
+        with pytest.raises(ValueError, match="Unknown option: Option 2"):
             STV._handle_ballot(self.vote, self.auth_token.pk, ballot)
 
 
@@ -400,3 +412,387 @@ class TestSTVWinnerOrdering:
         # Check for numbered winners with round info
         assert "1. Alice Smith (round 3)" in html
         assert "2. Bob Jones (round 5)" in html
+
+
+class TestBallotExtraction:
+    """Bulk ballot extraction must build the same Ballots as appending one at a time."""
+
+    BALLOTS = [[0, 1, 2], [2], [0, 1, 2], [1, [0, 2]], [], [2], [1, [0, 2]], [0, 1, 2]]
+
+    def test_append_ballots_matches_append_ballot(self):
+        from openstv.ballots import Ballots
+
+        one_by_one, bulk = Ballots(), Ballots()
+        for b in (one_by_one, bulk):
+            b.setNames(["a", "b", "c"])
+        for ballot in self.BALLOTS:
+            one_by_one.appendBallot(ballot)
+        bulk.appendBallots(iter(self.BALLOTS))
+
+        assert bulk.numBallots == one_by_one.numBallots == len(self.BALLOTS)
+        assert bulk.uniqueBallots == one_by_one.uniqueBallots
+        assert bulk.uniqueBallotCount == one_by_one.uniqueBallotCount == [3, 2, 2, 1]
+        assert bulk.ballotOrder == one_by_one.ballotOrder
+        assert bulk.uniqueBallotIndexToBallotIndices == one_by_one.uniqueBallotIndexToBallotIndices
+        # Later appends still find the ballots added in bulk
+        bulk.appendBallot([2])
+        assert bulk.uniqueBallotCount == [3, 3, 2, 1]
+
+    @pytest.mark.django_db
+    def test_extract_ballots_streams_rankings(self, monkeypatch):
+        from Meeting.voting_methods.stv import STV
+
+        meeting = Meeting.objects.create()
+        token_set = meeting.tokenset_set.latest()
+        vote = Vote.objects.create(token_set=token_set, method=Vote.STV, state=Vote.COUNTING)
+        options = [Option.objects.create(vote=vote, name=name).pk for name in ("Alice", "Bob")]
+        nota = vote.option_set.get(name="None of the above").pk
+        rankings = [[options[0], options[1]], [options[1]], [options[0], options[1]], [nota]]
+        for preferences in rankings:
+            token = AuthToken.objects.create(token_set=token_set).votertoken_set.get()
+            RankedBallot.objects.create(vote=vote, token=token, preferences=preferences)
+        # Several fetches per extraction
+        monkeypatch.setattr(STV, 'EXTRACT_CHUNK_SIZE', 3)
+
+        ballots = STV.extract_ballots(vote, 1)
+        assert ballots.names == ["None of the above", "Alice", "Bob"]
+        assert ballots.numSeats == 1
+        assert ballots.getBallotsAndIDs() == [([1, 2], 1), ([2], 2), ([1, 2], 3), ([0], 4)]
+        assert ballots.uniqueBallotCount == [2, 1, 1]
+
+
+@pytest.mark.django_db(transaction=True)
+class TestCloseBarrier:
+    """Ballots racing a close must be counted whole or rejected, never half-counted."""
+
+    VOTERS = 12
+    RESUBMISSIONS = 4
+
+    def setup_method(self):
+        self.meeting = Meeting.objects.create()
+        self.token_set = self.meeting.tokenset_set.latest()
+
+    def make_voter(self):
+        auth_token = AuthToken.objects.create(token_set=self.token_set)
+        consumer = UIConsumer()
+        consumer.session_id = Session.objects.create(auth_token=auth_token).pk
+        consumer.auth_token_id = auth_token.pk
+        consumer.meeting_id = self.meeting.pk
+        consumer.voter_tokens = (auth_token.votertoken_set.get(proxy=False).pk,)
+        consumer.token_set_id = self.token_set.pk
+        consumer.token_valid = True
+        replies = []
+        consumer.send_json = replies.append
+        return consumer, replies
+
+    def race_close(self, vote, ballot_for):
+        import threading
+        from time import monotonic, sleep
+        from django.db import connection
+
+        voters = [self.make_voter() for _ in range(self.VOTERS)]
+        start = threading.Barrier(len(voters) + 1, timeout=30)
+        errors = []
+
+        def submit(consumer, n):
+            try:
+                start.wait()
+                for _ in range(self.RESUBMISSIONS):
+                    consumer.process_votes({'ballot_id': vote.pk,
+                                            'votes': {str(consumer.voter_tokens[0]): ballot_for(n)}})
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=submit, args=(consumer, n)) for n, (consumer, _) in enumerate(voters)]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        # Let half the voters get a ballot in first so the close races live submissions.
+        deadline = monotonic() + 30
+        while sum(1 for _, replies in voters if replies) < len(voters) // 2:
+            if errors or monotonic() > deadline:
+                break
+            sleep(0.001)
+        else:
+            vote.close()
+        for thread in threads:
+            thread.join(timeout=30)
+        if errors:
+            raise errors[0]
+        if vote.state == Vote.LIVE:
+            pytest.fail("Half the voters didn't get a ballot in within 30 seconds")
+
+        accepted = {consumer.voter_tokens[0] for consumer, replies in voters
+                    if any('voter_token' in reply for reply in replies)}
+        return accepted
+
+    def test_yna_close_counts_exactly_the_accepted_ballots(self):
+        vote = Vote.objects.create(token_set=self.token_set, method=Vote.YES_NO_ABS,
+                                   state=Vote.LIVE, majority_threshold='simple')
+        yes, no = vote.option_set.get(name='yes').pk, vote.option_set.get(name='no').pk
+
+        accepted = self.race_close(vote, lambda n: {str(yes if n % 2 else no): 1})
+
+        vote.refresh_from_db()
+        assert vote.state == Vote.CLOSED
+        stored = set(BallotEntry.objects.filter(option__vote=vote).values_list('token_id', flat=True))
+        assert stored == accepted
+        assert vote.results_data['total'] == len(accepted)
+
+    def test_stv_close_counts_only_complete_ballots(self):
+        from time import monotonic, sleep
+
+        vote = Vote.objects.create(token_set=self.token_set, method=Vote.STV, state=Vote.LIVE, num_seats=1)
+        options = [Option.objects.create(vote=vote, name=str(x)).pk for x in range(3)]
+
+        # Everyone ranks option 0 first so the count never stops for a tie break.
+        accepted = self.race_close(vote, lambda n: {str(options[0]): '1',
+                                                    str(options[1 + n % 2]): '2',
+                                                    str(options[2 - n % 2]): '3'})
+
+        deadline = monotonic() + 30
+        vote.refresh_from_db()
+        while vote.state != Vote.CLOSED and monotonic() < deadline:
+            sleep(0.1)
+            vote.refresh_from_db()
+        assert vote.state == Vote.CLOSED
+        ballots = RankedBallot.objects.filter(vote=vote)
+        stored = set(ballots.values_list('token_id', flat=True))
+        assert stored == accepted
+        for preferences in ballots.values_list('preferences', flat=True):
+            assert sorted(preferences) == sorted(options)
+        assert vote.results_data['num_ballots'] == len(accepted)
+
+
+@pytest.mark.django_db
+class TestBallotBatch:
+    """A slate of ballots for several votes arrives in one frame and gets one receipt."""
+
+    def setup_method(self):
+        self.meeting = Meeting.objects.create()
+        self.token_set = self.meeting.tokenset_set.latest()
+        auth_token = AuthToken.objects.create(token_set=self.token_set, has_proxy=True)
+        self.primary = auth_token.votertoken_set.get(proxy=False).pk
+        self.proxy = auth_token.votertoken_set.get(proxy=True).pk
+        self.consumer = UIConsumer()
+        self.consumer.session_id = Session.objects.create(auth_token=auth_token).pk
+        self.consumer.auth_token_id = auth_token.pk
+        self.consumer.meeting_id = self.meeting.pk
+        self.consumer.voter_tokens = (self.primary, self.proxy)
+        self.consumer.token_set_id = self.token_set.pk
+        self.consumer.token_valid = True
+        self.replies = []
+        self.consumer.send_json = self.replies.append
+        self.motions = [Vote.objects.create(token_set=self.token_set, method=Vote.YES_NO_ABS, state=Vote.LIVE)
+                        for _ in range(3)]
+
+    def option(self, vote, name):
+        return str(vote.option_set.get(name=name).pk)
+
+    def test_batch_records_primary_and_proxy_ballots(self):
+        closed = Vote.objects.create(token_set=self.token_set, method=Vote.YES_NO_ABS, state=Vote.CLOSED)
+        ballots = [{'ballot_id': vote.pk, 'votes': {str(self.primary): {self.option(vote, 'yes'): 1},
+                                                    str(self.proxy): {self.option(vote, 'no'): 1}}}
+                   for vote in self.motions + [closed]]
+
+        self.consumer.receive_json({'type': 'ballot_batch', 'ballots': ballots})
+
+        assert len(self.replies) == 1
+        reply = self.replies[0]
+        assert reply['type'] == 'batch_receipt'
+        receipts = {receipt['ballot_id']: receipt for receipt in reply['receipts']}
+        for vote in self.motions:
+            assert sorted(receipts[vote.pk]['voter_token']) == sorted([self.primary, self.proxy])
+            assert BallotEntry.objects.get(option__vote=vote, token_id=self.primary).option.name == 'yes'
+            assert BallotEntry.objects.get(option__vote=vote, token_id=self.proxy).option.name == 'no'
+        assert receipts[closed.pk]['result'] == 'failure'
+        assert not BallotEntry.objects.filter(option__vote=closed).exists()
+
+    def test_entries_carry_their_vote_and_rankings_are_one_row(self):
+        stv = Vote.objects.create(token_set=self.token_set, method=Vote.STV, state=Vote.LIVE, num_seats=1)
+        candidates = [str(Option.objects.create(vote=stv, name=name).pk) for name in ('a', 'b')]
+        ballots = [{'ballot_id': self.motions[0].pk, 'votes': {str(self.primary): {self.option(self.motions[0], 'yes'): 1}}},
+                   {'ballot_id': stv.pk, 'votes': {str(self.primary): {candidates[0]: 2, candidates[1]: 1}}}]
+
+        self.consumer.receive_json({'type': 'ballot_batch', 'ballots': ballots})
+
+        entry = BallotEntry.objects.select_related('option').get(token_id=self.primary)
+        assert entry.vote_id == entry.option.vote_id == self.motions[0].pk
+        assert RankedBallot.objects.get(token_id=self.primary).preferences == [int(candidates[1]), int(candidates[0])]
+        assert self.motions[0].responses() == stv.responses() == 1
+
+    def test_invalid_ballot_rolls_back_the_whole_batch(self):
+        stv = Vote.objects.create(token_set=self.token_set, method=Vote.STV, state=Vote.LIVE, num_seats=1)
+        candidate = Option.objects.create(vote=stv, name='candidate')
+        ballots = [{'ballot_id': vote.pk, 'votes': {str(self.primary): {self.option(vote, 'yes'): 1}}}
+                   for vote in self.motions]
+        ballots.append({'ballot_id': stv.pk, 'votes': {str(self.primary): {str(candidate.pk): '2'}}})
+
+        self.consumer.receive_json({'type': 'ballot_batch', 'ballots': ballots})
+
+        assert self.replies == [{'type': 'validation_error',
+                                 'message': self.replies[0]['message'],
+                                 'ballot_id': stv.pk}]
+        assert not BallotEntry.objects.filter(token_id=self.primary).exists()
+        assert not RankedBallot.objects.filter(token_id=self.primary).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestTokenRevocation:
+    """Revoking a token is pushed to its open sockets instead of being re-checked per ballot."""
+
+    def setup_method(self):
+        self.meeting = Meeting.objects.create()
+        self.token_set = self.meeting.tokenset_set.latest()
+        self.auth_token = AuthToken.objects.create(token_set=self.token_set)
+        self.session = Session.objects.create(auth_token=self.auth_token)
+        self.vote = Vote.objects.create(token_set=self.token_set, method=Vote.YES_NO_ABS, state=Vote.LIVE)
+        self.admin = User.objects.create(is_superuser=True)
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(UIConsumer.as_asgi(), "")
+        connected, _ = await communicator.connect()
+        assert connected
+        await communicator.send_json_to({'type': 'auth_request', 'session_token': str(self.session.id)})
+        response = await communicator.receive_json_from()
+        assert response['result'] == 'success'
+        ballot = await communicator.receive_json_from()
+        assert ballot['ballot_id'] == self.vote.pk
+        return communicator, response['voters'][0]['token']
+
+    async def test_deactivated_token_is_terminated_within_milliseconds(self):
+        from time import monotonic
+        from asgiref.sync import sync_to_async
+
+        communicator, voter = await self.connect()
+
+        @sync_to_async
+        def deactivate():
+            client = Client()
+            client.force_login(self.admin)
+            client.post(reverse('meeting/deactivate_token', args=[self.meeting.pk]), {'key': self.auth_token.pk})
+            return monotonic()
+
+        revoked_at = await deactivate()
+        response = await communicator.receive_json_from(timeout=1)
+        assert response == {'type': 'terminate_session', 'reason': 'Auth Token Deactivated'}
+        assert monotonic() - revoked_at < 0.25
+
+        assert (await communicator.receive_output())['type'] == 'websocket.close'
+        await communicator.disconnect()
+
+        communicator = WebsocketCommunicator(UIConsumer.as_asgi(), "")
+        await communicator.connect()
+        await communicator.send_json_to({'type': 'auth_request', 'session_token': str(self.session.id)})
+        response = await communicator.receive_json_from()
+        assert response['reason'] == 'Deactivated Auth Token'
+        await communicator.disconnect()
+
+    async def test_token_set_rotation_terminates_old_tokens(self):
+        from asgiref.sync import sync_to_async
+
+        communicator, _ = await self.connect()
+        await sync_to_async(TokenSet.objects.create)(meeting=self.meeting)
+        response = await communicator.receive_json_from(timeout=1)
+        assert response == {'type': 'terminate_session', 'reason': 'Old Auth Token'}
+        await communicator.disconnect()
+
+    async def test_lost_revocation_push_does_not_let_the_token_vote(self):
+        from unittest import mock
+        from asgiref.sync import sync_to_async
+
+        communicator, voter = await self.connect()
+
+        @sync_to_async
+        def deactivate():
+            client = Client()
+            client.force_login(self.admin)
+            with mock.patch.object(Session, 'notify'):
+                client.post(reverse('meeting/deactivate_token', args=[self.meeting.pk]), {'key': self.auth_token.pk})
+
+        await deactivate()
+        yes = await sync_to_async(lambda: self.vote.option_set.get(name='yes').pk)()
+        await communicator.send_json_to({'type': 'ballot_form', 'ballot_id': self.vote.pk,
+                                         'votes': {str(voter): {str(yes): 1}}})
+        receipt = await communicator.receive_json_from(timeout=1)
+        assert receipt['reason'] == 'Your token is not valid for this vote.'
+        assert not await sync_to_async(BallotEntry.objects.filter(vote=self.vote).exists)()
+        await communicator.disconnect()
+
+    def test_revocation_is_pushed_only_once_committed(self):
+        from unittest import mock
+        from django.db import transaction
+
+        with mock.patch('Meeting.models.get_control_layer') as get_control_layer:
+            with pytest.raises(RuntimeError):
+                with transaction.atomic():
+                    Session.notify([self.auth_token.pk], {"type": "token.revoked"})
+                    raise RuntimeError
+            get_control_layer.assert_not_called()
+
+            # And a push the channel layer can't take is only logged
+            get_control_layer.side_effect = ConnectionError
+            Session.notify([self.auth_token.pk], {"type": "token.revoked"})
+            get_control_layer.assert_called_once()
+
+    async def authenticate_while(self, change):
+        from unittest import mock
+
+        # Between the session being read and the socket joining its groups, when no push
+        # about the change can reach it
+        with mock.patch.object(UIConsumer, 'boot_others', side_effect=lambda: change()):
+            communicator = WebsocketCommunicator(UIConsumer.as_asgi(), "")
+            await communicator.connect()
+            await communicator.send_json_to({'type': 'auth_request', 'session_token': str(self.session.id)})
+            response = await communicator.receive_json_from(timeout=1)
+        await communicator.disconnect()
+        return response
+
+    async def test_token_deactivated_during_authentication_is_refused(self):
+        response = await self.authenticate_while(
+            lambda: AuthToken.objects.filter(pk=self.auth_token.pk).update(active=False))
+        assert response['reason'] == 'Deactivated Auth Token'
+
+    async def test_token_set_rotated_during_authentication_is_refused(self):
+        response = await self.authenticate_while(
+            lambda: TokenSet.objects.create(meeting=self.meeting))
+        assert response['reason'] == 'Old Auth Token'
+
+
+@pytest.mark.django_db(transaction=True)
+class TestControlLane:
+    """Control events overtake ballot traffic already queued for a voter's socket."""
+
+    def setup_method(self):
+        self.meeting = Meeting.objects.create()
+        self.token_set = self.meeting.tokenset_set.latest()
+        self.session = Session.objects.create(auth_token=AuthToken.objects.create(token_set=self.token_set))
+        self.vote = Vote.objects.create(token_set=self.token_set, method=Vote.YES_NO_ABS, state=Vote.LIVE)
+
+    async def test_vote_closing_overtakes_saturated_channel(self):
+        from time import monotonic
+
+        communicator = WebsocketCommunicator(UIConsumer.as_asgi(), "")
+        await communicator.connect()
+        await communicator.send_json_to({'type': 'auth_request', 'session_token': str(self.session.id)})
+        assert (await communicator.receive_json_from())['result'] == 'success'
+        assert (await communicator.receive_json_from())['type'] == 'ballot'
+
+        # Fill the voter's default channel to capacity, then close the vote on the control lane
+        channel_layer = get_channel_layer()
+        for _ in range(channel_layer.capacity):
+            await channel_layer.group_send(self.meeting.channel_group_name(), {"type": "vote.opening",
+                                                                               "vote_id": self.vote.pk})
+        closed_at = monotonic()
+        await get_control_layer().group_send(self.meeting.channel_group_name(), {"type": "vote.closing",
+                                                                                 "vote_id": self.vote.pk})
+
+        overtaken = 0
+        while (response := await communicator.receive_json_from(timeout=5))['type'] != 'ballot_closed':
+            overtaken += 1
+        assert monotonic() - closed_at < 0.5
+        # Bulk messages already being dispatched may still go first, but not the backlog
+        assert overtaken <= 2
+        await communicator.disconnect()
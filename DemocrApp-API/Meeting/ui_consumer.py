@@ -1,13 +1,54 @@
+import functools
+import random
 from uuid import UUID
 from django.conf import settings
 from asgiref.sync import async_to_sync
+from channels.exceptions import StopConsumer
 from channels.generic.websocket import JsonWebsocketConsumer
+from channels.layers import get_channel_layer
+from channels.utils import await_many_dispatch
+from django.db import transaction
+from django.utils import timezone
 from .models import *
+from . import provisional
 
 
 class UIConsumer(JsonWebsocketConsumer):
-    session = None
-    voter_tokens = []
+    # Per-connection state is kept to plain ids so an idle voter costs as little
+    # as possible; model instances are fetched when needed and not held on to.
+    session_id = None
+    auth_token_id = None
+    meeting_id = None
+    voter_tokens = ()
+    # Cached at authentication and kept current by token.revoked and
+    # token_set.rotated pushes; each batch of ballots re-reads only the token's
+    # active flag, in case a push was lost.
+    token_set_id = None
+    token_valid = False
+    control_layer = None
+    control_channel_name = None
+
+    async def __call__(self, scope, receive, send):
+        """
+        As AsyncConsumer.__call__, but also listens on the control layer. Whenever
+        several messages are waiting, control events are dispatched first, then
+        frames from the voter, then bulk channel layer traffic.
+        """
+        self.scope = scope
+        self.channel_layer = get_channel_layer(self.channel_layer_alias)
+        self.channel_name = await self.channel_layer.new_channel()
+        receivers = [receive, functools.partial(self.channel_layer.receive, self.channel_name)]
+        self.control_layer = get_control_layer()
+        if self.control_layer is self.channel_layer:
+            self.control_channel_name = self.channel_name
+        else:
+            self.control_channel_name = await self.control_layer.new_channel()
+            receivers.insert(0, functools.partial(self.control_layer.receive, self.control_channel_name))
+        self.base_send = async_to_sync(send)
+        try:
+            await await_many_dispatch(receivers, self.dispatch)
+        except StopConsumer:
+            pass
 
     def websocket_connect(self, message):
         self.accept()
@@ -15,17 +56,23 @@ class UIConsumer(JsonWebsocketConsumer):
 
     def websocket_disconnect(self, message):
         async_to_sync(self.channel_layer.group_discard)("broadcast", self.channel_name)
-        if self.session is not None:
-            async_to_sync(self.channel_layer.group_discard)(
-                self.session.auth_token.token_set.meeting.channel_group_name(),
-                self.channel_name)
+        if self.session_id is not None:
+            meeting = self.meeting()
+            async_to_sync(self.channel_layer.group_discard)(meeting.channel_group_name(), self.channel_name)
+            async_to_sync(self.control_layer.group_discard)(meeting.channel_group_name(), self.control_channel_name)
+            async_to_sync(self.control_layer.group_discard)(Session(pk=self.session_id).control_group_name(),
+                                                            self.control_channel_name)
+            if Session.objects.filter(pk=self.session_id, channel=self.channel_name).update(
+                    channel=None, last_seen=timezone.now()):
+                meeting.notify_managers({"type": "voters.connected"})
         self.close()
 
     def receive_json(self, message, **kwargs):
         if 'type' in message.keys():
             options = {
                 'auth_request': self.authenticate,
-                'ballot_form': self.process_votes
+                'ballot_form': self.process_votes,
+                'ballot_batch': self.process_vote_batch,
             }
             options.get(message['type'], self.bad_message)(message)
         else:
@@ -34,29 +81,57 @@ class UIConsumer(JsonWebsocketConsumer):
     def authenticate(self, message):
         key = message['session_token']
         try:
-            self.session = Session.objects.filter(pk=UUID(key)).first()
-            if self.session is not None:
+            session = Session.objects.select_related('auth_token__token_set__meeting').filter(pk=UUID(key)).first()
+            if session is not None and session.is_expired():
+                session.delete()
+                session = None
+            if session is not None:
+                auth_token = session.auth_token
+                self.session_id = session.pk
+                self.auth_token_id = auth_token.pk
+                self.meeting_id = auth_token.token_set.meeting_id
                 self.boot_others()
-                self.session.channel = self.channel_name
-                self.session.save()
-                auth_token = self.session.auth_token
-                if auth_token.token_set.valid():
-                    self.voter_tokens = []
-                    self.voter_tokens.append(auth_token.votertoken_set.filter(proxy=False).first().id)
-                    voters = [{"token": self.voter_tokens[0], "type": "primary"}]
+                session.channel = self.channel_name
+                session.last_seen = timezone.now()
+                session.save()
+                meeting = auth_token.token_set.meeting
+                # Join the groups revocations and rotations are pushed to before checking the
+                # token, so one committed after the session was read still reaches this socket
+                async_to_sync(self.control_layer.group_add)(session.control_group_name(), self.control_channel_name)
+                async_to_sync(self.control_layer.group_add)(meeting.channel_group_name(), self.control_channel_name)
+                auth_token.active, meeting.close_time = AuthToken.objects.filter(pk=auth_token.pk) \
+                    .values_list('active', 'token_set__meeting__close_time').get()
+                valid = auth_token.token_set.valid() and auth_token.active
+                if not valid:
+                    # Not a voter in this meeting after all
+                    async_to_sync(self.control_layer.group_discard)(meeting.channel_group_name(),
+                                                                    self.control_channel_name)
+                if valid:
+                    self.token_set_id = auth_token.token_set_id
+                    self.token_valid = True
+                    voter_tokens = [auth_token.votertoken_set.filter(proxy=False).first().id]
+                    voters = [{"token": voter_tokens[0], "type": "primary"}]
                     if auth_token.has_proxy:
-                        self.voter_tokens.append(auth_token.votertoken_set.filter(proxy=True).first().id)
-                        voters.append({"token": self.voter_tokens[1], "type": "proxy"})
-                    async_to_sync(self.channel_layer.group_add)(auth_token.token_set.meeting.channel_group_name(),
-                                                                self.channel_name)
+                        voter_tokens.append(auth_token.votertoken_set.filter(proxy=True).first().id)
+                        voters.append({"token": voter_tokens[1], "type": "proxy"})
+                    self.voter_tokens = tuple(voter_tokens)
+                    async_to_sync(self.channel_layer.group_add)(meeting.channel_group_name(), self.channel_name)
                     reply = {"type": "auth_response",
                             "result": "success",
                             "voters": voters,
-                            "meeting_name": auth_token.token_set.meeting.name,
+                            "meeting_name": meeting.name,
                             }
                     self.send_json(reply)
-                    for vote in Vote.objects.filter(token_set=auth_token.token_set, state=Vote.LIVE).all():
-                        self.send_vote(vote)
+                    meeting.notify_managers({"type": "voters.connected"})
+                    votes = list(Vote.objects.filter(token_set=auth_token.token_set, state=Vote.LIVE)
+                                 .prefetch_related('option_set'))
+                    voted = Vote.voted_tokens(votes, self.voter_tokens)
+                    for vote in votes:
+                        self.send_vote(vote, voted.get(vote.pk, []))
+                elif not auth_token.active:
+                    self.send_json({"type": "auth_response",
+                                    "result": "failure",
+                                    "reason": "Deactivated Auth Token"})
                 else:
                     self.send_json({"type": "auth_response",
                                     "result": "failure",
@@ -76,60 +151,96 @@ class UIConsumer(JsonWebsocketConsumer):
             self.send_json(response)
 
     def process_votes(self, message):
-        vote_num = message['ballot_id']
-        vote = Vote.objects.filter(pk=vote_num).first()
-        tokens = []
-        self.session.refresh_from_db()
-        if self.session.auth_token.valid_for(vote) and vote.state == Vote.LIVE:
-            try:
-                for voter in message['votes'].items():
-                    voter_id = int(voter[0])
-                    ballot_entries = voter[1]
-                    if voter_id in self.voter_tokens:
-                        vote.get_method_class().receive_ballot(vote, voter_id, ballot_entries)
-                        tokens.append(voter_id)
-
-                message = {
-                    "type": "ballot_receipt",
-                    "ballot_id": vote_num,
-                    "voter_token": tokens,
-                }
-                self.send_json(message)
-            except ValueError as e:
-                # Validation error - send back to user
-                message = {
-                    "type": "validation_error",
-                    "message": str(e),
-                    "ballot_id": vote_num
-                }
-                self.send_json(message)
-        else:
-            message = {"type": "ballot_receipt",
-                       "ballot_id": vote_num,
-                       "result": "failure"}
-            if not self.session.auth_token.valid_for(vote):
-                message['reason'] = 'Your token is not valid for this vote.'
-            else:
-                message['reason'] = 'Vote is not open'
-            self.send_json(message)
+        receipts, error = self.cast_ballots([message])
+        self.send_json(error or receipts[0])
+
+    def process_vote_batch(self, message):
+        receipts, error = self.cast_ballots(message['ballots'])
+        self.send_json(error or {"type": "batch_receipt", "receipts": receipts})
+
+    def cast_ballots(self, ballots):
+        """
+        Record ballots for any number of votes, for both primary and proxy voters, in one transaction.
+
+        Returns a receipt per ballot and no error, or, if any ballot fails validation,
+        no receipts and the validation error; nothing is saved in that case.
+        """
+        receipts = []
+        turnout = {}
+        ranked = set()
+        vote_num = None
+        try:
+            # Checking the state and writing the ballot happen under one shared lock,
+            # so a close can never count a ballot that is only partly written.
+            with transaction.atomic():
+                votes = Vote.lock_for_ballots([int(ballot['ballot_id']) for ballot in ballots])
+                # token.revoked pushes keep token_valid current, but one lost on the way
+                # mustn't let a deactivated token keep voting
+                if self.token_valid and not AuthToken.objects.filter(pk=self.auth_token_id, active=True).exists():
+                    self.token_valid = False
+                for ballot in ballots:
+                    vote_num = ballot['ballot_id']
+                    vote = votes.get(int(vote_num))
+                    if vote is None or not self.token_valid or vote.token_set_id != self.token_set_id:
+                        receipts.append({"type": "ballot_receipt",
+                                         "ballot_id": vote_num,
+                                         "result": "failure",
+                                         "reason": 'Your token is not valid for this vote.'})
+                    elif vote.state != Vote.LIVE:
+                        receipts.append({"type": "ballot_receipt",
+                                         "ballot_id": vote_num,
+                                         "result": "failure",
+                                         "reason": 'Vote is not open'})
+                    else:
+                        tokens = []
+                        for voter in ballot['votes'].items():
+                            voter_id = int(voter[0])
+                            ballot_entries = voter[1]
+                            if voter_id in self.voter_tokens:
+                                delta = vote.get_method_class().receive_ballot(vote, voter_id, ballot_entries)
+                                turnout[vote.pk] = turnout.get(vote.pk, 0) + delta
+                                tokens.append(voter_id)
+                                if vote.method == Vote.STV:
+                                    ranked.add(vote.pk)
+                        receipts.append({"type": "ballot_receipt",
+                                         "ballot_id": vote_num,
+                                         "voter_token": tokens})
+        except ValueError as e:
+            # Validation error - send back to user
+            return [], {"type": "validation_error",
+                        "message": str(e),
+                        "ballot_id": vote_num}
+        for vote_id, delta in turnout.items():
+            if delta:
+                self.meeting().notify_managers({"type": "vote.turnout",
+                                                "vote_id": vote_id,
+                                                "delta": delta})
+        for vote_id in ranked:
+            provisional.ballots_changed(self.meeting_id, vote_id)
+        return receipts, None
 
     def boot_others(self):
-        others = Session.objects.filter(auth_token=self.session.auth_token)
-        others = others.exclude(pk=self.session.id)
+        others = Session.objects.filter(auth_token_id=self.auth_token_id)
+        others = others.exclude(pk=self.session_id)
         others = others.exclude(channel=None)
-        for other_session in others.all():
-            async_to_sync(self.channel_layer.send)(other_session.channel, {"type": "boot"})
+        for other_session in others.only('id'):
+            async_to_sync(self.control_layer.group_send)(other_session.control_group_name(), {"type": "boot"})
+
+    def meeting(self):
+        # Only the pk is needed for group names and manager pushes, so don't query for the rest.
+        return Meeting(pk=self.meeting_id)
 
     def vote_opening(self, event):
         vote = Vote.objects.get(pk=event['vote_id'])
         self.send_vote(vote)
 
-    def send_vote(self, vote):
+    def send_vote(self, vote, voted_tokens=None):
+        if voted_tokens is None:
+            voted_tokens = vote.get_method_class().voted_tokens(vote, self.voter_tokens)
         options = []
+        option_list = list(vote.option_set.all())
         if vote.method == vote.STV:
-            option_list = vote.option_set.order_by('?').all()
-        else:
-            option_list = vote.option_set.all()
+            random.shuffle(option_list)
         for option in option_list:
             options.append({
                 "id": option.id,
@@ -143,7 +254,7 @@ class UIConsumer(JsonWebsocketConsumer):
             "method": vote.method,
             "options": options,
             "proxies": True,
-            "existing_ballots": list(BallotEntry.objects.filter(option__vote=vote, token_id__in=self.voter_tokens).values("option__vote", "token_id")),
+            "existing_ballots": [{"option__vote": vote.id, "token_id": token_id} for token_id in voted_tokens],
         }
         self.send_json(message)
 
@@ -169,7 +280,20 @@ class UIConsumer(JsonWebsocketConsumer):
         }
         self.send_json(message)
         self.websocket_disconnect(None)
-        self.session.delete()
+        Session.objects.filter(pk=self.session_id).delete()
+
+    def token_revoked(self, event):
+        self.terminate("Auth Token Deactivated")
+
+    def token_set_rotated(self, event):
+        if event['token_set_id'] != self.token_set_id:
+            self.terminate("Old Auth Token")
+
+    def terminate(self, reason):
+        self.token_valid = False
+        self.send_json({"type": "terminate_session",
+                        "reason": reason})
+        self.websocket_disconnect(None)
 
     def bad_message(self, content):
         self.send_json({"type": "Bad Message"})
@@ -26,8 +26,11 @@ urlpatterns = [
     path('reports/<int:meeting_id>.json', reports.meeting_report_json, name='meeting/report/meeting/json'),
     path('reports/<int:meeting_id>.yaml', reports.meeting_report_yaml, name='meeting/report/meeting/yaml'),
     path('reports/<int:meeting_id>/<int:vote_id>', reports.vote_report, name='meeting/report/vote'),
+    path('reports/<int:meeting_id>/<int:vote_id>.<str:extension>', reports.vote_report_file,
+         name='meeting/report/vote/file'),
     path('public/vote/<uuid:public_id>/', reports.public_reports.public_vote_report, name='meeting/public_vote_report'),
     path('public/meeting/<uuid:public_id>/', reports.public_reports.public_meeting_report, name='meeting/public_meeting_report'),
     path('list', views.meeting_list, name='meeting/list'),
+    path('metrics/channels', views.channel_layer_metrics, name='meeting/metrics/channels'),
     path('kiosk_redirect', views.kiosk_redirect, name='meeting/kiosk_redirect')
 ]
@@ -10,3 +10,4 @@ from .manage_vote import manage_vote
 from .manage_options import add_option, remove_option, update_vote_field
 from .meeting_list import meeting_list
 from .kiosk_redirect import kiosk_redirect
+from .metrics import channel_layer_metrics
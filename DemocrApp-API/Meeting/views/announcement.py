@@ -1,5 +1,3 @@
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 from django.contrib.auth.decorators import login_required, permission_required
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
@@ -18,8 +16,6 @@ def announcement(request, meeting_id):
     if "message" not in request.POST:
         return JsonResponse({"result": "failure",
                              "error": "no message"})
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(meeting.channel_group_name(),
-                                            {"type": "announcement",
-                                             "message": request.POST["message"]})
+    meeting.send_control({"type": "announcement",
+                          "message": request.POST["message"]})
     return JsonResponse({"result": "success"})
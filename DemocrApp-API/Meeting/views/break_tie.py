@@ -11,30 +11,20 @@ from ..models import Meeting, Vote, Tie
 def break_tie(request, meeting_id, vote_id):
     meeting = get_object_or_404(Meeting, pk=meeting_id)
     vote = get_object_or_404(Vote, pk=vote_id)
-    if vote.token_set.meeting == meeting and vote.state == vote.READY:
+    if vote.token_set.meeting_id == meeting.pk and vote.state == vote.READY:
         return JsonResponse({'error': 'meeting vote mismatch'}, status=401)
 
     if vote.state == Vote.NEEDS_TIE_BREAKER:
         if request.method == "GET":
-            options = {}
-            for tied_candidate in vote.tie_set.all():
-                options[tied_candidate.option.id] = {
-                    "name": tied_candidate.option.name
-                }
-            message = {"type": "tied_options",
-                       "options": options,
-                       }
-            context = {"options": vote.tie_set.all()}
+            context = {"options": vote.tie_set.select_related('option')}
             return render(request, 'meeting/tie_breaking.html', context)
         elif request.method == "POST":
             winner = request.POST['winner_id']
             if not Tie.objects.filter(vote=vote, option_id=winner).exists():
                 return JsonResponse({'error': 'winner_id was not an option'}, status=401)
 
-            for tie in Tie.objects.filter(vote=vote).exclude(option_id=winner).all():
-                tie.delete()
-            vote.state = vote.COUNTING
-            vote.save()
+            # False if another manager's choice got there first
+            vote.break_tie(winner)
             return HttpResponseRedirect(reverse('meeting/manage', args=[meeting_id]))
     else:
         return JsonResponse({"type": "error",
@@ -1,3 +1,4 @@
+from django.db.models import Count
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
@@ -9,14 +10,17 @@ def check_token(request, meeting_id):
     meeting = get_object_or_404(Meeting, pk=meeting_id)
     current_set = meeting.tokenset_set.latest('created_at')
     if current_set.authtoken_set.filter(pk=token).exists():
+        Session.expired().filter(auth_token_id=token).delete()
         s = Session(auth_token_id=token)
         s.save()
-        sessions = Session.objects.filter(auth_token_id=token)
+        # Count(channel) skips NULLs; both come from the (auth_token, channel) index
+        counts = Session.objects.filter(auth_token_id=token).aggregate(num_sessions=Count('pk'),
+                                                                       active_sessions=Count('channel'))
         response = {
             "success": True,
             "session_token": s.id,
-            "num_sessions": sessions.count(),
-            "active_sessions": sessions.exclude(channel=None).count(),
+            "num_sessions": counts['num_sessions'],
+            "active_sessions": counts['active_sessions'],
         }
         response = JsonResponse(response)
     else:
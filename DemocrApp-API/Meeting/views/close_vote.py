@@ -11,22 +11,38 @@ from ..models import Meeting, Vote
 def close_vote(request, meeting_id, vote_id):
     meeting = get_object_or_404(Meeting, pk=meeting_id)
     vote = get_object_or_404(Vote, pk=vote_id)
-    if vote.token_set.meeting != meeting or vote.state != vote.LIVE:
+    if vote.token_set.meeting != meeting:
+        return JsonResponse({'result': 'failure'}, status=401)
+    if vote.state == vote.COUNTING:
+        # A repeated close (a double click, or a retry after a slow response): the
+        # manage page follows the count that is already under way. A count lost with a
+        # restarted worker long ago is queued again.
+        vote.requeue_count()
+        return HttpResponseRedirect(reverse('meeting/manage', args=[meeting.id]))
+    if vote.state != vote.LIVE:
         return JsonResponse({'result': 'failure'}, status=401)
 
     # Handle POST data for setting num_seats or majority_threshold before closing
     if request.method == 'POST':
+        fields = {}
         if 'num_seats' in request.POST:
-            vote.num_seats = int(request.POST['num_seats'])
-            vote.save()
+            fields['num_seats'] = int(request.POST['num_seats'])
         if 'majority_threshold' in request.POST:
-            vote.majority_threshold = request.POST['majority_threshold']
-            vote.save()
+            fields['majority_threshold'] = request.POST['majority_threshold']
+        # Only while the vote is still LIVE: saving this copy of it would undo a
+        # concurrent close that has frozen or counted it since it was loaded
+        if fields and not Vote.objects.filter(pk=vote.pk, state=Vote.LIVE).update(**fields):
+            return HttpResponseRedirect(reverse('meeting/manage', args=[meeting.id]))
+        for name, value in fields.items():
+            setattr(vote, name, value)
 
     try:
+        # False if a concurrent close got there first, which is as good as success
         vote.close()
     except ValueError as e:
         return JsonResponse({'result': 'failure', 'error': str(e)}, status=400)
+    except TimeoutError as e:
+        return JsonResponse({'result': 'failure', 'error': str(e)}, status=503)
     message = {'type': 'success'}
     return HttpResponseRedirect(reverse('meeting/manage', args=[meeting.id]))
 
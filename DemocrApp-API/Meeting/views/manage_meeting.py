@@ -1,14 +1,11 @@
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 from django.contrib.auth.decorators import login_required, permission_required
 from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
-from django.utils import timezone
 
 import urllib.parse
 
 from Meeting.form import VoteForm
-from ..models import Meeting, Vote, AuthToken, Option
+from ..models import Meeting, Vote, AuthToken, Option, Session
 
 
 @login_required(login_url='/api/admin/login')
@@ -21,7 +18,8 @@ def manage_meeting(request, meeting_id):
     else:
         form = VoteForm()
         context['meeting'] = meeting
-        context['votes'] = Vote.objects.filter(token_set__meeting=meeting)
+        context['votes'] = Vote.with_responses(Vote.objects.filter(token_set__meeting=meeting))
+        context['connected_voters'] = meeting.connected_voters()
         context['form'] = form
         return render(request, 'meeting/meeting.html', context)
 
@@ -34,12 +32,11 @@ def close_meeting(request, meeting_id):
 
         # Check all LIVE votes have required fields set
         votes_missing_fields = []
-        for t_set in meeting.tokenset_set.all():
-            for vote in t_set.vote_set.filter(state=Vote.LIVE):
-                if vote.method == Vote.YES_NO_ABS and not vote.majority_threshold:
-                    votes_missing_fields.append(f"{vote.name} (needs majority threshold)")
-                elif vote.method == Vote.STV and not vote.num_seats:
-                    votes_missing_fields.append(f"{vote.name} (needs number of seats)")
+        for vote in Vote.objects.filter(token_set__meeting=meeting, state=Vote.LIVE):
+            if vote.method == Vote.YES_NO_ABS and not vote.majority_threshold:
+                votes_missing_fields.append(f"{vote.name} (needs majority threshold)")
+            elif vote.method == Vote.STV and not vote.num_seats:
+                votes_missing_fields.append(f"{vote.name} (needs number of seats)")
 
         # If any votes are missing required fields, return error
         if votes_missing_fields:
@@ -49,20 +46,13 @@ def close_meeting(request, meeting_id):
                 "votes": votes_missing_fields
             }, status=400)
 
-        # All votes have required fields, proceed with closing
-        for t_set in meeting.tokenset_set.all():
-            for vote in t_set.vote_set.filter(state=Vote.LIVE):
-                vote.close()
-            for vote in t_set.vote_set.filter(state=Vote.READY):
-                vote.delete()
-
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(meeting.channel_group_name(),
-                                                {"type": "announcement",
-                                                 "message": "This meeting has now closed"})
-        meeting.close_time = timezone.now()
-        meeting.save()
-        return redirect("meeting/report/meeting", meeting_id=meeting_id)
+        # All votes have required fields, proceed with closing. The counts carry on in
+        # the background, and the manage page shows their progress.
+        try:
+            meeting.close()
+        except TimeoutError as e:
+            return JsonResponse({'result': 'failure', 'error': str(e)}, status=503)
+        return redirect("meeting/manage", meeting_id=meeting_id)
     return JsonResponse({"result": "failure", "reason": "this endpoint requires POST as it changes state"})
 
 
@@ -123,7 +113,7 @@ def deactivate_token(request, meeting_id):
                                  'reason': 'token doesnt exist'})
         elif at.filter(token_set__meeting=meeting).exists():
             at.filter(token_set__meeting=meeting).update(active=False)
-            #TODO(close any open websockets (probably through any related sessions))
+            Session.notify(list(at.values_list('pk', flat=True)), {"type": "token.revoked"})
             return JsonResponse({'result': 'success'})
         else:
             return JsonResponse({'result': 'failure',
@@ -150,7 +140,7 @@ def get_ballot_candidates(request, meeting_id, vote_id):
         "state": vote.state,
         "method": vote.method,
         "candidates": candidates_list,
-        "results": vote.results,
+        "results": vote.report_html,
         "hide_from_public_report": vote.hide_from_public_report
     }
 
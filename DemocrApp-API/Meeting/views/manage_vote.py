@@ -2,7 +2,7 @@ from django.contrib.auth.decorators import login_required, permission_required
 from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
-from ..models import Meeting, Vote
+from ..models import Meeting, Vote, bump_meeting_version
 
 
 @login_required(login_url='/api/admin/login')
@@ -14,6 +14,7 @@ def manage_vote(request, meeting_id, vote_id):
         return HttpResponse("this vote is not part of the selected meeting")
     if request.method == "POST" and request.POST['_method'] == "DELETE" and vote.state == Vote.READY:
         vote.delete()
+        bump_meeting_version(pk=meeting.pk)
         return HttpResponseRedirect(reverse('meeting/manage', args=[meeting.id]))
     context = {'meeting': meeting,
                'vote': vote}
@@ -1,35 +1,34 @@
 from django.contrib.auth.decorators import permission_required, login_required
-from django.http import JsonResponse
-from django.shortcuts import get_object_or_404
-from ..models import Meeting
+from django.db.models import Count
+from django.http import JsonResponse, Http404
+from django.views.decorators.http import condition
+from ..models import Meeting, TokenSet, Vote
+
+
+def _etag(request, meeting_id):
+    # No Last-Modified as well: a timestamp can't tell apart changes within the same second
+    version = Meeting.objects.filter(pk=meeting_id).values_list('version', flat=True).first()
+    return None if version is None else "meeting-{}-{}".format(meeting_id, version)
 
 
 @login_required(login_url='/api/admin/login')
 @permission_required('Meeting.add_meeting')
+@condition(etag_func=_etag)
 def meeting(request, meeting_id):
-    meeting = get_object_or_404(Meeting, pk=meeting_id)
-    token_sets = meeting.tokenset_set.order_by('created_at').all()
-    votes = []
-    for t_set in token_sets:
-        votes += t_set.vote_set.all()
-    context = {
-        'meeting': meeting,
-        'token_sets': token_sets,
-        'vote_list': votes}
-    token_set_dict = {}
-    for token_set in token_sets:
-        token_set_dict[token_set.id] = token_set.authtoken_set.count()
-    vote_dict = {}
-    for vote in votes:
-        vote_data = {"name": vote.name,
-                     "description": vote.description,
-                     "method": vote.method,
-                     "state": vote.state,
-                     }
-        vote_dict[vote.id] = vote_data
+    # Every meeting has a token set, so the name comes along with their token counts
+    token_sets = list(TokenSet.objects.filter(meeting_id=meeting_id).order_by('created_at')
+                      .annotate(tokens=Count('authtoken')).values_list('id', 'tokens', 'meeting__name'))
+    if not token_sets:
+        raise Http404
+    votes = Vote.objects.filter(token_set__meeting_id=meeting_id).order_by('token_set__created_at', 'pk') \
+        .values_list('id', 'name', 'description', 'method', 'state')
     message = {
-        'name': meeting.name,
-        'token_sets': token_set_dict,
-        'votes': vote_dict,
+        'name': token_sets[0][2],
+        'token_sets': {token_set_id: tokens for token_set_id, tokens, _ in token_sets},
+        'votes': {vote_id: {"name": name,
+                            "description": description,
+                            "method": method,
+                            "state": state,
+                            } for vote_id, name, description, method, state in votes},
     }
     return JsonResponse(message)
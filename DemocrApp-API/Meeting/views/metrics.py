@@ -0,0 +1,14 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth.decorators import login_required, permission_required
+from django.http import JsonResponse
+
+from ..channel_metrics import layer_snapshot
+
+
+@login_required(login_url='/api/admin/login')
+@permission_required('Meeting.add_meeting')
+def channel_layer_metrics(request):
+    return JsonResponse({alias: async_to_sync(layer_snapshot)(get_channel_layer(alias))
+                         for alias in settings.CHANNEL_LAYERS})
@@ -1,4 +1,4 @@
 from .meeting_report import meeting_report, meeting_report_json, meeting_report_yaml
-from .vote_report import vote_report
+from .vote_report import vote_report, vote_report_file
 from .report_list import report_list
 from . import public_reports
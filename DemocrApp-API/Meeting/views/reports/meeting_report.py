@@ -3,22 +3,24 @@ from django.contrib.auth.decorators import login_required, permission_required
 from django.http import JsonResponse, HttpResponse
 from django.shortcuts import render, get_object_or_404
 from ...models import Meeting, Vote
+from ...db_router import reads_from_replica
 
 
 @login_required(login_url='/api/admin/login')
 @permission_required('Meeting.add_meeting', raise_exception=True)
+@reads_from_replica
 def meeting_report(request, meeting_id):
     context = {}
     meeting = get_object_or_404(Meeting, pk=meeting_id)
     context['meeting'] = meeting
-    context['votes'] = Vote.objects.filter(token_set__meeting=meeting)
+    context['votes'] = Vote.for_reports(Vote.objects.filter(token_set__meeting=meeting))
     context['token_sets'] = meeting.tokenset_set.all()
     return render(request, 'meeting/reports/meeting.html', context)
 
 
 def _build_meeting_data(meeting):
     """Build structured data dict for a meeting and its votes."""
-    votes = Vote.objects.filter(token_set__meeting=meeting)
+    votes = Vote.for_reports(Vote.objects.filter(token_set__meeting=meeting))
 
     votes_data = []
     for vote in votes:
@@ -55,6 +57,7 @@ def _build_meeting_data(meeting):
 
 @login_required(login_url='/api/admin/login')
 @permission_required('Meeting.add_meeting', raise_exception=True)
+@reads_from_replica
 def meeting_report_json(request, meeting_id):
     meeting = get_object_or_404(Meeting, pk=meeting_id)
     data = _build_meeting_data(meeting)
@@ -65,6 +68,7 @@ def meeting_report_json(request, meeting_id):
 
 @login_required(login_url='/api/admin/login')
 @permission_required('Meeting.add_meeting', raise_exception=True)
+@reads_from_replica
 def meeting_report_yaml(request, meeting_id):
     meeting = get_object_or_404(Meeting, pk=meeting_id)
     data = _build_meeting_data(meeting)
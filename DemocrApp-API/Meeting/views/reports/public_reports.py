@@ -1,8 +1,10 @@
 import random
 from django.shortcuts import get_object_or_404, render
-from Meeting.models import Vote, TokenSet, BallotEntry
+from Meeting.models import Vote, TokenSet
+from Meeting.db_router import reads_from_replica
 
 
+@reads_from_replica
 def public_vote_report(request, public_id):
     """Public view of single vote with anonymized ballots"""
     vote = get_object_or_404(Vote, public_id=public_id, state=Vote.CLOSED)
@@ -18,13 +20,14 @@ def public_vote_report(request, public_id):
     return render(request, 'meeting/public_vote_report.html', context)
 
 
+@reads_from_replica
 def public_meeting_report(request, public_id):
     """Public view of meeting with summary + all vote details"""
     token_set = get_object_or_404(TokenSet, public_id=public_id)
-    votes = token_set.vote_set.filter(
+    votes = Vote.for_reports(token_set.vote_set.filter(
         state=Vote.CLOSED,
         hide_from_public_report=False
-    ).order_by('id')
+    ).order_by('id'))
 
     # Build summary data
     summary_rows = []
@@ -47,17 +50,18 @@ def public_meeting_report(request, public_id):
 
 def _anonymize_ballots(vote):
     """Convert ballots to sequential anonymous IDs with random order"""
-    ballots = list(BallotEntry.objects.filter(option__vote=vote).select_related('option').all())
+    ballots = [entries for _, entries in vote.ballots()]
     random.shuffle(ballots)
 
     anonymized = []
-    for idx, ballot in enumerate(ballots, 1):
-        anonymized.append({
-            'id': f"Ballot {idx}",
-            'option': ballot.option,
-            'value': ballot.value,
-            'ballot': ballot,  # For template access to related data
-        })
+    for idx, entries in enumerate(ballots, 1):
+        for ballot in entries:
+            anonymized.append({
+                'id': f"Ballot {idx}",
+                'option': ballot.option,
+                'value': ballot.value,
+                'ballot': ballot,  # For template access to related data
+            })
 
     return anonymized
 
@@ -1,10 +1,12 @@
 from django.contrib.auth.decorators import login_required, permission_required
 from django.shortcuts import render
 from ...models import Meeting
+from ...db_router import reads_from_replica
 
 
 @login_required(login_url='/api/admin/login')
 @permission_required('Meeting.add_meeting', raise_exception=True)
+@reads_from_replica
 def report_list(request):
     context = {'meetings': Meeting.objects.filter(close_time__isnull=False)}
     return render(request, 'meeting/reports/list.html', context)
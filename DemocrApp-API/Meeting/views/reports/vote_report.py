@@ -1,24 +1,47 @@
 from django.contrib.auth.decorators import login_required, permission_required
+from django.http import Http404, HttpResponse
 from django.shortcuts import render, get_object_or_404
-from ...models import Meeting, Vote, VoterToken
+from ...models import Meeting, Vote
+from ...db_router import reads_from_replica
+
+# STV count reports to download, by file extension: (report format, content type, label)
+REPORT_FILES = {
+    "txt": ("text", "text/plain", "Text"),
+    "csv": ("csv", "text/csv", "CSV"),
+    "yaml": ("yaml", "application/x-yaml", "YAML"),
+}
 
 
 @login_required(login_url='/api/admin/login')
 @permission_required('Meeting.add_meeting', raise_exception=True)
+@reads_from_replica
 def vote_report(request, meeting_id, vote_id):
     context = {}
     vote = get_object_or_404(Vote, pk=vote_id)
     context['vote'] = vote
-    voters = VoterToken.objects.filter(ballotentry__option__vote=vote).distinct()
-    present_voters = voters.filter(proxy=False).all()
-    proxies = voters.filter(proxy=True).all()
     votes = []
-    for v in present_voters:
-        votes.append(v.ballotentry_set.filter(option__vote=vote).order_by('value'))
     proxy_votes = []
-    for v in proxies:
-        proxy_votes.append(v.ballotentry_set.filter(option__vote=vote).order_by('value'))
+    for token, entries in vote.ballots():
+        (proxy_votes if token.proxy else votes).append(entries)
     context['votes'] = votes
     context['proxy_votes'] = proxy_votes
     context['options'] = vote.option_set.all()
+    context['meeting_id'] = meeting_id
+    context['report_files'] = [(extension, label) for extension, (_, _, label) in REPORT_FILES.items()]
     return render(request, 'meeting/reports/vote.html', context)
+
+
+@login_required(login_url='/api/admin/login')
+@permission_required('Meeting.add_meeting', raise_exception=True)
+@reads_from_replica
+def vote_report_file(request, meeting_id, vote_id, extension):
+    if extension not in REPORT_FILES:
+        raise Http404("Unknown report format")
+    vote = get_object_or_404(Vote, pk=vote_id, token_set__meeting_id=meeting_id)
+    report_format, content_type, _ = REPORT_FILES[extension]
+    report = vote.report(report_format)
+    if report is None:
+        raise Http404("No count report for this vote")
+    response = HttpResponse(report, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="vote_{vote_id}_report.{extension}"'
+    return response
@@ -1,80 +1,239 @@
 import logging
-from queue import Queue
 from threading import Thread
 from time import sleep
 
+from django.conf import settings
+from django.utils import timezone
+
 from openstv.ballots import Ballots
 from openstv.MethodPlugins.ScottishSTV import ScottishSTV
+from openstv.record import recordElection, ElectionRecord
+from openstv.ReportPlugins.CsvReport import CsvReport
 from openstv.ReportPlugins.HtmlReport import HtmlReport
+from openstv.ReportPlugins.TextReport import TextReport
+from openstv.ReportPlugins.YamlReport import YamlReport
+from openstv.resultcache import fingerprint
+from openstv.STV import TieBreakNeeded
 from Meeting.voting_methods.vote_method import VoteMethod
 
 logger = logging.getLogger(__name__)
 
 
 class STV(VoteMethod):
+    # Rows of rankings fetched per round trip when extracting a count's ballots
+    EXTRACT_CHUNK_SIZE = 2000
+    REPORTS = {"html": HtmlReport, "text": TextReport, "csv": CsvReport, "yaml": YamlReport}
 
     @classmethod
     def count(cls, vote_id, **kwargs):
+        # STV counts take a while, so they always go on the pool
         from Meeting.models import Vote
-        vote = Vote.objects.get(pk=vote_id)
-        seats = kwargs.get("num_seats", 1)
+        vote = Vote.objects.select_related('token_set').get(pk=vote_id)
         assert vote.method == Vote.STV
-        count_thread = Thread(target=cls._count, args=(vote_id, seats), daemon=True)
-        count_thread.start()
+        cls.count_later(vote.token_set.meeting_id, vote_id, **kwargs)
 
     @classmethod
-    def _count(cls, vote_id, seats):
-        from Meeting.models import Vote, BallotEntry, Tie, Option
-        vote = Vote.objects.get(pk=vote_id)
-        ballots = Ballots()
+    def count_later(cls, meeting_id, vote_id, **kwargs):
+        from Meeting import counting
+        return counting.submit(meeting_id, vote_id, cls._count, vote_id, kwargs.get("num_seats", 1),
+                               kwargs.get("recount", False))
+
+    @classmethod
+    def _count(cls, vote_id, seats, recount=False):
+        """
+        Count a frozen vote and close it. Ballots identical to an earlier count's get that
+        count's results from the cache unless recount is set. Counts that needed a chair
+        to break a tie aren't cached, as the chair's choice was for that vote alone.
+
+        A strong tie suspends the count rather than holding a worker until the chairs
+        break it: the vote waits in NEEDS_TIE_BREAKER with its checkpoint and Tie rows,
+        and Vote.break_tie() queues this again to carry on from the checkpoint.
+
+        With PROFILE_STV_COUNTS set, the timings of a count that ran are kept in
+        results_data["profile"] (see openstv.profiling).
+        """
+        from Meeting.models import Vote, Tie
+        from Meeting.counting import results_cache
+        vote = Vote.objects.select_related('token_set').get(pk=vote_id)
+        ballots = cls.extract_ballots(vote, seats)
+        # Any strong tie is up to the chairs, however long it takes them
+        key = fingerprint(ballots, ScottishSTV, strongTieBreakMethod="manual")
+        checkpoint, chosen, results = vote.count_checkpoint, None, None
+        if checkpoint and checkpoint["fingerprint"] != key:
+            logger.warning("Ballots for vote %s changed while its count was suspended, counting afresh", vote_id)
+            checkpoint = None
+        tie = Tie.objects.filter(vote=vote).first() if checkpoint else None
+        if checkpoint and tie is None:
+            # A resumed count that was lost after taking the chairs' choice; they choose again
+            logger.warning("Vote %s has a checkpoint but no tie break, counting afresh", vote_id)
+            checkpoint = None
+        if checkpoint:
+            chosen = cls.candidates(vote).index(tie.option_id)
+            tie.delete()
+        else:
+            if recount:
+                results_cache.invalidate(key)
+            results = results_cache.get(key)
+        if results is None:
+            try:
+                electionCounter = cls.run_election(vote, ballots, checkpoint=checkpoint, chosen=chosen,
+                                                   profile=settings.PROFILE_STV_COUNTS)
+            except TieBreakNeeded as suspended:
+                cls.suspend(vote, dict(suspended.checkpoint, fingerprint=key), suspended.names)
+                return
+            results = cls.report(electionCounter, seats)
+            if not electionCounter.tieDecisions:
+                results_cache.put(key, results)
+            if electionCounter.profile is not None:
+                # Not cached: the timings are this count's own
+                results = dict(results, results_data=dict(results["results_data"],
+                                                          profile=electionCounter.profile.data()))
+        cls.store_results(vote, results)
+
+    @classmethod
+    def recompute(cls, vote):
+        seats = vote.num_seats or vote.results_data.get("seats") or 1
+        archived = vote.archived()
+        # The ballots of an archived vote are only in its snapshot
+        rankings = None if archived is None else [[option_id for option_id, _ in ballot['entries']]
+                                                  for ballot in archived['ballots']]
+        try:
+            electionCounter = cls.run_election(vote, cls.extract_ballots(vote, seats, rankings), progress=False)
+        except TieBreakNeeded:
+            return None
+        return cls.results_data(electionCounter, seats)
+
+    @classmethod
+    def candidates(cls, vote):
+        """The vote's option ids by openstv candidate number."""
+        return list(vote.option_set.order_by('pk').values_list('pk', flat=True))
+
+    @classmethod
+    def suspend(cls, vote, checkpoint, names):
+        """Park a count at a strong tie until the meeting's managers break it."""
+        from Meeting.models import Tie
+        option_ids = cls.candidates(vote)
+        Tie.objects.filter(vote=vote).delete()
+        Tie.objects.bulk_create(Tie(vote=vote, option_id=option_ids[c]) for c in checkpoint["tied"])
+        vote.refresh_from_db()
+        vote.state = vote.NEEDS_TIE_BREAKER
+        vote.count_checkpoint = checkpoint
+        vote.save()
+        vote.token_set.meeting.notify_managers({"type": "tie.break",
+                                                "vote_id": vote.pk,
+                                                "options": list(names)})
 
-        options = vote.option_set.all().order_by('pk')
-        option_translation = {}
-        names = []
-        for index, option in enumerate(options):
-            option_translation[option.id] = index
-            names.append(option.name)
-        ballots.setNames(names)
+    @classmethod
+    def extract_ballots(cls, vote, seats, rankings=None):
+        """
+        The vote's ballots as openstv Ballots, candidates numbered in option order, or
+        the given rankings (lists of option ids) instead.
+
+        Rankings are streamed from the database as bare JSON values, EXTRACT_CHUNK_SIZE
+        rows at a time, and appended in bulk, so a large election never holds a model
+        instance per ballot.
+        """
+        from Meeting.models import RankedBallot
+        ballots = Ballots()
+        option_ids = list(vote.option_set.order_by('pk').values_list('pk', 'name'))
+        option_translation = {option_id: index for index, (option_id, _) in enumerate(option_ids)}
+        ballots.setNames([name for _, name in option_ids])
         ballots.numSeats = seats
 
-        voter = -1
-        ballot = []
-        for be in BallotEntry.objects.filter(option__vote=vote).order_by('token_id', 'value').all():
-            if voter != be.token_id and ballot != []:
-                ballots.appendBallot(ballot)
-                ballot = []
-            voter = be.token_id
-            ballot.append(option_translation[be.option_id])
-        if ballots != []:
-            ballots.appendBallot(ballot)
+        if rankings is None:
+            rankings = (RankedBallot.objects.filter(vote=vote).order_by('token_id')
+                        .values_list('preferences', flat=True).iterator(chunk_size=cls.EXTRACT_CHUNK_SIZE))
+        ballots.appendBallots([option_translation[option_id] for option_id in preferences]
+                              for preferences in rankings)
+        return ballots
 
+    @classmethod
+    def run_election(cls, vote, ballots, tie_break="suspend", checkpoint=None, chosen=None, profile=False,
+                     progress=True):
+        """
+        Count the ballots with Scottish STV and return the finished election, reporting
+        progress as the count goes. A strong tie raises openstv's TieBreakNeeded; to
+        carry on once it is broken, pass its checkpoint and the chosen candidate. Given
+        another openstv tie break method, which needs no one, or without progress, the
+        count just runs in this thread. The election's tieDecisions lists the ties the
+        chairs broke. With profile, its profile has the count's timings.
+        """
+        from Meeting.counting import report_progress
         electionCounter = ScottishSTV(ballots)
-        electionCounter.strongTieBreakMethod = "manual"
-        electionCounter.breakTieRequestQueue = Queue(1)
-        electionCounter.breakTieResponseQueue = Queue(1)
-        countThread = Thread(target=electionCounter.runElection)
+        electionCounter.strongTieBreakMethod = tie_break
+        if profile:
+            electionCounter.enableProfile()
+
+        def run():
+            if checkpoint is None:
+                electionCounter.runElection()
+            else:
+                electionCounter.resume(checkpoint, chosen)
+
+        if tie_break != "suspend" or not progress:
+            run()
+            return electionCounter
+        failure = []
+
+        def count():
+            try:
+                run()
+            except Exception as e:
+                failure.append(e)
+
+        countThread = Thread(target=count)
         countThread.start()
+        reported_round = None
         while countThread.is_alive():
             sleep(0.1)
-            if not electionCounter.breakTieRequestQueue.empty():
-                [tiedCandidates, names, what] = electionCounter.breakTieRequestQueue.get()
-                c = cls.ask_user_to_break_tie(tiedCandidates, names, what, vote)
-                electionCounter.breakTieResponseQueue.put(c)
             if "R" in vars(electionCounter):
                 status = "Counting votes using {}\nRound: {}".format(electionCounter.longMethodName,
                                                                      electionCounter.R + 1)
+                if electionCounter.R != reported_round:
+                    reported_round = electionCounter.R
+                    report_progress(vote.token_set.meeting_id, vote.pk,
+                                    "Counting: round {}".format(electionCounter.R + 1))
             else:
                 status = "Counting votes using %s\nInitializing..." % \
                          electionCounter.longMethodName
             logger.debug(status)
+        if failure:
+            raise failure[0]
         logger.info(electionCounter.winners)
+        return electionCounter
+
+    @classmethod
+    def report(cls, electionCounter, seats):
+        """
+        The openstv record and structured results of a finished election. Reports are
+        rendered from the record when they're first shown (see render_report()), not here.
+        """
+        return {"record": recordElection(electionCounter),
+                "results_data": cls.results_data(electionCounter, seats)}
+
+    @classmethod
+    def store_results(cls, vote, results):
+        """Close the vote with results from report()."""
+        from Meeting.models import Vote
         vote.refresh_from_db()
         vote.state = Vote.CLOSED
-        r = HtmlReport(electionCounter)
+        vote.count_checkpoint = None
+        vote.results = ""
+        vote.count_record = results["record"]
+        vote.results_data = results["results_data"]
+        vote.save()
+
+    @classmethod
+    def render_report(cls, record, format="html"):
+        """Render a count's report, in one of REPORTS' formats, from its openstv record."""
+        r = cls.REPORTS[format](ElectionRecord(record))
         r.generateReport()
-        vote.results = r.outputText
+        return r.outputText
 
-        # Store structured results data including round breakdown
+    @classmethod
+    def results_data(cls, electionCounter, seats):
+        """Structured results of a finished election, including the round breakdown."""
+        ballots = electionCounter.b
         # Build winners list with order and round information
         winners = []
         for i, w in enumerate(electionCounter.winners, start=1):
@@ -85,7 +244,7 @@ class STV(VoteMethod):
             })
         loser_names = [electionCounter.b.names[l] for l in electionCounter.losers] if hasattr(electionCounter, 'losers') else []
 
-        vote.results_data = {
+        return {
             "winners": winners,
             "losers": loser_names,
             "seats": seats,
@@ -99,32 +258,38 @@ class STV(VoteMethod):
                 for round_num in range(electionCounter.numRounds)
             ]
         }
-        vote.save()
 
     @classmethod
-    def ask_user_to_break_tie(cls, tied_candidates, names, what, vote):
-        from Meeting.models import Option, Tie
-        for candidate in names:
-            option = Option.objects.filter(name=candidate, vote=vote).first()
-            tie = Tie(vote=vote, option=option)
-            tie.save()
-        vote.state = vote.NEEDS_TIE_BREAKER
-        vote.save()
-        while vote.state == vote.NEEDS_TIE_BREAKER:
-            sleep(1)
-            vote.refresh_from_db()
-
-        if Tie.objects.filter(vote=vote)[:1].count() > 1:
-            logger.error('multiple tie objects after vote')
-        tie = Tie.objects.filter(vote=vote).first()
-        i = names.index(tie.option.name)
-        tie.delete()
-        return tied_candidates[i]
+    def receive_ballot(cls, vote, voter_token_id, ballot_entries):
+        return cls._save_ranking(vote, voter_token_id, cls._preferences(vote, ballot_entries))
 
     @classmethod
     def _handle_ballot(cls, vote, voter_token_id, ballot_entries):
+        """Validate and store a voter's ranking, returning how many preferences were saved."""
+        preferences = cls._preferences(vote, ballot_entries)
+        cls._save_ranking(vote, voter_token_id, preferences)
+        return len(preferences)
+
+    @classmethod
+    def _save_ranking(cls, vote, voter_token_id, preferences):
         """
-        Handle STV ballot submission with consecutive number validation.
+        Replace a voter's ranking. The whole ballot is one RankedBallot row, so this
+        is an update, or an insert for a first ballot. Returns the change in turnout.
+        """
+        from Meeting.models import RankedBallot
+        ballots = RankedBallot.objects.filter(vote=vote, token_id=voter_token_id)
+        if not preferences:
+            deleted, _ = ballots.delete()
+            return -int(deleted > 0)
+        if ballots.update(preferences=preferences, modified_at=timezone.now()):
+            return 0
+        RankedBallot.objects.create(vote=vote, token_id=voter_token_id, preferences=preferences)
+        return 1
+
+    @classmethod
+    def _preferences(cls, vote, ballot_entries):
+        """
+        Validate an STV ballot and return its option ids in preference order.
 
         STV requires preferences to be consecutive integers starting from 1:
         - Valid: {opt1: 1, opt2: 2, opt3: 3}
@@ -132,17 +297,19 @@ class STV(VoteMethod):
         - Invalid: {opt1: 1, opt2: 3} (skipped 2)
         - Invalid: {opt1: 2, opt2: 3} (didn't start at 1)
         """
-        from Meeting.models import BallotEntry
-
         # Extract and validate preference values
         preferences = []
         for option_id, pref_value in ballot_entries.items():
+            try:
+                option_id = int(option_id)
+            except (ValueError, TypeError):
+                raise ValueError(f"Unknown option: {option_id}")
             try:
                 value = int(pref_value)
-                if value >= 1:  # Only consider positive preferences
-                    preferences.append((option_id, value))
             except (ValueError, TypeError):
                 raise ValueError(f"Invalid preference value: {pref_value}")
+            if value >= 1:  # Only consider positive preferences
+                preferences.append((option_id, value))
 
         # Sort by preference value to check consecutiveness
         preferences.sort(key=lambda x: x[1])
@@ -157,9 +324,44 @@ class STV(VoteMethod):
                 )
             expected_pref += 1
 
-        # Save validated ballot entries
-        for option_id, pref_value in preferences:
-            option = vote.option_set.filter(pk=option_id).first()
-            if option is not None:
-                be = BallotEntry(option=option, token_id=voter_token_id, value=pref_value)
-                be.save()
+        # Options that aren't in this vote are dropped
+        options = set(vote.option_set.filter(pk__in=[option_id for option_id, _ in preferences])
+                      .values_list('pk', flat=True))
+        return [option_id for option_id, _ in preferences if option_id in options]
+
+    @classmethod
+    def responses(cls, vote, exclude_proxies=False):
+        from Meeting.models import RankedBallot
+        ballots = RankedBallot.objects.filter(vote=vote)
+        if exclude_proxies:
+            ballots = ballots.filter(token__proxy=False)
+        return ballots.count()
+
+    @classmethod
+    def responses_subquery(cls):
+        from django.db.models import Count, OuterRef, Subquery
+        from Meeting.models import RankedBallot
+        return Subquery(RankedBallot.objects.filter(vote=OuterRef('pk')).order_by().values('vote')
+                        .annotate(n=Count('pk')).values('n'))
+
+    @classmethod
+    def voted_tokens(cls, vote, voter_token_ids):
+        from Meeting.models import RankedBallot
+        return list(RankedBallot.objects.filter(vote=vote, token_id__in=voter_token_ids)
+                    .values_list('token_id', flat=True))
+
+    @classmethod
+    def voted_tokens_by_vote(cls, votes, voter_token_ids):
+        from Meeting.models import RankedBallot
+        voted = {}
+        for vote_id, token_id in (RankedBallot.objects.filter(vote__in=votes, token_id__in=voter_token_ids)
+                                  .values_list('vote_id', 'token_id')):
+            voted.setdefault(vote_id, []).append(token_id)
+        return voted
+
+    @classmethod
+    def ballots(cls, vote):
+        from Meeting.models import RankedBallot
+        options = {option.pk: option for option in vote.option_set.all()}
+        return [(ballot.token, ballot.entries(options))
+                for ballot in RankedBallot.objects.filter(vote=vote).select_related('token').order_by('token_id')]
@@ -1,24 +1,98 @@
-from abc import ABC
+from abc import ABC, abstractmethod
+from itertools import groupby
 
 
 class VoteMethod(ABC):
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Method classes are only used through their classmethods, never instantiated, so
+        # ABC alone wouldn't notice a missing method until it was called
+        missing = [name for name in dir(cls)
+                   if not name.startswith('__') and getattr(getattr(cls, name), '__isabstractmethod__', False)]
+        if missing:
+            raise TypeError("{} doesn't implement {}".format(cls.__name__, ", ".join(missing)))
+
     @classmethod
     def count(cls, vote_id, **kwargs):
         pass
 
+    @classmethod
+    @abstractmethod
+    def recompute(cls, vote):
+        """
+        The vote's results_data counted afresh from its ballots, storing nothing, or None
+        if counting it needs a decision only the chairs can make.
+        """
+
+    @classmethod
+    def count_later(cls, meeting_id, vote_id, **kwargs):
+        """Queue count() for a frozen vote on the count pool instead of running it now."""
+        from Meeting import counting
+        return counting.submit(meeting_id, vote_id, cls.count, vote_id, **kwargs)
+
     @classmethod
     def receive_ballot(cls, vote, voter_token_id, ballot_entries):
+        """
+        Replace a voter's ballot. Returns the change in turnout: 1 for a first
+        ballot, -1 if an empty ballot replaced one, otherwise 0.
+        """
         from Meeting.models import BallotEntry
-        BallotEntry.objects.filter(token_id=voter_token_id, option__vote=vote).delete()
-        cls._handle_ballot(vote, voter_token_id, ballot_entries)
+        deleted, _ = BallotEntry.objects.filter(vote=vote, token_id=voter_token_id).delete()
+        saved = cls._handle_ballot(vote, voter_token_id, ballot_entries)
+        return int(saved > 0) - int(deleted > 0)
 
     @classmethod
     def _handle_ballot(cls, vote, voter_token_id, ballot_entries):
+        """Save a voter's ballot entries and return how many were saved."""
         from Meeting.models import BallotEntry
+        saved = 0
         for ballot_entry in ballot_entries.items():
             value = int(ballot_entry[1])
             option = vote.option_set.filter(pk=ballot_entry[0]).first()
             if option is not None and value >= 1:
-                be = BallotEntry(option=option, token_id=voter_token_id, value=value)
+                be = BallotEntry(vote=vote, option=option, token_id=voter_token_id, value=value)
                 be.save()
+                saved += 1
+        return saved
+
+    @classmethod
+    def responses(cls, vote, exclude_proxies=False):
+        """Number of voters with a ballot in this vote."""
+        from Meeting.models import BallotEntry
+        entries = BallotEntry.objects.filter(vote=vote)
+        if exclude_proxies:
+            entries = entries.filter(token__proxy=False)
+        return entries.values('token').distinct().count()
+
+    @classmethod
+    def responses_subquery(cls):
+        """responses() as an expression over an outer Vote queryset, for annotating many votes at once."""
+        from django.db.models import Count, OuterRef, Subquery
+        from Meeting.models import BallotEntry
+        return Subquery(BallotEntry.objects.filter(vote=OuterRef('pk')).order_by().values('vote')
+                        .annotate(n=Count('token', distinct=True)).values('n'))
+
+    @classmethod
+    def voted_tokens(cls, vote, voter_token_ids):
+        """The subset of the given voter tokens that have a ballot in this vote."""
+        from Meeting.models import BallotEntry
+        return list(BallotEntry.objects.filter(vote=vote, token_id__in=voter_token_ids)
+                    .values_list('token_id', flat=True).distinct())
+
+    @classmethod
+    def voted_tokens_by_vote(cls, votes, voter_token_ids):
+        """voted_tokens() for several votes of this method at once, as {vote id: [token ids]}."""
+        from Meeting.models import BallotEntry
+        voted = {}
+        for vote_id, token_id in (BallotEntry.objects.filter(vote__in=votes, token_id__in=voter_token_ids)
+                                  .values_list('vote_id', 'token_id').distinct()):
+            voted.setdefault(vote_id, []).append(token_id)
+        return voted
+
+    @classmethod
+    def ballots(cls, vote):
+        """Every ballot in this vote as (voter token, entries in preference order), for reports."""
+        from Meeting.models import BallotEntry
+        entries = BallotEntry.objects.filter(vote=vote).select_related('token', 'option').order_by('token_id', 'value')
+        return [(token, list(token_entries)) for token, token_entries in groupby(entries, key=lambda be: be.token)]
@@ -9,17 +9,42 @@ class YNA(VoteMethod):
 
     @classmethod
     def count(cls, vote_id, **kwargs):
-        from Meeting.models import Vote, BallotEntry
+        from Meeting.models import Vote
         vote = Vote.objects.get(pk=vote_id)
         assert vote.method == Vote.YES_NO_ABS
+        results = cls.tally(vote)
+        vote.results = results["results"]
+        vote.results_data = results["results_data"]
+        vote.state = Vote.CLOSED
+        vote.save()
+
+    @classmethod
+    def recompute(cls, vote):
+        archived = vote.archived()
+        if archived is None:
+            return cls.tally(vote)["results_data"]
+        # The ballots of an archived vote are only in its snapshot
+        return cls.tally(vote, [option_id for ballot in archived['ballots']
+                                for option_id, value in ballot['entries'] if value == 1])["results_data"]
+
+    @classmethod
+    def tally(cls, vote, choices=None):
+        """
+        The vote's HTML results and results_data, from its ballots as they stand, or from
+        choices, the option id of each ballot, if given.
+        """
+        from Meeting.models import BallotEntry
         counts = {
             vote.option_set.filter(name="yes").first().id: 0,
             vote.option_set.filter(name="no").first().id: 0,
             vote.option_set.filter(name="abs").first().id: 0,
         }
-        for be in BallotEntry.objects.filter(option__vote=vote, value=1).order_by('token_id', 'value').all():
-            if be.option_id in counts.keys():
-                counts[be.option_id] += 1
+        if choices is None:
+            choices = BallotEntry.objects.filter(vote=vote, value=1).order_by('token_id', 'value') \
+                .values_list('option_id', flat=True)
+        for option_id in choices:
+            if option_id in counts.keys():
+                counts[option_id] += 1
             else:
                 logger.error("suspicious ballot entry with id: {} had non y n a option in a y n a vote")
         y, n, a = counts.values()
@@ -103,8 +128,7 @@ class YNA(VoteMethod):
         </div>
         """.format(y, y_pct, n, n_pct, a, a_pct, total, status_section)
 
-        vote.results = html_results
-        vote.results_data = {
+        return {"results": html_results, "results_data": {
             "yes": y,
             "no": n,
             "abstain": a,
@@ -119,6 +143,4 @@ class YNA(VoteMethod):
             "has_two_thirds": has_two_thirds,
             "passed": passed,
             "majority_threshold": threshold,
-        }
-        vote.state = Vote.CLOSED
-        vote.save()
+        }}
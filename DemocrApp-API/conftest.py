@@ -23,5 +23,8 @@ def configure_test_channel_layer():
     settings.CHANNEL_LAYERS = {
         "default": {
             "BACKEND": "channels.layers.InMemoryChannelLayer",
-        }
+        },
+        "control": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
     }
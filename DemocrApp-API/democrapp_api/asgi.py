@@ -10,6 +10,7 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "democrapp_api.settings")
 
 django_asgi_app = get_asgi_application()
 
+from Meeting.manage_consumer import ManageConsumer
 from Meeting.ui_consumer import UIConsumer
 
 application = ProtocolTypeRouter({
@@ -21,6 +22,7 @@ application = ProtocolTypeRouter({
         AuthMiddlewareStack(
             URLRouter([
                 path("cast", UIConsumer.as_asgi()),
+                path("cast/manage/<int:meeting_id>", ManageConsumer.as_asgi()),
             ])
         )
     ),
@@ -14,7 +14,6 @@
 
 __revision__ = "$Id: report.py 570 2009-08-20 17:46:56Z jeff.oneill $"
 
-import string
 
 from openstv.version import v as OpenSTV_version
 from openstv.plugins import ReportPlugin
@@ -131,12 +130,12 @@ class CsvReport(ReportPlugin):
         tl2 += ',"Surplus of",'
         surplus = [self.cleanB.names[c] for c in self.e.roundInfo[R]["action"][1]]
         surplus.sort()
-        tl3 += ',"' + string.join(surplus, '+') + '",'
+        tl3 += ',"' + '+'.join(surplus) + '",'
       elif self.e.roundInfo[R]["action"][0] == "eliminate":
         tl2 += ',"Exclusion of",'
         eliminated = [self.cleanB.names[c] for c in self.e.roundInfo[R]["action"][1]]
         eliminated.sort()
-        tl3 += ',"' + string.join(eliminated, '+') + '",'
+        tl3 += ',"' + '+'.join(eliminated) + '",'
       else:
         assert(0)
 
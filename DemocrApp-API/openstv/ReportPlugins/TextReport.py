@@ -218,12 +218,14 @@ Matrix of beatpath magnitudes:
       self.output("Using IRV to choose the winner from the Smith set.\n\n")
       R = TextReport(self.e.e, self.maxWidth, "table", outputFile = self.outputFile)
       R.generateReport()
+      self.outputParts.extend(R.outputParts)
       self.output("\n")
     elif self.e.completion == "Borda on Smith Set":
       self.output("Using the Borda count to choose the winner "\
             "from the Smith set.\n\n")
       R = TextReport(self.e.e, self.maxWidth, "table", outputFile = self.outputFile)
       R.generateReport()
+      self.outputParts.extend(R.outputParts)
       self.output("\n")
     self.output(self.getWinnerText(self.e.winners) + "\n")
 
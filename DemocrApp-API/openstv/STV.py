@@ -1,5 +1,6 @@
 """Module that provides code that can be used for different counting methods.
 
+Class TieBreakNeeded
 Class ElectionMethod
   Class NonIterative
   Class Iterative
@@ -28,6 +29,28 @@ __revision__ = "$Id: STV.py 822 2010-11-21 05:25:43Z jeff.oneill $"
 
 import random
 
+from openstv.profiling import CountProfile
+
+##################################################################
+
+class TieBreakNeeded(Exception):
+  """Raised by a count using the "suspend" strong tie break method when it
+  reaches a strong tie it has no decision for.
+
+  checkpoint holds everything needed to finish the count once the tie has
+  been decided: the decisions made at earlier ties, the tied candidates, what
+  they were tied for and the round reached.  It is plain lists, strings and
+  numbers, so it can be stored as JSON while no thread waits for the
+  decision.  Pass it to resume() with the chosen candidate.
+  """
+
+  def __init__(self, checkpoint, names):
+    Exception.__init__(self, "Candidates %s are tied" % ", ".join(names))
+    self.checkpoint = checkpoint
+    self.tiedCandidates = checkpoint["tied"]
+    self.names = names
+    self.what = checkpoint["what"]
+
 ##################################################################
 
 class ElectionMethod(object):
@@ -73,13 +96,17 @@ class ElectionMethod(object):
   
     strongTieBreakMethod -- A strong tie is one that is broken externally to the
     count (contrast with weak ties in Iterative methods).  Allowable values are
-    "random", "alpha", "index", and "manual".
+    "random", "alpha", "index", "manual", and "suspend".  "suspend" stops
+    the count with TieBreakNeeded at a tie with no decision in tieDecisions.
 
     breakTieRequestQueue, breakTieResponseQueue -- These are used to manually 
     break ties from a GUI.  The counting is done in a thread, and when a tie
     needs to be broken, the counting thread puts a request on the request 
     queue.  The main (GUI) thread asks the user to break the tie and puts the
     result on the response queue.
+
+    tieDecisions -- Decisions for strong ties when suspending, in the order the
+    ties arise: a list of [tied candidates, chosen candidate].  Set by resume().
   
     prec -- The number of digits of precision for certain methods (e.g., Meek,
     Gregory, and Weighted Inclusive).
@@ -91,6 +118,9 @@ class ElectionMethod(object):
 
     optionsMsg -- Stores test describing options used in the method for 
     reporting purposes.
+
+    profile -- A CountProfile timing the count, or None (the default) if the
+    count isn't timed.  Set by enableProfile().
   
   """
 
@@ -113,10 +143,13 @@ class ElectionMethod(object):
     self.strongTieBreakMethod = "random"
     self.breakTieRequestQueue = None   # overridden if manual tiebreaking
     self.breakTieResponseQueue = None  # overridden if manual tiebreaking
+    self.tieDecisions = []
+    self.tieDecisionsUsed = 0
     self.prec = 0
     self.p = 1
     self.guiOptions = []
     self.optionsMsg = ""
+    self.profile = None
     
     self.winners = set()
     self.losers = set()
@@ -127,12 +160,34 @@ class ElectionMethod(object):
     self.countBallots()
     self.postCount()
 
+  def enableProfile(self):
+    """Time the phases of the count (see openstv.profiling).  Call before
+    counting; the timings are in self.profile.data() afterwards."""
+
+    if self.profile is None:
+      self.profile = CountProfile(self)
+    return self.profile
+
+  def resume(self, checkpoint, c):
+    """Finish a count that was suspended at a strong tie (see TieBreakNeeded)
+    with candidate c chosen to break the tie.
+
+    The count runs again from the start on the same ballots, replaying the
+    decisions made so far, so the result is exactly that of a count that was
+    never suspended.  It may be suspended again at a later tie."""
+
+    assert(c in checkpoint["tied"])
+    self.strongTieBreakMethod = "suspend"
+    self.tieDecisions = checkpoint["decisions"] + [[checkpoint["tied"], c]]
+    self.runElection()
+
   def preCount(self):
 
     assert(self.strongTieBreakMethod in 
-           ["random", "alpha", "index", "manual"])
+           ["random", "alpha", "index", "manual", "suspend"])
     
     self.p = 10**self.prec     # Scale factor for computations
+    self.tieDecisionsUsed = 0
 
     # Check for sufficient candidates and ballots
     self.checkMinRequirements()
@@ -263,6 +318,21 @@ Need at least %d candidates but have only %d.""" % (
         desc = "Candidate %s was chosen by breaking the tie manually. "\
              % self.b.names[c]
 
+    # Use the decision made when the count was resumed, or suspend the count.
+    elif self.strongTieBreakMethod == "suspend":
+      tied = sorted(tiedCandidates)
+      if self.tieDecisionsUsed == len(self.tieDecisions):
+        checkpoint = {"decisions": [[list(t), d] for (t, d) in self.tieDecisions],
+                      "tied": tied, "what": what,
+                      "round": getattr(self, "R", 0)}
+        raise TieBreakNeeded(checkpoint, [self.b.names[c] for c in tied])
+      (decidedTie, c) = self.tieDecisions[self.tieDecisionsUsed]
+      if sorted(decidedTie) != tied:
+        raise RuntimeError("Tie decisions do not match this count.")
+      self.tieDecisionsUsed += 1
+      desc = "Candidate %s was chosen by breaking the tie manually. "\
+           % self.b.names[c]
+
     else:
       assert(0)
 
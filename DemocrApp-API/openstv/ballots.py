@@ -89,8 +89,9 @@ class Ballots(object):
     # corresponding to the unique ballot.
     
     self.uniqueBallotsLookup = {}
-    # The keys to this dictionary are string representations of unique
-    # ballots and the values are the indices into self.uniqueBallots.  This
+    # The keys to this dictionary are tuple representations of unique
+    # ballots (see ballotKey) and the values are the indices into
+    # self.uniqueBallots.  This
     # dictionary indicates whether a given ballot has already been seen, and
     # if so, where the ballot exists in self.uniqueBallots.
     
@@ -165,6 +166,12 @@ class Ballots(object):
       elif ranking > nc - 1:
         raise RuntimeError("Ballot has invalid data: %s" % str(ballot))
   
+  @staticmethod
+  def ballotKey(ballot):
+    "Hashable representation of a ballot for determining whether it is unique."
+    return tuple(tuple(ranking) if isinstance(ranking, list) else ranking
+                 for ranking in ballot)
+
   def appendBallot(self, ballot, ballotID=None):
     "Append a ballot to this Ballots object."
 
@@ -175,17 +182,16 @@ class Ballots(object):
     # ballot loader do the checking.
     #self.checkBallot(ballot)
     
-    # String representation of ballot for determining whether it is unique
-    ballotString = str(ballot)
+    key = self.ballotKey(ballot)
 
     # Record the ballot ID if there is one
     if ballotID is not None:
       self.ballotIDsList.append(ballotID)
 
     ballotIndex = len(self.ballotOrder) # Index of the ballot being added
-    if ballotString in self.uniqueBallotsLookup:
+    if key in self.uniqueBallotsLookup:
       # We have seen this ballot before 
-      uniqueBallotIndex = self.uniqueBallotsLookup[ballotString]
+      uniqueBallotIndex = self.uniqueBallotsLookup[key]
       self.uniqueBallotIndexToBallotIndices[uniqueBallotIndex].add(ballotIndex)
       self.uniqueBallotCount[uniqueBallotIndex] += 1
     else:
@@ -193,10 +199,47 @@ class Ballots(object):
       self.uniqueBallots.append(ballot)
       self.uniqueBallotCount.append(1)
       uniqueBallotIndex = len(self.uniqueBallots) - 1
-      self.uniqueBallotsLookup[ballotString] = uniqueBallotIndex
+      self.uniqueBallotsLookup[key] = uniqueBallotIndex
       self.uniqueBallotIndexToBallotIndices.append(set([ballotIndex]))
     self.ballotOrder.append(uniqueBallotIndex)
 
+  def appendBallots(self, ballots):
+    """Append an iterable of ballots, without ballot IDs, to this Ballots object.
+
+    This gives the same result as calling appendBallot on each ballot but is
+    much faster for large elections: ballots of plain candidate numbers are
+    looked up by tuple, and only ballots with equal rankings pay for
+    ballotKey.
+    """
+
+    assert(not self.customBallotIDs)
+
+    lookup = self.uniqueBallotsLookup
+    uniqueBallots = self.uniqueBallots
+    uniqueBallotCount = self.uniqueBallotCount
+    indices = self.uniqueBallotIndexToBallotIndices
+    ballotOrder = self.ballotOrder
+    ballotIndex = len(ballotOrder)
+    for ballot in ballots:
+      key = tuple(ballot)
+      try:
+        uniqueBallotIndex = lookup.get(key)
+      except TypeError:
+        # An equal ranking is a list, which can't be hashed
+        key = self.ballotKey(ballot)
+        uniqueBallotIndex = lookup.get(key)
+      if uniqueBallotIndex is None:
+        uniqueBallotIndex = len(uniqueBallots)
+        uniqueBallots.append(list(ballot))
+        uniqueBallotCount.append(1)
+        indices.append(set([ballotIndex]))
+        lookup[key] = uniqueBallotIndex
+      else:
+        indices[uniqueBallotIndex].add(ballotIndex)
+        uniqueBallotCount[uniqueBallotIndex] += 1
+      ballotOrder.append(uniqueBallotIndex)
+      ballotIndex += 1
+
   def appendBallotUsingNames(self, ballot, ballotID=None):
     "Append a ballot to this Ballots object."
     ballot2 = []
@@ -508,8 +551,7 @@ class Ballots(object):
     for i in range(self.numWeightedBallots):
       for j, c in enumerate(self.uniqueBallots[i]):
         self.uniqueBallots[i][j] = c2c[c]
-      ballotString = str(list(self.uniqueBallots[i]))
-      self.uniqueBallotsLookup[ballotString] = i
+      self.uniqueBallotsLookup[self.ballotKey(self.uniqueBallots[i])] = i
       
     # Put the names in the right order
     oldNames = self.names[:]
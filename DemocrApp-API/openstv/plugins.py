@@ -188,12 +188,19 @@ class ReportPlugin(object):
       self.dirtyB = self.cleanB
     self.outputFile = outputFile
     self.test = test
-    self.outputText = ""
+    self.outputParts = []
 
   def output(self, output):
-    """Stream output to destination file-like object."""
-    self.outputText += output
-    print(output, end=' ', file=self.outputFile)
+    """Collect output, and stream it to the destination file-like object if
+    there is one."""
+    self.outputParts.append(output)
+    if self.outputFile is not None:
+      self.outputFile.write(output)
+
+  def getOutputText(self):
+    return "".join(self.outputParts)
+
+  outputText = property(getOutputText)
     
   def generateReport(self):
     "Selector for major categories of methods."
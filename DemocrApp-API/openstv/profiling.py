@@ -0,0 +1,112 @@
+"""Per-phase timing of counts.
+
+A CountProfile attached to an election (ElectionMethod.enableProfile())
+times the phases of its count: preCount, countBallots and postCount, and
+within countBallots each call of the methods in ROUND_PHASES, by round.
+For STV methods it also notes how many ballots each transfer moved and how
+many ballots candidates held at the end of each round.
+
+The profile wraps the election's own methods on the instance, so an
+election without one runs exactly the code it always did.  data() returns
+the measurements as plain lists, dicts and numbers, e.g.
+
+  {"seconds": 0.0123,
+   "phases": {"preCount": 0.0001, "countBallots": 0.0119, ...},
+   "rounds": [{"round": 1, "action": "first", "seconds": {...},
+               "ballotsTouched": 0, "votesHeld": 1081}, ...],
+   "peakVotesHeld": 1081}
+
+Round numbers count from 1.  Phases don't nest, except that countBallots
+includes the round phases.
+"""
+
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+from time import perf_counter
+
+COUNT_PHASES = ["preCount", "countBallots", "postCount"]
+ROUND_PHASES = ["initialVoteTally", "transferSurplusVotes", "eliminateCandidates",
+                "updateCount", "describeRound", "updateCandidateStatus"]
+TRANSFERS = ["transferSurplusVotes", "eliminateCandidates"]
+
+##################################################################
+
+class CountProfile(object):
+  "Timings of one election's count."
+
+  def __init__(self, e):
+    self.e = e
+    self.phases = {}
+    self.rounds = {}
+    for name in COUNT_PHASES:
+      self.wrap(name, self.timeCount)
+    for name in ROUND_PHASES:
+      if hasattr(e, name):
+        self.wrap(name, self.timeRound)
+
+  def wrap(self, name, timer):
+    method = getattr(self.e, name)
+    setattr(self.e, name, lambda *args: timer(name, method, args))
+
+  def timeCount(self, name, method, args):
+    if name == "preCount":
+      # A resumed count starts again
+      self.phases = {}
+      self.rounds = {}
+    start = perf_counter()
+    try:
+      return method(*args)
+    finally:
+      self.phases[name] = self.phases.get(name, 0) + perf_counter() - start
+
+  def timeRound(self, name, method, args):
+    R = getattr(self.e, "R", 0)
+    held = self.votesHeld() if name in TRANSFERS else None
+    start = perf_counter()
+    result = method(*args)
+    seconds = perf_counter() - start
+    info = self.rounds.setdefault(R, {"seconds": {}, "ballotsTouched": 0})
+    info["seconds"][name] = info["seconds"].get(name, 0) + seconds
+    if held is not None:
+      # The candidates transferred from hold no ballots afterwards
+      for c in self.e.roundInfo[R]["action"][1]:
+        info["ballotsTouched"] += held[c]
+    if name == "updateCount":
+      info["votesHeld"] = self.votesHeld()
+    return result
+
+  def votesHeld(self):
+    "Ballots held by each candidate, for methods that keep them per candidate."
+    votes = getattr(self.e, "votes", None)
+    if not isinstance(votes, list):
+      return None
+    return [len(v) for v in votes]
+
+  def data(self):
+    "The measurements so far, as plain data."
+    roundInfo = getattr(self.e, "roundInfo", [])
+    rounds = []
+    for R in sorted(self.rounds):
+      info = self.rounds[R]
+      held = info.get("votesHeld")
+      action = roundInfo[R].get("action") if R < len(roundInfo) else None
+      rounds.append({
+        "round": R + 1,
+        "action": action[0] if action else None,
+        "seconds": info["seconds"],
+        "ballotsTouched": info["ballotsTouched"],
+        "votesHeld": sum(held) if held is not None else None,
+        })
+    held = [r["votesHeld"] for r in rounds if r["votesHeld"] is not None]
+    return {"seconds": sum(self.phases.values()),
+            "phases": dict(self.phases),
+            "rounds": rounds,
+            "peakVotesHeld": max(held) if held else None}
@@ -0,0 +1,119 @@
+"""Records of finished elections, for rendering reports later.
+
+recordElection() reduces a counted election to the plain data its reports
+read: the candidates, the rounds and what happened in each, the winners and
+losers, and the method's options.  The record is lists, dicts, strings and
+numbers, so it can be stored as JSON and is much smaller than a report.
+
+ElectionRecord turns a record back into an object any report plugin can
+take in place of the election, so a report can be rendered when it is first
+wanted rather than when the count finishes:
+
+  r = HtmlReport(ElectionRecord(data))
+  r.generateReport()
+
+Condorcet elections, and methods with their own way of displaying values
+(QPQ), can't be recorded.
+"""
+
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+from openstv.ballots import Ballots
+from openstv.STV import ElectionMethod
+
+# Election attributes that reports read, recorded where the method has them
+ATTRIBUTES = ["methodName", "longMethodName", "iterative", "title", "date",
+              "numSeats", "prec", "p", "threshMethod", "optionsMsg", "msg",
+              "numRounds", "count", "exhausted", "surplus", "thresh", "quota",
+              "roundInfo", "winners", "losers", "wonAtRound", "lostAtRound",
+              "stages", "numStages"]
+
+##################################################################
+
+def plain(value):
+  "Convert sets and tuples, however nested, to lists."
+
+  if isinstance(value, (set, frozenset)):
+    return sorted(plain(x) for x in value)
+  if isinstance(value, (list, tuple)):
+    return [plain(x) for x in value]
+  if isinstance(value, dict):
+    return dict((k, plain(v)) for (k, v) in value.items())
+  return value
+
+def recordBallots(b):
+  return {"names": list(b.names),
+          "numBallots": b.numBallots,
+          "withdrawn": sorted(b.withdrawn),
+          "fileName": b.getFileName()}
+
+def recordElection(e):
+  "Return the record of a counted election."
+
+  if e.methodName == "Condorcet":
+    raise RuntimeError("Condorcet elections can't be recorded.")
+  if type(e).displayValue is not ElectionMethod.displayValue:
+    raise RuntimeError("%s elections can't be recorded." % e.methodName)
+
+  data = {"election": {}, "ballots": recordBallots(e.b)}
+  for name in ATTRIBUTES:
+    if hasattr(e, name):
+      data["election"][name] = plain(getattr(e, name))
+  if e.b.dirtyBallots is not None:
+    data["dirtyBallots"] = recordBallots(e.b.dirtyBallots)
+  return data
+
+##################################################################
+
+class RecordedBallots(object):
+  "The parts of a Ballots object that reports read."
+
+  def __init__(self, data, dirtyBallots=None):
+    self.names = data["names"]
+    self.numBallots = data["numBallots"]
+    self.withdrawn = data["withdrawn"]
+    self.fileName = data["fileName"]
+    self.dirtyBallots = dirtyBallots
+
+  def getNumCandidates(self):
+    return len(self.names)
+
+  numCandidates = property(getNumCandidates)
+
+  def getFileName(self):
+    return self.fileName
+
+  joinList = Ballots.joinList
+
+##################################################################
+
+class ElectionRecord(object):
+  "A recorded election, standing in for the election in reports."
+
+  def __init__(self, data):
+    self.data = data
+    dirtyBallots = None
+    if "dirtyBallots" in data:
+      dirtyBallots = RecordedBallots(data["dirtyBallots"])
+    self.b = RecordedBallots(data["ballots"], dirtyBallots)
+    for (name, value) in data["election"].items():
+      setattr(self, name, value)
+    self.winners = set(self.winners)
+    self.losers = set(self.losers)
+
+  displayValue = ElectionMethod.displayValue
+
+  def roundToStage(self, r):
+    "Return the stage corresponding to a given round."
+    for s in range(len(self.stages)):
+      if r in self.stages[s]:
+        return s
+    assert(0)
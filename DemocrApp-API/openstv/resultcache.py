@@ -0,0 +1,155 @@
+"""Memoised election results.
+
+A count is decided entirely by its input: the ballots, the candidate names,
+the number of seats, any withdrawn candidates, the method and the method's
+options (plus the title, which reports show).  fingerprint() hashes that input canonically, so a ResultCache can
+hand back the results of an earlier count instead of counting again.
+
+Ballots are hashed as sorted (ballot, weight) pairs, so the order they were
+cast in doesn't matter, except for methods whose outcome depends on it
+(OrderDependentSTV), where the ballots are hashed in order.
+
+Entries never expire.  A count with random or manual strong tie breaks has
+more than one possible outcome, and the cache keeps whichever came first, so
+call invalidate() to count such an election again.
+
+Where results are kept is up to the store: any object with get(key),
+set(key, value), delete(key) and clear() will do.  MemoryStore keeps them for
+the life of the process and DirectoryStore as JSON files.  Results must be
+JSON-serializable for DirectoryStore.
+"""
+
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+
+import hashlib
+import json
+import os
+
+from openstv.STV import OrderDependentSTV
+
+##################################################################
+
+def fingerprint(ballots, method, **options):
+  """Return a hex digest identifying an election's input.
+
+  ballots is the Ballots object to be counted, method the method plugin
+  class, and options the attributes that will be set on the method
+  instance before counting (e.g., strongTieBreakMethod="index").
+  """
+
+  if issubclass(method, OrderDependentSTV):
+    weighted = [[ballot, 1] for ballot, ballotID in ballots.getBallotsAndIDs()]
+  else:
+    weighted = sorted([json.dumps(ballots.uniqueBallots[i]),
+                       ballots.uniqueBallotCount[i]]
+                      for i in range(ballots.numWeightedBallots))
+  election = {
+    "ballots": weighted,
+    "names": ballots.names,
+    "title": ballots.title,
+    "seats": ballots.numSeats,
+    "withdrawn": sorted(ballots.withdrawn),
+    "method": method.methodName,
+    "options": options,
+    }
+  canonical = json.dumps(election, sort_keys=True, separators=(",", ":"))
+  return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+##################################################################
+
+class MemoryStore(object):
+  "Keeps results in a dictionary."
+
+  def __init__(self):
+    self.results = {}
+
+  def get(self, key):
+    return self.results.get(key)
+
+  def set(self, key, value):
+    self.results[key] = value
+
+  def delete(self, key):
+    self.results.pop(key, None)
+
+  def clear(self):
+    self.results.clear()
+
+##################################################################
+
+class DirectoryStore(object):
+  "Keeps results as one JSON file per election in a directory."
+
+  def __init__(self, path):
+    self.path = path
+    if not os.path.isdir(path):
+      os.makedirs(path)
+
+  def fileName(self, key):
+    return os.path.join(self.path, key + ".json")
+
+  def get(self, key):
+    try:
+      with open(self.fileName(key)) as f:
+        return json.load(f)
+    except (IOError, ValueError):
+      return None
+
+  def set(self, key, value):
+    # Write then rename so a reader never sees half a file
+    tmp = self.fileName(key) + ".tmp"
+    with open(tmp, "w") as f:
+      json.dump(value, f)
+    os.replace(tmp, self.fileName(key))
+
+  def delete(self, key):
+    try:
+      os.remove(self.fileName(key))
+    except OSError:
+      pass
+
+  def clear(self):
+    for fName in os.listdir(self.path):
+      if fName.endswith(".json"):
+        os.remove(os.path.join(self.path, fName))
+
+##################################################################
+
+class ResultCache(object):
+  """Results of counts, keyed by fingerprint()."""
+
+  def __init__(self, store=None):
+    if store is None:
+      store = MemoryStore()
+    self.store = store
+
+  def get(self, key):
+    "Return the stored results for the election, or None."
+    return self.store.get(key)
+
+  def put(self, key, results):
+    self.store.set(key, results)
+
+  def invalidate(self, key=None):
+    "Forget the results for one election, or for every election."
+    if key is None:
+      self.store.clear()
+    else:
+      self.store.delete(key)
+
+  def fetch(self, key, count):
+    """Return the stored results for the election, calling count() for them
+    and storing what it returns if there are none."""
+    results = self.get(key)
+    if results is None:
+      results = count()
+      self.put(key, results)
+    return results
@@ -10,6 +10,7 @@ import getopt
 
 from openstv.ballots import Ballots
 from openstv.plugins import getMethodPlugins, getReportPlugins
+from openstv.resultcache import ResultCache, DirectoryStore, fingerprint
 
 methods = getMethodPlugins("byName", exclude0=False)
 methodNames = list(methods.keys())
@@ -23,13 +24,15 @@ usage = """
 Usage:
 
   runElection.py [-p prec] [-r report] [-t tiebreak] [-w weaktie] [-s seats] 
-                 [-P] [-x reps] method ballotfile
+                 [-c cachedir] [-C] [-P] [-x reps] method ballotfile
 
   -p: override default precision (in digits)
   -r: report format: %s
   -t: strong tie-break method: random*, alpha, index
   -w: weak tie-break method: (method-default)*, strong, forward, backward 
   -s: number of seats (for text-format ballot files)
+  -c: reuse the report of an identical earlier election stored in cachedir
+  -C: count again even if cachedir has a report for this election
   -P: profile and send output to profile.out
   -x: specify repeat count (for profiling)
     *default
@@ -42,7 +45,7 @@ Usage:
 
 # Parse the command line.
 try:
-  (opts, args) = getopt.getopt(sys.argv[1:], "Pp:r:s:t:w:x:")
+  (opts, args) = getopt.getopt(sys.argv[1:], "CPc:p:r:s:t:w:x:")
 except getopt.GetoptError as err:
   print(str(err)) # will print something like "option -a not recognized"
   print(usage)
@@ -55,6 +58,8 @@ strongTieBreakMethod = None
 weakTieBreakMethod = None
 numSeats = None
 prec = None
+cacheDir = None
+recount = False
 for o, a in opts:
   if o == "-r":
     if a in reportNames:
@@ -88,6 +93,10 @@ for o, a in opts:
     profilefile = "profile.out"
   if o == "-x":
     reps = int(a)
+  if o == "-c":
+    cacheDir = a
+  if o == "-C":
+    recount = True
 
 if len(args) != 2:
   if len(args) < 2:
@@ -128,13 +137,30 @@ def doElection(reps=1):
     e.runElection()
   return e
 
+# Profiling needs the election to actually run
+cache = None
+if cacheDir is not None and not profile:
+  cache = ResultCache(DirectoryStore(cacheDir))
+  key = fingerprint(cleanBallots, methods[name], report=reportformat,
+                    ballotFile=os.path.basename(bltFn),
+                    strongTieBreakMethod=strongTieBreakMethod,
+                    weakTieBreakMethod=weakTieBreakMethod, prec=prec)
+  if recount:
+    cache.invalidate(key)
+  cached = cache.get(key)
+  if cached is not None:
+    sys.stdout.write(cached["report"])
+    sys.exit(0)
+
 if profile:
   cProfile.run('e = doElection(reps)', profilefile)
 else:
   e = doElection()
 
-r = reports[reportformat](e)
+r = reports[reportformat](e, outputFile=sys.stdout)
 r.generateReport()
+if cache is not None:
+  cache.put(key, {"report": r.outputText})
 
 if profile:
   p = pstats.Stats(profilefile)
@@ -113,11 +113,12 @@ import time
 import random
 from types import *
 
-from . import STV
+from . import ballots
 
 NOTA = 1
 noNOTA = 0
-eps = STV.eps
+# Tolerance on probability sums; STV.py no longer defines one to share
+eps = 1e-10
 
 ##################################################################
 
@@ -770,7 +771,7 @@ class Bigrams:
 
 ##################################################################
 
-class Ballots(STV.Ballots):
+class Ballots(ballots.Ballots):
   """Class for working with ballot data.
 
   fName      -- File name where the ballot data is stored.
@@ -75,15 +75,56 @@ TEMPLATES = [
 WSGI_APPLICATION = 'democrapp_api.wsgi.application'
 ASGI_APPLICATION = "democrapp_api.routing.application"
 
+# Both layers are wrapped to record sends, drops and group_send latency; see
+# Meeting/channel_metrics.py and /api/metrics/channels.
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "BACKEND": "Meeting.channel_metrics.InstrumentedChannelLayer",
         "CONFIG": {
-            "hosts": [("redis", 6379)],
+            "backend": "channels_redis.core.RedisChannelLayer",
+            "config": {
+                "hosts": [("redis", 6379)],
+            },
+        },
+    },
+    # Vote closing, announcements, boots and token revocation. Kept apart from the
+    # default layer so they are read first and never dropped behind ballot traffic.
+    "control": {
+        "BACKEND": "Meeting.channel_metrics.InstrumentedChannelLayer",
+        "CONFIG": {
+            "backend": "channels_redis.core.RedisChannelLayer",
+            "config": {
+                "hosts": [("redis", 6379)],
+                "prefix": "asgi_control",
+            },
         },
     },
 }
 
+# Seconds a vote close waits for in-flight ballot submissions to commit
+VOTE_CLOSE_DRAIN_TIMEOUT = 5
+
+# Counts that can run at once on the vote count pool (Meeting.counting). 0 counts in the
+# calling thread instead.
+VOTE_COUNT_WORKERS = 4
+
+# Seconds after its count was queued that a vote still counting is taken to have lost
+# its count (its worker was restarted) and may be queued again; see Vote.requeue_count()
+VOTE_COUNT_TIMEOUT = 900
+
+# Seconds between provisional recounts of a LIVE STV vote that is receiving ballots, shown
+# to chairs on the manage page only (Meeting.provisional). 0 turns provisional results off.
+PROVISIONAL_STV_INTERVAL = 0
+
+# Time the phases of each STV count and keep the timings in the vote's results_data["profile"]
+PROFILE_STV_COUNTS = False
+
+# Days after closing before archive_meetings snapshots a meeting and deletes its ballots and tokens
+MEETING_ARCHIVE_AGE_DAYS = 365
+
+# Hours a voter session can sit without a websocket before it expires; purge_sessions deletes them
+VOTER_SESSION_EXPIRY_HOURS = 12
+
 # Database
 # https://docs.djangoproject.com/en/2.0/ref/settings/#databases
 
@@ -98,6 +139,20 @@ DATABASES = {
     }
 }
 
+# Read replica for reports and exports (Meeting/db_router.py). Without
+# DATABASE_REPLICA_HOST reports read from the primary; tests use a second local
+# database as the replica.
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'HOST': os.getenv('DATABASE_REPLICA_HOST', DATABASES['default']['HOST']),
+    'PORT': os.getenv('DATABASE_REPLICA_PORT', DATABASES['default']['PORT']),
+    'TEST': {'NAME': 'test_{}_replica'.format(os.getenv('DATABASE_NAME'))},
+}
+DATABASE_ROUTERS = ['Meeting.db_router.ReportRouter']
+REPORT_DATABASE = 'replica' if os.getenv('DATABASE_REPLICA_HOST') else 'default'
+# Seconds after a vote or meeting closes during which reports still read the primary
+REPLICA_CONSISTENCY_WINDOW = 30
+
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
 